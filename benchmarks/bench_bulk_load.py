@@ -0,0 +1,92 @@
+# Compare the executemany insert path with the COPY bulk loader
+# run from the repository root: python -m benchmarks.bench_bulk_load --rows 10000 100000
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+import db
+from bulk_load import copy_frame
+
+bench_order_item_table = """
+CREATE TEMP TABLE bench_order_item(
+    id SERIAL PRIMARY KEY,
+    order_item_id VARCHAR NOT NULL,
+    order_id INT,
+    product_id INT,
+    seller_id INT,
+    pickup_limit_date INT,
+    price DECIMAL(18,6),
+    shipping_cost DECIMAL(18,6)
+)
+"""
+
+bench_order_item_insert = """
+INSERT INTO bench_order_item(
+    order_item_id,
+    order_id,
+    product_id,
+    seller_id,
+    pickup_limit_date,
+    price,
+    shipping_cost
+) VALUES (%s, %s, %s, %s, %s, %s, %s)
+"""
+
+
+# The row-by-row baseline COPY replaced
+def insert_rows(cur, df):
+    cur.executemany(bench_order_item_insert, df.itertuples(index=False, name=None))
+
+
+def make_order_items(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame(
+        {
+            "order_item_id": rng.integers(1, 10, rows).astype(str),
+            "order_id": rng.integers(1, rows, rows),
+            "product_id": rng.integers(1, 30_000, rows),
+            "seller_id": rng.integers(1, 3_000, rows),
+            "pickup_limit_date": rng.integers(1, 100_000, rows),
+            "price": rng.uniform(1, 500, rows).round(2),
+            "shipping_cost": rng.uniform(0, 50, rows).round(2),
+        }
+    )
+
+
+def time_load(cur, load):
+    cur.execute("TRUNCATE bench_order_item")
+    start = time.perf_counter()
+    load()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    args = parser.parse_args()
+
+    conn = db.connect()
+    conn.set_session(autocommit=True)
+    cur = conn.cursor()
+    cur.execute(bench_order_item_table)
+
+    print(f"{'rows':>10} {'executemany s':>14} {'copy s':>10} {'speedup':>8}")
+    for rows in args.rows:
+        df = make_order_items(rows)
+        executemany_time = time_load(
+            cur,
+            lambda: insert_rows(cur, df),
+        )
+        copy_time = time_load(cur, lambda: copy_frame(cur, "bench_order_item", df))
+        print(
+            f"{rows:>10} {executemany_time:>14.2f} {copy_time:>10.2f} "
+            f"{executemany_time / copy_time:>7.1f}x"
+        )
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# Runs the same full load with the fact stages split across 1, 2, 4 and 8
+# processes and compares their wall time and throughput. A first run fills
+# the staging cache, so every measured run reads the same cleaned frames.
+# DB_NAME is dropped and recreated, so point it at a scratch database.
+# run from the repository root:
+# python -m benchmarks.bench_fact_shards --scale 1 --chunk-size 50000
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+from etl import FACT_STAGES
+from generate_dataset import generate
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_etl(work_dir, dataset_dir, db_name, chunk_size, shards):
+    subprocess.run(
+        [
+            sys.executable,
+            os.path.join(REPO_DIR, "run.py"),
+            "--chunk-size",
+            str(chunk_size),
+            "--fact-shards",
+            str(shards),
+        ],
+        cwd=work_dir,
+        env={**os.environ, "DATASET_DIR": dataset_dir, "DB_NAME": db_name},
+        check=True,
+    )
+    with open(os.path.join(work_dir, "pipeline_metrics.jsonl")) as f:
+        report = json.loads(f.readlines()[-1])
+    stages = pd.DataFrame(report["stages"]).set_index("stage")
+    return stages.loc[list(FACT_STAGES), ["wall_seconds", "rows_written"]]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=0.5)
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--db-name", default="ecommerce_bench")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        dataset_dir = os.path.join(work_dir, "ecommerce_dataset")
+        generate(dataset_dir, args.scale, args.seed)
+        run_etl(work_dir, dataset_dir, args.db_name, args.chunk_size, 1)
+        runs = {shards: [] for shards in args.shards}
+        for _ in range(args.repeat):
+            for shards in runs:
+                runs[shards].append(
+                    run_etl(
+                        work_dir, dataset_dir, args.db_name, args.chunk_size, shards
+                    )
+                )
+
+    # The best of the repeated runs of each shard count
+    walls = pd.DataFrame(
+        {
+            shards: pd.concat([run["wall_seconds"] for run in stages], axis=1).min(
+                axis=1
+            )
+            for shards, stages in runs.items()
+        }
+    )
+    walls.loc["total"] = walls.sum()
+    rows = runs[args.shards[0]][0]["rows_written"]
+    rows.loc["total"] = rows.sum()
+
+    print("wall_seconds")
+    print(walls.round(3).to_string())
+    print("\nrows_per_second")
+    print(walls.rdiv(rows, axis=0).round(0).to_string())
+    print(f"\nspeedup over {args.shards[0]} shard(s)")
+    print(walls.rdiv(walls[args.shards[0]], axis=0).round(2).to_string())
+
+
+if __name__ == "__main__":
+    main()
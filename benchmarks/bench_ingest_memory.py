@@ -0,0 +1,53 @@
+# Memory held by every source frame, column by column, read the way
+# pd.read_csv infers it and with the dtypes of schemas.py. Reads the files of
+# DATASET_DIR, or of a dataset generated at --scale with --generate.
+# run from the repository root:
+# python -m benchmarks.bench_ingest_memory [--generate --scale 1]
+import argparse
+import os
+import tempfile
+
+import pandas as pd
+
+import schemas
+from generate_dataset import generate
+from settings import DATASET_DIR
+
+
+def source_memory(dataset_dir, source):
+    path = os.path.join(dataset_dir, f"{source}_dataset.csv")
+    untyped = schemas.memory_report(pd.read_csv(path))
+    typed = schemas.memory_report(pd.read_csv(path, **schemas.read_options(source)))
+    report = pd.DataFrame({"untyped_mb": untyped, "typed_mb": typed}) / 2**20
+    report.loc["total"] = report.sum()
+    report["ratio"] = (report["untyped_mb"] / report["typed_mb"]).round(2)
+    return report
+
+
+def report(dataset_dir):
+    return pd.concat(
+        {
+            source: source_memory(dataset_dir, source)
+            for source in schemas.SOURCE_SCHEMAS
+        }
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--generate", action="store_true")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.generate:
+        with tempfile.TemporaryDirectory() as dataset_dir:
+            generate(dataset_dir, args.scale, args.seed)
+            results = report(dataset_dir)
+    else:
+        results = report(DATASET_DIR)
+    print(results.round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
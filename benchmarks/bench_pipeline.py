@@ -0,0 +1,71 @@
+# Runs the same full load with stages executed sequentially and pipelined
+# (reader, transform and writer threads) and compares the per-stage wall time.
+# Both runs parse the CSV files, the staging cache is disabled. DB_NAME is
+# dropped and recreated, so point it at a scratch database.
+# run from the repository root:
+# python -m benchmarks.bench_pipeline --scale 0.5 --chunk-size 20000
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+from generate_dataset import generate
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_etl(work_dir, dataset_dir, db_name, chunk_size, pipelined):
+    etl_args = ["--chunk-size", str(chunk_size), "--no-staging-cache"]
+    if pipelined:
+        etl_args.append("--pipelined")
+    subprocess.run(
+        [sys.executable, os.path.join(REPO_DIR, "run.py"), *etl_args],
+        cwd=work_dir,
+        env={**os.environ, "DATASET_DIR": dataset_dir, "DB_NAME": db_name},
+        check=True,
+    )
+    with open(os.path.join(work_dir, "pipeline_metrics.jsonl")) as f:
+        report = json.loads(f.readlines()[-1])
+    return pd.DataFrame(report["stages"]).set_index("stage")["wall_seconds"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=0.5)
+    parser.add_argument("--chunk-size", type=int, default=20_000)
+    parser.add_argument("--db-name", default="ecommerce_bench")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        dataset_dir = os.path.join(work_dir, "ecommerce_dataset")
+        generate(dataset_dir, args.scale, args.seed)
+        runs = {"sequential": [], "pipelined": []}
+        for _ in range(args.repeat):
+            for mode in runs:
+                runs[mode].append(
+                    run_etl(
+                        work_dir,
+                        dataset_dir,
+                        args.db_name,
+                        args.chunk_size,
+                        mode == "pipelined",
+                    )
+                )
+
+    # The best of the repeated runs of each mode
+    results = pd.DataFrame(
+        {mode: pd.concat(walls, axis=1).min(axis=1) for mode, walls in runs.items()}
+    )
+    results.loc["total"] = results.sum()
+    results["speedup"] = (results["sequential"] / results["pipelined"]).round(2)
+    print(results.to_string())
+
+
+if __name__ == "__main__":
+    main()
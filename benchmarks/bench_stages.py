@@ -0,0 +1,64 @@
+# Runs the whole ETL against generated datasets of increasing size and
+# collects the per-stage time, throughput and memory from each run report.
+# Every scale runs in its own process on a fresh database, DB_NAME is
+# dropped and recreated, so point it at a scratch database.
+# run from the repository root:
+# python -m benchmarks.bench_stages --scales 0.1 0.5 1 --etl-args="--workers 4"
+import argparse
+import json
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+
+import pandas as pd
+
+from generate_dataset import generate
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_scale(scale, db_name, etl_args, seed):
+    with tempfile.TemporaryDirectory() as work_dir:
+        dataset_dir = os.path.join(work_dir, "ecommerce_dataset")
+        generate(dataset_dir, scale, seed)
+        subprocess.run(
+            [sys.executable, os.path.join(REPO_DIR, "run.py"), *etl_args],
+            cwd=work_dir,
+            env={**os.environ, "DATASET_DIR": dataset_dir, "DB_NAME": db_name},
+            check=True,
+        )
+        with open(os.path.join(work_dir, "pipeline_metrics.jsonl")) as f:
+            report = json.loads(f.readlines()[-1])
+
+    stages = pd.DataFrame(report["stages"])
+    stages.insert(0, "scale", scale)
+    return stages
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scales", type=float, nargs="+", default=[0.1, 0.25, 0.5])
+    parser.add_argument("--db-name", default="ecommerce_bench")
+    parser.add_argument("--etl-args", default="", help="extra arguments for run.py")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_stages.csv")
+    args = parser.parse_args()
+
+    results = pd.concat(
+        [
+            run_scale(scale, args.db_name, shlex.split(args.etl_args), args.seed)
+            for scale in args.scales
+        ],
+        ignore_index=True,
+    )
+    results.to_csv(args.output, index=False)
+
+    for column in ["wall_seconds", "rows_per_second", "peak_rss_mb"]:
+        print(f"\n{column}")
+        print(results.pivot(index="stage", columns="scale", values=column).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# Peak RSS of the order_item extract/transform/serialize path at 1x and 10x
+# input, with and without chunking. No database is needed, the COPY buffer is
+# built and then discarded.
+# run from the repository root: python -m benchmarks.bench_streaming_memory
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class DiscardCursor:
+    def copy_expert(self, query, buffer):
+        buffer.read()
+
+
+def write_order_items(path, rows, batch_rows=100_000, seed=0):
+    rng = np.random.default_rng(seed)
+    for start in range(0, rows, batch_rows):
+        size = min(batch_rows, rows - start)
+        pd.DataFrame(
+            {
+                "order_id": [f"order{i}" for i in rng.integers(0, rows, size)],
+                "order_item_id": rng.integers(1, 5, size),
+                "product_id": [f"product{i}" for i in rng.integers(0, 30_000, size)],
+                "seller_id": [f"seller{i}" for i in rng.integers(0, 3_000, size)],
+                "pickup_limit_date": pd.Timestamp("2017-01-01")
+                + pd.to_timedelta(rng.integers(0, 10**8, size), unit="s"),
+                "price": rng.uniform(1, 500, size).round(2),
+                "shipping_cost": rng.uniform(0, 50, size).round(2),
+            }
+        ).to_csv(path, mode="a", header=start == 0, index=False)
+
+
+def measure(chunk_size):
+    from bulk_load import copy_frame
+    from etl import read_source, transform_order_item
+    from schemas import read_options
+
+    for chunk in read_source("order_item", chunk_size, **read_options("order_item")):
+        copy_frame(DiscardCursor(), "fact_order_item", transform_order_item(chunk))
+    print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def peak_rss_mb(dataset_dir, chunk_size):
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-m",
+            "benchmarks.bench_streaming_memory",
+            "--measure",
+            str(chunk_size or 0),
+        ],
+        cwd=REPO_DIR,
+        env={**os.environ, "DATASET_DIR": dataset_dir},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return int(result.stdout.split()[-1]) / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--chunk-size", type=int, default=50_000)
+    parser.add_argument("--measure", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure is not None:
+        measure(args.measure or None)
+        return
+
+    print(f"{'scale':>6} {'rows':>10} {'full read MB':>13} {'chunked MB':>11}")
+    with tempfile.TemporaryDirectory() as dataset_dir:
+        for scale in (1, 10):
+            path = os.path.join(dataset_dir, "order_item_dataset.csv")
+            if os.path.exists(path):
+                os.remove(path)
+            write_order_items(path, args.rows * scale)
+            print(
+                f"{scale:>5}x {args.rows * scale:>10} "
+                f"{peak_rss_mb(dataset_dir, None):>13.0f} "
+                f"{peak_rss_mb(dataset_dir, args.chunk_size):>11.0f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Loads the same generated dataset into PostgreSQL and into the DuckDB file,
+# then times analytical queries that scan the facts on both. The queries join
+# the facts directly instead of reading the summary tables. DB_NAME is dropped
+# and recreated, so point it at a scratch database. Both loads parse the CSV
+# files, the staging cache is disabled.
+# run from the repository root:
+# python -m benchmarks.bench_targets --scale 1 --repeat 5
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import duckdb
+import pandas as pd
+
+import db
+from generate_dataset import generate
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUERIES = {
+    "orders_by_season": """
+        SELECT date_season, COUNT(DISTINCT fact_order_item.order_id)
+        FROM fact_order_item
+        JOIN dim_order ON fact_order_item.order_id = dim_order.id
+        JOIN dim_date ON dim_date.id = dim_order.order_date
+        GROUP BY date_season
+    """,
+    "orders_by_hour": """
+        SELECT date_hour, date_am_or_pm, COUNT(DISTINCT fact_order_item.order_id)
+        FROM fact_order_item
+        JOIN dim_order ON fact_order_item.order_id = dim_order.id
+        JOIN dim_date ON dim_date.id = dim_order.order_date
+        GROUP BY date_hour, date_am_or_pm
+    """,
+    "orders_by_customer_state": """
+        SELECT customer_state, COUNT(DISTINCT fact_order_item.order_id)
+        FROM fact_order_item
+        JOIN dim_order ON fact_order_item.order_id = dim_order.id
+        JOIN dim_customer ON dim_order.customer_id = dim_customer.id
+        GROUP BY customer_state
+    """,
+    "revenue_by_month_and_category": """
+        SELECT order_month, product_category_name, SUM(price), AVG(shipping_cost)
+        FROM fact_order_item
+        JOIN dim_product ON dim_product.id = fact_order_item.product_id
+        GROUP BY order_month, product_category_name
+    """,
+    "payment_value_by_type": """
+        SELECT payment_type, COUNT(*), SUM(payment_value)
+        FROM fact_payment
+        GROUP BY payment_type
+    """,
+}
+
+
+def load(work_dir, dataset_dir, db_name, duckdb_path, target):
+    start = time.perf_counter()
+    subprocess.run(
+        [
+            sys.executable,
+            os.path.join(REPO_DIR, "run.py"),
+            "--target",
+            target,
+            "--no-staging-cache",
+        ],
+        cwd=work_dir,
+        env={
+            **os.environ,
+            "DATASET_DIR": dataset_dir,
+            "DB_NAME": db_name,
+            "DUCKDB_PATH": duckdb_path,
+        },
+        check=True,
+    )
+    return time.perf_counter() - start
+
+
+# The best of `repeat` runs of every query, in seconds
+def time_queries(cur, repeat):
+    seconds = {}
+    for name, query in QUERIES.items():
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            cur.execute(query)
+            cur.fetchall()
+            runs.append(time.perf_counter() - start)
+        seconds[name] = min(runs)
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--db-name", default="ecommerce_bench")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        dataset_dir = os.path.join(work_dir, "ecommerce_dataset")
+        duckdb_path = os.path.join(work_dir, "ecommerce.duckdb")
+        generate(dataset_dir, args.scale, args.seed)
+        load_seconds = {
+            target: load(work_dir, dataset_dir, args.db_name, duckdb_path, target)
+            for target in ["postgres", "duckdb"]
+        }
+
+        conn = db.connect(db.dsn(args.db_name))
+        postgres = time_queries(conn.cursor(), args.repeat)
+        conn.close()
+        con = duckdb.connect(duckdb_path, read_only=True)
+        duckdb_seconds = time_queries(con, args.repeat)
+        con.close()
+
+    results = pd.DataFrame({"postgres": postgres, "duckdb": duckdb_seconds})
+    results.loc["total"] = results.sum()
+    results.loc["load"] = pd.Series(load_seconds)
+    results["speedup"] = (results["postgres"] / results["duckdb"]).round(2)
+    print(results.round(4).to_string())
+
+
+if __name__ == "__main__":
+    main()
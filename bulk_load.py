@@ -0,0 +1,78 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+from sketches import hash_rows
+
+# Written for missing values, like in PostgreSQL's text format. An unquoted
+# empty field would be read as NULL too, empty strings stay empty strings.
+# The one string that cannot be copied is a value of exactly \N.
+COPY_NULL = r"\N"
+
+
+def copy_frame(cur, table, df):
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False, header=False, na_rep=COPY_NULL)
+    buffer.seek(0)
+    columns = ", ".join(df.columns)
+    cur.copy_expert(
+        f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+        buffer,
+    )
+
+
+# Load through a temp table so merge_query can apply the ON CONFLICT rules,
+# duplicated keys are collapsed first like the row by row upsert did. Returns
+# the number of rows that were already loaded and are overwritten.
+def upsert_frame(cur, table, df, key, merge_query):
+    staging_table = f"staging_{table}"
+    columns = ", ".join(df.columns)
+    cur.execute(f"DROP TABLE IF EXISTS {staging_table}")
+    cur.execute(
+        f"CREATE TEMP TABLE {staging_table} AS "
+        f"SELECT {columns} FROM {table} WITH NO DATA"
+    )
+    copy_frame(cur, staging_table, df.drop_duplicates(subset=key, keep="last"))
+    keys = [key] if isinstance(key, str) else key
+    cur.execute(
+        f"SELECT count(*) FROM {staging_table} s WHERE EXISTS "
+        f"(SELECT 1 FROM {table} t WHERE "
+        + " AND ".join(f"t.{column} = s.{column}" for column in keys)
+        + ")"
+    )
+    existing = cur.fetchone()[0]
+    cur.execute(merge_query)
+    cur.execute(f"DROP TABLE {staging_table}")
+    return existing
+
+
+# Writes only the rows of `df` that are new or whose attributes changed since
+# they were loaded. The hash of every row's attributes is stored with it in
+# attribute_hash, `select_hashes` fetches the stored hashes of the keys in
+# `df` so both are compared in bulk. New rows are copied, changed rows are
+# merged with merge_query. Returns the (inserted, updated, unchanged) counts.
+def diff_upsert_frame(cur, table, df, key, merge_query, select_hashes):
+    df = df.drop_duplicates(subset=key, keep="last")
+    df = df.assign(attribute_hash=hash_rows(df.drop(columns=key)).view("int64"))
+    cur.execute(select_hashes, (list(df[key]),))
+    stored = cur.fetchall()
+
+    position = pd.Index([row[0] for row in stored]).get_indexer(df[key])
+    new = position == -1
+    changed = np.zeros(len(df), dtype=bool)
+    # Rows loaded without a hash count as changed. The hashes go straight from
+    # the Python ints to Int64, through float64 a missing one would round them.
+    stored_hashes = pd.array([row[1] for row in stored], dtype="Int64")
+    changed[~new] = (
+        (stored_hashes[position[~new]] != df["attribute_hash"].to_numpy()[~new])
+        .fillna(True)
+        .to_numpy(dtype=bool)
+    )
+
+    if new.any():
+        copy_frame(cur, table, df[new])
+    if changed.any():
+        upsert_frame(cur, table, df[changed], key, merge_query)
+    inserted, updated = int(new.sum()), int(changed.sum())
+    return inserted, updated, len(df) - inserted - updated
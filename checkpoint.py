@@ -0,0 +1,79 @@
+import json
+import logging
+
+from quires import (
+    delete_checkpoints,
+    etl_checkpoint_upsert,
+    etl_run_state_upsert,
+    select_checkpoints,
+    select_run_state,
+    update_run_state_dropped_indexes,
+    update_run_state_finished,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Forgets the progress of the previous run and records the options of a new
+# one, so that --resume can continue it the same way
+def start(cur, options):
+    cur.execute(delete_checkpoints)
+    cur.execute(etl_run_state_upsert, (json.dumps(options),))
+
+
+# Returns the options of the interrupted run, None when the last run finished
+def interrupted_run(cur):
+    cur.execute(select_run_state)
+    row = cur.fetchone()
+    if row is None or row[2] is not None:
+        return None
+    return json.loads(row[0])
+
+
+# Returns {(stage, source): (rows_done, completed)}
+def load(cur):
+    cur.execute(select_checkpoints)
+    return {
+        (stage, source): (rows_done, completed)
+        for stage, source, rows_done, completed in cur.fetchall()
+    }
+
+
+# Has to be committed together with the rows it counts
+def save(cur, stage, source, rows_done, completed=False):
+    cur.execute(etl_checkpoint_upsert, (stage, source, rows_done, completed))
+
+
+# The indexes and foreign keys dropped for a full load are kept, an
+# interrupted run that is resumed finds them already gone and still has to
+# rebuild them at the end
+def save_dropped(cur, indexes, foreign_keys):
+    cur.execute(
+        update_run_state_dropped_indexes,
+        (json.dumps({"indexes": indexes, "foreign_keys": foreign_keys}),),
+    )
+
+
+def dropped(cur):
+    cur.execute(select_run_state)
+    row = cur.fetchone()
+    if row is None or row[1] is None:
+        return [], []
+    dropped = json.loads(row[1])
+    return (
+        [tuple(index) for index in dropped["indexes"]],
+        [tuple(foreign_key) for foreign_key in dropped["foreign_keys"]],
+    )
+
+
+def finish(cur):
+    cur.execute(update_run_state_finished)
+
+
+# Drops up to `rows` rows an interrupted run already committed from the start
+# of `df`, returns what is left of it and the rows still to skip. The rest is
+# a copy, validation flags rows in the frames it is given.
+def skip_rows(df, rows):
+    if rows >= len(df):
+        return df.iloc[0:0].copy(), rows - len(df)
+    return df.iloc[rows:].copy(), 0
@@ -1,15 +1,26 @@
-import psycopg2
-
+import db
 from quires import *
 from settings import *
 
 
-def main():
+def table_queries(partitioned, smart_date_keys=False):
+    queries = create_table_queries
+    if partitioned:
+        logger.info("Creating the fact tables partitioned by order month")
+        queries = create_partitioned_table_queries
+    if smart_date_keys:
+        logger.info("Creating dim_date with smart YYYYMMDDHHMMSS keys")
+        queries = [
+            dim_date_smart_key_table if query == dim_date_table else query
+            for query in queries
+        ]
+    return queries
+
+
+def main(partitioned=FACT_PARTITIONING, smart_date_keys=SMART_DATE_KEYS):
     logger.info("Start dropping and creating tables")
     try:
-        conn = psycopg2.connect(
-            f"host={DB_HOST} dbname={SYSTEM_DB} user={DB_USER} password={DB_PASSWORD}"
-        )
+        conn = db.connect(db.dsn(SYSTEM_DB))
         conn.set_session(autocommit=True)
         cur = conn.cursor()
 
@@ -23,27 +34,34 @@ def main():
         logger.error(e)
 
     try:
-        conn = psycopg2.connect(
-            f"host={DB_HOST} dbname={DB_NAME} user={DB_USER} password={DB_PASSWORD}"
-        )
+        conn = db.connect(db.dsn(session=db.LOAD_SESSION))
         cur = conn.cursor()
 
         for table in drop_table_queries:
             cur.execute(table)
 
-        conn.commit()
-        logger.info("Tables dropped successfully")
-        for table in create_table_queries:
-            cur.execute(table)
-
         conn.commit()
         conn.close()
-        logger.info("Tables created successfully")
+        logger.info("Tables dropped successfully")
+        create_tables(partitioned, smart_date_keys)
 
     except Exception as e:
         logger.error(e)
-    finally:
-        conn.close()
+
+
+def create_tables(partitioned=FACT_PARTITIONING, smart_date_keys=SMART_DATE_KEYS):
+    conn = db.connect(db.dsn(session=db.LOAD_SESSION))
+    cur = conn.cursor()
+    for table in table_queries(partitioned, smart_date_keys):
+        cur.execute(table)
+    for query in alter_table_queries:
+        cur.execute(query)
+    for index in create_index_queries:
+        cur.execute(index)
+
+    conn.commit()
+    conn.close()
+    logger.info("Tables created successfully")
 
 
 if __name__ == "__main__":
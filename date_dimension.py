@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+DIM_DATE_COLUMNS = [
+    "date_key",
+    "date_year",
+    "date_quarter",
+    "date_season",
+    "date_month",
+    "date_month_name",
+    "date_day",
+    "date_day_name",
+    "date_hour",
+    "date_am_or_pm",
+]
+
+
+def season_of(month, day):
+    # Conditions are checked in order, the first match wins
+    conditions = [
+        ((month == 12) & (day >= 21)) | ((month <= 3) & (day < 21)),
+        ((month == 3) & (day >= 21)) | ((month <= 6) & (day < 21)),
+        ((month == 6) & (day >= 21)) | ((month <= 9) & (day < 21)),
+        ((month == 9) & (day >= 21)) | (month < 12) | ((month == 12) & (day < 21)),
+    ]
+    return np.select(conditions, ["Winter", "Spring", "Summer", "Fall"], default="")
+
+
+# The YYYYMMDDHHMMSS integer of every date, NaN for missing dates. Computed
+# in float64, which holds these integers exactly
+def smart_date_key(dates):
+    return (
+        dates.dt.year.astype("float64") * 10**10
+        + dates.dt.month * 10**8
+        + dates.dt.day * 10**6
+        + dates.dt.hour * 10**4
+        + dates.dt.minute * 100
+        + dates.dt.second
+    )
+
+
+def build_date_dimension(*dates):
+    date_key = pd.Series(pd.concat(dates).dropna().unique(), name="date_key")
+    date_key = pd.to_datetime(date_key)
+    month = date_key.dt.month
+    day = date_key.dt.day
+    hour = date_key.dt.hour
+    return pd.DataFrame(
+        {
+            "date_key": date_key,
+            "date_year": date_key.dt.year,
+            "date_quarter": date_key.dt.quarter,
+            "date_season": season_of(month, day),
+            "date_month": month,
+            "date_month_name": date_key.dt.month_name(),
+            "date_day": day,
+            "date_day_name": date_key.dt.day_name(),
+            "date_hour": hour,
+            "date_am_or_pm": np.where(hour < 12, "AM", "PM"),
+        },
+        columns=DIM_DATE_COLUMNS,
+    )
@@ -0,0 +1,159 @@
+import re
+from collections import namedtuple
+from contextlib import contextmanager
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+from quires import (
+    dim_customer_inferred_insert,
+    dim_order_inferred_insert,
+    dim_product_inferred_insert,
+    dim_seller_inferred_insert,
+    etl_checkpoint_upsert,
+    select_customer_hashes_in,
+    select_customer_keys_in,
+    select_date_keys_in,
+    select_inferred_orders_in,
+    select_order_hashes_in,
+    select_order_keys_in,
+    select_order_month_keys_in,
+    select_product_hashes_in,
+    select_product_keys_in,
+    select_seller_hashes_in,
+    select_seller_keys_in,
+)
+from settings import (
+    DB_HOST,
+    DB_MAINTENANCE_WORK_MEM,
+    DB_NAME,
+    DB_PASSWORD,
+    DB_PORT,
+    DB_PREPARE,
+    DB_STATEMENT_TIMEOUT,
+    DB_SYNCHRONOUS_COMMIT,
+    DB_USER,
+    DB_WORK_MEM,
+)
+
+# Session settings of the connections that load the warehouse. Every chunk
+# commits its checkpoint with its rows, so the commits that synchronous_commit
+# off can lose in a server crash are loaded again by --resume.
+LOAD_SESSION = {
+    "synchronous_commit": DB_SYNCHRONOUS_COMMIT,
+    "work_mem": DB_WORK_MEM,
+    "maintenance_work_mem": DB_MAINTENANCE_WORK_MEM,
+    "statement_timeout": DB_STATEMENT_TIMEOUT,
+}
+
+# Statements run for every chunk or batch, each connection prepares them on
+# the server the first time it runs them and only sends their parameters
+# afterwards
+PREPARED_QUERIES = {
+    "checkpoint_upsert": etl_checkpoint_upsert,
+    "customer_keys_in": select_customer_keys_in,
+    "order_keys_in": select_order_keys_in,
+    "order_month_keys_in": select_order_month_keys_in,
+    "product_keys_in": select_product_keys_in,
+    "seller_keys_in": select_seller_keys_in,
+    "date_keys_in": select_date_keys_in,
+    "customer_hashes_in": select_customer_hashes_in,
+    "order_hashes_in": select_order_hashes_in,
+    "product_hashes_in": select_product_hashes_in,
+    "seller_hashes_in": select_seller_hashes_in,
+    "inferred_orders_in": select_inferred_orders_in,
+    "customer_inferred_insert": dim_customer_inferred_insert,
+    "order_inferred_insert": dim_order_inferred_insert,
+    "product_inferred_insert": dim_product_inferred_insert,
+    "seller_inferred_insert": dim_seller_inferred_insert,
+}
+
+# `params` are the positions or names of the psycopg2 parameters, in the
+# order of the $n parameters of `text`
+Statement = namedtuple("Statement", ["name", "text", "params"])
+
+_PLACEHOLDER = re.compile(r"%\((\w+)\)s|%s|%%")
+
+
+def _statement(name, query):
+    params = []
+
+    def number(match):
+        if match.group(0) == "%%":
+            return "%"
+        param = match.group(1) if match.group(1) else len(params)
+        if param not in params:
+            params.append(param)
+        return f"${params.index(param) + 1}"
+
+    return Statement(name, _PLACEHOLDER.sub(number, query), params)
+
+
+_STATEMENTS = {
+    query: _statement(name, query) for name, query in PREPARED_QUERIES.items()
+}
+
+
+# Runs the statements of PREPARED_QUERIES as prepared statements, every other
+# query is sent as it is
+class PreparingCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        statement = _STATEMENTS.get(query) if DB_PREPARE else None
+        if statement is None:
+            return super().execute(query, vars)
+        if statement.name not in self.connection.prepared:
+            super().execute(f"PREPARE {statement.name} AS {statement.text}")
+            self.connection.prepared.add(statement.name)
+        if not statement.params:
+            return super().execute(f"EXECUTE {statement.name}")
+        placeholders = ", ".join(["%s"] * len(statement.params))
+        return super().execute(
+            f"EXECUTE {statement.name} ({placeholders})",
+            [vars[param] for param in statement.params],
+        )
+
+
+class Connection(psycopg2.extensions.connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursor_factory = PreparingCursor
+        # Names of the statements prepared on this connection, they last as
+        # long as the session whether their transaction commits or not
+        self.prepared = set()
+
+
+# `session` settings are passed in the startup packet, so every connection
+# made from the dsn, by a pool or by another process, starts with them
+def dsn(dbname=DB_NAME, session=None):
+    options = " ".join(f"-c {name}={value}" for name, value in (session or {}).items())
+    return psycopg2.extensions.make_dsn(
+        host=DB_HOST,
+        port=DB_PORT,
+        dbname=dbname,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        options=options or None,
+    )
+
+
+def connect(connection_dsn=None):
+    return psycopg2.connect(connection_dsn or dsn(), connection_factory=Connection)
+
+
+def pool(minconn, maxconn, connection_dsn=None, pool_class=ThreadedConnectionPool):
+    return pool_class(
+        minconn, maxconn, connection_dsn or dsn(), connection_factory=Connection
+    )
+
+
+# One transaction per batch: committed when the block ends and rolled back
+# when it raises, so a failed batch leaves nothing half written behind it
+@contextmanager
+def transaction(conn):
+    try:
+        yield
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
@@ -0,0 +1,189 @@
+# Loads the star schema into an embedded DuckDB file instead of PostgreSQL.
+# The source files are cleaned by the same transforms as etl.py and ingested
+# as DataFrames into clean_<stage> tables, the dimensions and facts are then
+# built from those with set-based SQL. No server is needed and the columnar
+# storage scans the facts much faster for analytical queries.
+import logging
+import os
+import time
+import uuid
+from contextlib import closing
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+import etl
+import pipeline
+import validation
+from date_dimension import build_date_dimension
+from metrics import StageMetrics, write_report
+from quires import (
+    duckdb_create_table_queries,
+    duckdb_data_version_insert,
+    duckdb_dim_customer,
+    duckdb_dim_order,
+    duckdb_dim_product,
+    duckdb_dim_seller,
+    duckdb_fact_feedback,
+    duckdb_fact_order_item,
+    duckdb_fact_payment,
+    duckdb_select_dates,
+    summary_refresh_queries,
+)
+from settings import (
+    DUCKDB_PATH,
+    ETL_CHUNK_SIZE,
+    ETL_PIPELINE,
+    ETL_PIPELINE_QUEUE_SIZE,
+    ETL_STAGING_CACHE,
+    REPORT_DIR,
+)
+
+logger = logging.getLogger(__name__)
+
+# Stages whose cleaned frames are ingested, the dates are collected from the
+# order, item and feedback frames instead of being read a second time
+INGEST_STAGES = [stage for stage in etl.STAGES if stage != "date"]
+
+# Tables in build order, dim_date is built in Python by date_dimension.py
+BUILD_QUERIES = {
+    "dim_customer": duckdb_dim_customer,
+    "dim_seller": duckdb_dim_seller,
+    "dim_product": duckdb_dim_product,
+    "dim_date": None,
+    "dim_order": duckdb_dim_order,
+    "fact_order_item": duckdb_fact_order_item,
+    "fact_payment": duckdb_fact_payment,
+    "fact_feedback": duckdb_fact_feedback,
+}
+
+
+def clean_table(stage):
+    return f"clean_{stage}"
+
+
+# Categoricals would become ENUM types with the categories of the first chunk
+# only, and Arrow-backed strings are scanned through deprecated pandas
+# internals, both are ingested as plain strings
+def plain_strings(df):
+    return df.astype(
+        {
+            name: object
+            for name, dtype in df.dtypes.items()
+            if isinstance(dtype, (pd.CategoricalDtype, pd.StringDtype))
+        }
+    )
+
+
+def connect(read_only=False):
+    return duckdb.connect(DUCKDB_PATH, read_only=read_only)
+
+
+# The file is rebuilt from scratch on every run
+def create_tables():
+    if os.path.exists(DUCKDB_PATH):
+        os.remove(DUCKDB_PATH)
+    con = connect()
+    for query in duckdb_create_table_queries:
+        con.execute(query)
+    con.close()
+    logger.info(f"Tables created successfully in {DUCKDB_PATH}")
+
+
+def ingest_stage(con, run, stage):
+    logger.info(f"Start ingesting {stage}")
+    stage_metrics = StageMetrics(stage)
+    run.stage_metrics.append(stage_metrics)
+    started = time.perf_counter()
+    table = clean_table(stage)
+    quarantine_table = etl.DIMENSION_STAGES.get(stage, etl.FACT_STAGES.get(stage))
+    con.execute(f"DROP TABLE IF EXISTS {table}")
+    created = False
+    for step in etl.STAGES[stage]:
+        frames, transform = etl.step_frames(run, step)
+        if run.pipelined:
+            frames = pipeline.pipelined(
+                frames, transform, stage_metrics, ETL_PIPELINE_QUEUE_SIZE
+            )
+            transform = None
+
+        with closing(frames):
+            for df in stage_metrics.extract(frames):
+                if transform is not None:
+                    with stage_metrics.phase("transform"):
+                        df = transform(df)
+                with stage_metrics.phase("load"):
+                    # Rejected rows are kept for their dates, the tables are
+                    # built from the others and unknown keys are left to the
+                    # joins that build them
+                    rejected = validation.rejected(df)
+                    stage_metrics.rows_rejected += validation.quarantine(
+                        quarantine_table, df[rejected], run.started_at
+                    )
+                    df = df.drop(columns=validation.REASON, errors="ignore")
+                    df = df.assign(rejected=rejected.to_numpy())
+                    df = plain_strings(df).reset_index(drop=True)
+                    df.insert(
+                        0,
+                        "line_number",
+                        np.arange(
+                            stage_metrics.rows_written,
+                            stage_metrics.rows_written + len(df),
+                        ),
+                    )
+                    if created:
+                        con.append(table, df, by_name=True)
+                    else:
+                        con.from_df(df).create(table)
+                        created = True
+                    stage_metrics.rows_written += len(df)
+    stage_metrics.wall_seconds = time.perf_counter() - started
+    logger.info(f"Number of ingested rows: {stage_metrics.rows_written}")
+
+
+def build_table(con, run, table, query):
+    stage_metrics = StageMetrics(table)
+    run.stage_metrics.append(stage_metrics)
+    started = time.perf_counter()
+    with stage_metrics.phase("load"):
+        if query is None:
+            dates_df = build_date_dimension(
+                con.execute(duckdb_select_dates).df()["date_key"]
+            )
+            dates_df.insert(0, "id", np.arange(1, len(dates_df) + 1))
+            con.append(table, dates_df, by_name=True)
+        else:
+            con.execute(query)
+        stage_metrics.rows_written = con.execute(
+            f"SELECT COUNT(*) FROM {table}"
+        ).fetchone()[0]
+    stage_metrics.wall_seconds = time.perf_counter() - started
+    logger.info(f"Built {table} with {stage_metrics.rows_written} rows")
+
+
+def main(
+    chunk_size=ETL_CHUNK_SIZE,
+    staging_cache=ETL_STAGING_CACHE,
+    pipelined=ETL_PIPELINE,
+):
+    run = etl.EtlRun(chunk_size, staging_cache=staging_cache, pipelined=pipelined)
+    logger.info(f"Start ETL process into {DUCKDB_PATH}")
+    con = connect()
+    try:
+        for stage in INGEST_STAGES:
+            ingest_stage(con, run, stage)
+        for table, query in BUILD_QUERIES.items():
+            build_table(con, run, table, query)
+    finally:
+        write_report(run.started_at, run.stage_metrics, REPORT_DIR)
+
+    # Every summary is built from scratch, there are no earlier ids to skip
+    for query in summary_refresh_queries:
+        con.execute(query % {"dim_order": 0, "fact_order_item": 0, "fact_payment": 0})
+    con.execute(duckdb_data_version_insert, [uuid.uuid4().hex])
+    for stage in INGEST_STAGES:
+        con.execute(f"DROP TABLE {clean_table(stage)}")
+    con.execute("CHECKPOINT")
+    con.close()
+    logger.info("Finished ETL process successfully")
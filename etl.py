@@ -1,123 +1,341 @@
+import csv
 import logging
+import os
+import time
+import uuid
+from collections import namedtuple
+from contextlib import closing
+from datetime import datetime
 
 import pandas as pd
-import psycopg2
-
+import checkpoint
+import db
+import indexes
+import partitions
+import pipeline
+import pushdown
+import retry
+import scheduler
+import schemas
+import sharding
+import staging
+import summaries
+import validation
+import watermark
+from bulk_load import copy_frame, diff_upsert_frame, upsert_frame
+from date_dimension import build_date_dimension, smart_date_key
+from key_cache import KeyCache
+from metrics import DIMENSION_CHANGES, StageMetrics, write_report
 from quires import (
-    dim_customer_table_insert,
-    dim_date_table_insert,
-    dim_order_table_insert,
-    dim_product_table_insert,
-    dim_seller_table_insert,
-    fact_feedback_table_insert,
-    fact_order_item_table_insert,
-    fact_payment_table_insert,
-    select_customer_by_id,
-    select_date_by_key,
-    select_order_by_id,
-    select_product_by_id,
-    select_seller_by_id,
+    dim_customer_inferred_insert,
+    dim_customer_table_merge,
+    dim_date_smart_key_merge,
+    dim_date_table_merge,
+    dim_order_inferred_insert,
+    dim_order_table_merge,
+    dim_product_inferred_insert,
+    dim_product_table_merge,
+    dim_seller_inferred_insert,
+    dim_seller_table_merge,
+    etl_data_version_upsert,
+    fact_feedback_table_merge,
+    fact_order_item_table_merge,
+    fact_payment_table_merge,
+    realign_order_month_queries,
+    select_customer_hashes_in,
+    select_date_id_default,
+    select_inferred_orders_in,
+    select_order_hashes_in,
+    select_product_hashes_in,
+    select_seller_hashes_in,
+)
+from settings import (
+    DATASET_DIR,
+    ETL_CHUNK_SIZE,
+    ETL_FACT_SHARDS,
+    ETL_INFER_MEMBERS,
+    ETL_PIPELINE,
+    ETL_PIPELINE_QUEUE_SIZE,
+    ETL_STAGING_CACHE,
+    ETL_WORKERS,
+    REPORT_DIR,
 )
-from settings import DB_HOST, DB_NAME, DB_PASSWORD, DB_USER
 
 logger = logging.getLogger(__name__)
 
-
-def extract_info_from_date(date):
-    year = date.year
-    quarter = (date.month - 1) // 3 + 1
-    season = ""
-    month = date.month
-    month_name = date.month_name()
-    day = date.day
-    day_name = date.day_name()
-    hour = date.hour
-    am_or_pm = "AM" if hour < 12 else "PM"
-    if (month == 12 and day >= 21) or (month <= 3 and day < 21):
-        season = "Winter"
-    elif (month == 3 and day >= 21) or (month <= 6 and day < 21):
-        season = "Spring"
-    elif (month == 6 and day >= 21) or (month <= 9 and day < 21):
-        season = "Summer"
-    elif (month == 9 and day >= 21) or (month < 12 or (month == 12 and day < 21)):
-        season = "Fall"
-    return (
-        date,
-        year,
-        quarter,
-        season,
-        month,
-        month_name,
-        day,
-        day_name,
-        hour,
-        am_or_pm,
+MISSING_DATE = pd.Timestamp("1900-12-31")
+ORDER_DATE_COLUMNS = [
+    "order_date",
+    "order_approved_date",
+    "pickup_date",
+    "delivered_date",
+    "estimated_time_delivery",
+]
+FEEDBACK_DATE_COLUMNS = ["feedback_form_sent_date", "feedback_answer_date"]
+
+# One source file of a stage: every chunk read from `source` goes through
+# `transform` and then `load`, which returns the number of rows written
+Step = namedtuple("Step", ["source", "transform", "load", "read_options"])
+
+
+class EtlRun:
+    def __init__(
+        self,
+        chunk_size=None,
+        incremental=False,
+        staging_cache=True,
+        partition=None,
+        pipelined=False,
+        infer_members=False,
+        fact_shards=1,
+        dsn=None,
+    ):
+        self.chunk_size = chunk_size
+        self.incremental = incremental
+        self.staging_cache = staging_cache
+        self.pipelined = pipelined
+        # Facts referencing keys that are not loaded yet get inferred members
+        # instead of being dropped
+        self.infer_members = infer_members
+        # Fact stages are loaded on this many processes, see sharding.py
+        self.fact_shards = fact_shards
+        self.dsn = dsn
+        # Inferred orders loaded by this run, their facts were moved to the
+        # month of the order and the summaries have to be rebuilt
+        self.resolved_orders = 0
+        # YYYYMM month being reloaded, only its fact rows are written
+        self.partition = partition
+        self.partitioned_tables = set()
+        self.created_partitions = set()
+        # dim_date ids are computed from the dates, see smart_date_key
+        self.smart_date_keys = False
+        # table -> {change: rows} of the dimensions written by this run
+        self.dimension_changes = {}
+        # table -> fact rows already loaded that this run overwrote
+        self.fact_updates = {}
+        # table -> rows quarantined by validation in this run
+        self.rejected = {}
+        # Rejected frames kept for the parent instead of being quarantined,
+        # in the worker processes of a sharded load
+        self.pending_rejects = None
+        # source -> (path, bytes) of the files copied by pushdown.load_raw
+        self.raw_offsets = {}
+        # Tables whose held rows are being loaded again, rows rejected again
+        # were quarantined by the run that read them first
+        self.retrying = set()
+        # (stage, source) -> (rows_done, completed) of an interrupted run
+        self.checkpoints = {}
+        self.key_cache = KeyCache()
+        self.started_at = datetime.now()
+        self.stage_metrics = []
+
+
+# Rows already loaded by an incremental run are merged on their natural key,
+# a full rebuild starts from empty tables and copies straight in. Returns the
+# number of rows written.
+def write_frame(cur, run, table, df, key, merge_query):
+    if table in run.partitioned_tables:
+        if run.partition is not None:
+            df = df[df["order_month"] == run.partition]
+        partitions.create_missing(
+            cur, table, df["order_month"].unique(), run.created_partitions
+        )
+    if run.incremental:
+        updated = upsert_frame(cur, table, df, key, merge_query)
+        run.fact_updates[table] = run.fact_updates.get(table, 0) + updated
+    elif table in run.partitioned_tables:
+        partitions.copy_partitioned(cur, table, df)
+    else:
+        copy_frame(cur, table, df)
+    return len(df)
+
+
+# Rows already loaded that this run overwrote, in the facts and dimensions
+def rows_updated(run):
+    return sum(run.fact_updates.values()) + sum(
+        changes["updated"] for changes in run.dimension_changes.values()
     )
 
 
-def insert_data(cur, query, data):
-    cur.executemany(query, data)
-
-
-def main():
-    conn = psycopg2.connect(
-        f"host={DB_HOST} dbname={DB_NAME} user={DB_USER} password={DB_PASSWORD}"
+# Writes the new and changed rows of a dimension and counts how its rows
+# compared with the ones already loaded
+def write_dimension(cur, run, table, df, key, merge_query, select_hashes):
+    changes = diff_upsert_frame(cur, table, df, key, merge_query, select_hashes)
+    totals = run.dimension_changes.setdefault(
+        table, dict.fromkeys(DIMENSION_CHANGES, 0)
     )
-    conn.set_session(autocommit=True)
-    cur = conn.cursor()
-    logger.info("Start ETL process")
-
-    # ETL customer
-    logger.info("Start ETL user")
-    user_df = pd.read_csv("ecommerce_dataset/user_dataset.csv")
-    user_df.dropna(subset=["user_name"], inplace=True)
-
-    data_to_insert = [
-        (
-            row["user_name"],
-            row["customer_zip_code"],
-            row["customer_city"],
-            row["customer_state"],
+    for change, rows in zip(DIMENSION_CHANGES, changes):
+        totals[change] += rows
+    return len(df)
+
+
+def source_path(source):
+    return os.path.join(DATASET_DIR, f"{source}_dataset.csv")
+
+
+# Reads `source` from byte `offset` on, which has to be the start of a line
+def read_source(source, chunk_size=None, offset=0, **read_options):
+    with open(source_path(source), "rb") as f:
+        if offset:
+            read_options["names"] = next(csv.reader([f.readline().decode()]))
+            read_options["header"] = None
+            f.seek(offset)
+        if chunk_size is None:
+            yield pd.read_csv(f, **read_options)
+            return
+        with pd.read_csv(f, chunksize=chunk_size, **read_options) as reader:
+            yield from reader
+
+
+def uses_smart_date_keys(cur):
+    cur.execute(select_date_id_default)
+    row = cur.fetchone()
+    return row is not None and row[0] is None
+
+
+def insert_missing_dates(cur, run, *dates):
+    missing_dates = run.key_cache.missing("date", pd.concat(dates))
+    if missing_dates.empty:
+        return 0
+    if not run.smart_date_keys:
+        dates_df = build_date_dimension(missing_dates)
+        upsert_frame(cur, "dim_date", dates_df, "date_key", dim_date_table_merge)
+        run.key_cache.add(cur, "date", missing_dates)
+        return len(dates_df)
+
+    # Smart keys only tell seconds apart, and the new ids are known without
+    # selecting them back
+    dates_df = build_date_dimension(missing_dates.dt.floor("s"))
+    dates_df.insert(0, "id", smart_date_key(dates_df["date_key"]).astype("int64"))
+    upsert_frame(cur, "dim_date", dates_df, "date_key", dim_date_smart_key_merge)
+    run.key_cache.update("date", dict(zip(dates_df["date_key"], dates_df["id"])))
+    return len(dates_df)
+
+
+# Dimensions whose unknown natural keys are loaded as inferred members
+INFERRED_MEMBER_INSERTS = {
+    "customer": dim_customer_inferred_insert,
+    "seller": dim_seller_inferred_insert,
+    "product": dim_product_inferred_insert,
+    "order": dim_order_inferred_insert,
+}
+
+
+# Loads every natural key of `df` the dimensions do not have yet with one
+# insert per dimension, then refreshes its key map once. Dates are built from
+# their values, the other dimensions get inferred members when the run infers
+# them. `keys` is the mapping given to KeyCache.resolve_keys.
+def insert_missing_members(cur, run, df, keys):
+    columns = {}
+    for dimension, source_column in keys.values():
+        columns.setdefault(dimension, []).append(df[source_column])
+    if "date" in columns:
+        insert_missing_dates(cur, run, *columns["date"])
+    if not run.infer_members:
+        return
+
+    for dimension, query in INFERRED_MEMBER_INSERTS.items():
+        if dimension not in columns:
+            continue
+        missing = run.key_cache.missing(dimension, pd.concat(columns[dimension]))
+        if missing.empty:
+            continue
+        # Sorted so concurrent stages inferring the same keys lock them in the
+        # same order
+        params = {"keys": sorted(missing.astype(str))}
+        if dimension == "order":
+            insert_missing_dates(cur, run, pd.Series([MISSING_DATE]))
+            params["missing_date"] = int(
+                run.key_cache.resolve("date", pd.Series([MISSING_DATE])).iloc[0]
+            )
+        cur.execute(query, params)
+        logger.info(f"Inferred {cur.rowcount} dim_{dimension} members")
+        run.key_cache.add(cur, dimension, missing)
+        if dimension == "order":
+            run.key_cache.add(cur, "order_month", missing)
+
+
+# Quarantines the rows of `df` flagged while cleaning it and the ones whose
+# keys are still not loaded once the missing members are, then resolves `keys`
+# of the rest like KeyCache.resolve_keys
+def resolve_keys(cur, run, table, df, keys):
+    insert_missing_members(cur, run, df[~validation.rejected(df)], keys)
+    for dimension, source_column in keys.values():
+        validation.flag(
+            df,
+            ~run.key_cache.known(dimension, df[source_column]),
+            f"unknown_{source_column}",
         )
-        for index, row in user_df.iterrows()
-    ]
+    df, rejected = validation.split(df)
+    if not rejected.empty:
+        reject_rows(run, table, rejected)
+        # A reloaded partition reads every row again, the rows are held by
+        # the load that read them first
+        if run.partition is None:
+            retry.hold(cur, table, rejected)
+    return run.key_cache.resolve_keys(df, keys)
+
+
+def reject_rows(run, table, rejected):
+    if table in run.retrying:
+        return
+    run.rejected[table] = run.rejected.get(table, 0) + len(rejected)
+    if run.pending_rejects is not None:
+        run.pending_rejects.append((table, rejected))
+    # A reloaded partition reads every row again, its rejected rows were
+    # quarantined by the load that read them first
+    elif run.partition is None:
+        validation.quarantine(table, rejected, run.started_at)
+
+
+def transform_customer(user_df):
+    user_df.dropna(subset=["user_name"], inplace=True)
+    return user_df[
+        ["user_name", "customer_zip_code", "customer_city", "customer_state"]
+    ].rename(columns={"user_name": "customer_id"})
+
+
+def load_customer(cur, run, customer_df):
+    write_dimension(
+        cur,
+        run,
+        "dim_customer",
+        customer_df,
+        "customer_id",
+        dim_customer_table_merge,
+        select_customer_hashes_in,
+    )
+    run.key_cache.add(cur, "customer", customer_df["customer_id"])
+    return len(customer_df)
 
-    insert_data(cur, dim_customer_table_insert, data_to_insert)
-    cur.execute("SELECT COUNT(*) FROM dim_customer")
-    number_of_inserted_rows = cur.fetchone()[0]
-    logger.info(f"Number of inserted rows: {number_of_inserted_rows}")
-    logger.info("Finish ETL user")
 
-    # ETL seller
-    logger.info("Start ETL seller")
-    seller_df = pd.read_csv("ecommerce_dataset/seller_dataset.csv")
+def transform_seller(seller_df):
     seller_df.dropna(subset=["seller_id"], inplace=True)
     seller_df["seller_zip_code"] = seller_df["seller_zip_code"].astype(str)
+    return seller_df[["seller_id", "seller_zip_code", "seller_city", "seller_state"]]
+
+
+def load_seller(cur, run, seller_df):
+    write_dimension(
+        cur,
+        run,
+        "dim_seller",
+        seller_df,
+        "seller_id",
+        dim_seller_table_merge,
+        select_seller_hashes_in,
+    )
+    run.key_cache.add(cur, "seller", seller_df["seller_id"])
+    return len(seller_df)
 
-    data_to_insert = [
-        (
-            row["seller_id"],
-            row["seller_zip_code"],
-            row["seller_city"],
-            row["seller_state"],
-        )
-        for index, row in seller_df.iterrows()
-    ]
 
-    insert_data(cur, dim_seller_table_insert, data_to_insert)
-    conn.commit()
-    cur.execute("SELECT COUNT(*) FROM dim_seller")
-    number_of_inserted_rows = cur.fetchone()[0]
-    logger.info(f"Number of inserted rows: {number_of_inserted_rows}")
-    logger.info("Finish ETL seller")
-
-    # ETL product
-    logger.info("Start ETL product")
-    products_df = pd.read_csv("ecommerce_dataset/products_dataset.csv")
+def transform_product(products_df):
     products_df.dropna(subset=["product_id"], inplace=True)
+    products_df["product_category"] = schemas.fillna_category(
+        products_df["product_category"], "Unknown"
+    )
     products_df.fillna(
         {
-            "product_category": "Unknown",
             "product_name_lenght": 0,
             "product_description_lenght": 0,
             "product_photos_qty": 0,
@@ -128,47 +346,103 @@ def main():
         },
         inplace=True,
     )
-    data_to_insert = [
-        (
-            row["product_id"],
-            row["product_category"],
-            row["product_name_lenght"],
-            row["product_description_lenght"],
-            row["product_photos_qty"],
-            row["product_weight_g"],
-            row["product_length_cm"],
-            row["product_height_cm"],
-            row["product_width_cm"],
-        )
-        for index, row in products_df.iterrows()
-    ]
+    return products_df[
+        [
+            "product_id",
+            "product_category",
+            "product_name_lenght",
+            "product_description_lenght",
+            "product_photos_qty",
+            "product_weight_g",
+            "product_length_cm",
+            "product_height_cm",
+            "product_width_cm",
+        ]
+    ].rename(
+        columns={
+            "product_category": "product_category_name",
+            "product_name_lenght": "product_name_length",
+            "product_description_lenght": "product_description_length",
+        }
+    )
 
-    insert_data(cur, dim_product_table_insert, data_to_insert)
-    conn.commit()
-    cur.execute("SELECT COUNT(*) FROM dim_product")
-    number_of_inserted_rows = cur.fetchone()[0]
-    logger.info(f"Number of inserted rows: {number_of_inserted_rows}")
-    logger.info("Finish ETL product")
-
-    # ETL date
-    logger.info("Start ETL date")
-    order_df = pd.read_csv("ecommerce_dataset/order_dataset.csv")
-    order_df.dropna(subset=["order_id"], inplace=True)
-    order_df["order_date"] = pd.to_datetime(order_df["order_date"], errors="coerce")
-    order_df["order_approved_date"] = pd.to_datetime(
-        order_df["order_approved_date"], errors="coerce"
+
+def load_product(cur, run, product_df):
+    write_dimension(
+        cur,
+        run,
+        "dim_product",
+        product_df,
+        "product_id",
+        dim_product_table_merge,
+        select_product_hashes_in,
     )
-    order_df["pickup_date"] = pd.to_datetime(order_df["pickup_date"], errors="coerce")
-    order_df["delivered_date"] = pd.to_datetime(
-        order_df["delivered_date"], errors="coerce"
+    run.key_cache.add(cur, "product", product_df["product_id"])
+    return len(product_df)
+
+
+# Order dates are optional, missing and invalid ones get the placeholder date
+def clean_order_dates(order_df):
+    for column in ORDER_DATE_COLUMNS:
+        order_df[column] = pd.to_datetime(order_df[column], errors="coerce")
+    order_df.fillna(
+        {column: MISSING_DATE for column in ORDER_DATE_COLUMNS}, inplace=True
     )
-    order_df["estimated_time_delivery"] = pd.to_datetime(
-        order_df["estimated_time_delivery"], errors="coerce"
+    return order_df
+
+
+def transform_order_dates(order_df):
+    order_df.dropna(subset=["order_id"], inplace=True)
+    return clean_order_dates(order_df)[ORDER_DATE_COLUMNS]
+
+
+def transform_dates(dates_df):
+    return dates_df.apply(pd.to_datetime, errors="coerce")
+
+
+def load_dates(cur, run, dates_df):
+    return insert_missing_dates(
+        cur, run, *(dates_df[column] for column in dates_df.columns)
     )
 
-    order_df.fillna(pd.Timestamp("1900-12-31"), inplace=True)
-    dates_df = order_df[
+
+def transform_order(order_df):
+    validation.require(order_df, ["order_id", "user_name"])
+    order_df = clean_order_dates(order_df)
+    order_df["user_name"] = (
+        order_df["user_name"]
+        .astype(str)
+        .str.strip()
+        .where(order_df["user_name"].notna())
+    )
+    # A missing status is stored as the placeholder date, as the pushdown and
+    # DuckDB loads do
+    order_df["order_status"] = schemas.fillna_category(
+        order_df["order_status"], str(MISSING_DATE)
+    ).astype(str)
+    return order_df
+
+
+def load_order(cur, run, order_df):
+    order_df = resolve_keys(
+        cur,
+        run,
+        "dim_order",
+        order_df,
+        {
+            "customer_id": ("customer", "user_name"),
+            "order_date": ("date", "order_date"),
+            "order_approved_date": ("date", "order_approved_date"),
+            "pickup_date": ("date", "pickup_date"),
+            "delivered_date": ("date", "delivered_date"),
+            "estimated_time_delivery": ("date", "estimated_time_delivery"),
+        },
+    )
+    order_data = order_df[
         [
+            "order_id",
+            "customer_id",
+            "order_status",
             "order_date",
             "order_approved_date",
             "pickup_date",
@@ -177,199 +451,568 @@ def main():
         ]
     ]
 
-    date_data_to_insert = []
-    for index, row in dates_df.iterrows():
-        for col in dates_df.columns:
-            date_data_to_insert.append(extract_info_from_date(row[col]))
+    # Orders inferred by earlier runs, replaced by the merge below
+    resolved_ids = []
+    if run.incremental:
+        cur.execute(select_inferred_orders_in, (list(order_data["order_id"]),))
+        resolved_ids = [row[0] for row in cur.fetchall()]
+
+    # order_id is unique, so repeated orders are merged even on a full load
+    write_dimension(
+        cur,
+        run,
+        "dim_order",
+        order_data,
+        "order_id",
+        dim_order_table_merge,
+        select_order_hashes_in,
+    )
+    run.key_cache.add(cur, "order", order_data["order_id"])
+    run.key_cache.add(cur, "order_month", order_data["order_id"])
+    if resolved_ids:
+        realign_orders(cur, run, order_data, resolved_ids)
+    return len(order_data)
+
+
+# Moves the facts of inferred orders from the placeholder month to the month
+# of the order that replaced them
+def realign_orders(cur, run, order_data, resolved_ids):
+    months = run.key_cache.resolve("order_month", order_data["order_id"]).unique()
+    for table in FACT_STAGES.values():
+        if table in run.partitioned_tables:
+            partitions.create_missing(cur, table, months, run.created_partitions)
+    for query in realign_order_month_queries:
+        cur.execute(query, (resolved_ids,))
+    run.resolved_orders += len(resolved_ids)
+    logger.info(f"Replaced {len(resolved_ids)} inferred orders")
+
+
+def transform_order_item(order_item_df):
+    validation.require(
+        order_item_df,
+        ["order_id", "order_item_id", "product_id", "seller_id", "pickup_limit_date"],
+    )
+    validation.coerce_dates(order_item_df, ["pickup_limit_date"])
+    order_item_df["seller_id"] = order_item_df["seller_id"].str.strip()
+    order_item_df["order_id"] = order_item_df["order_id"].str.strip()
+    order_item_df["product_id"] = order_item_df["product_id"].str.strip()
+    return order_item_df
 
-    insert_data(cur, dim_date_table_insert, date_data_to_insert)
-    conn.commit()
-    cur.execute("SELECT COUNT(*) FROM dim_date")
-    number_of_inserted_rows = cur.fetchone()[0]
-    logger.info(f"Number of inserted rows: {number_of_inserted_rows}")
-    logger.info("End ETL date")
-
-    # ETL order
-    logger.info("Start ETL order")
-    order_df["user_name"] = order_df["user_name"].astype(str).str.strip()
-    order_df["order_status"] = order_df["order_status"].astype(str)
-    order_data = []
-    for index, row in order_df.iterrows():
-        cur.execute(select_customer_by_id, (row["user_name"],))
-        customer_id = cur.fetchone()
-        cur.execute(select_date_by_key, (row["order_date"],))
-        order_date_id = cur.fetchone()
-        cur.execute(select_date_by_key, (row["order_approved_date"],))
-        order_approved_date_id = cur.fetchone()
-        cur.execute(select_date_by_key, (row["pickup_date"],))
-        pickup_date_id = cur.fetchone()
-        cur.execute(select_date_by_key, (row["delivered_date"],))
-        delivered_date_id = cur.fetchone()
-        cur.execute(select_date_by_key, (row["estimated_time_delivery"],))
-        estimated_time_delivery_id = cur.fetchone()
-
-        if (
-            customer_id
-            and order_date_id
-            and order_approved_date_id
-            and pickup_date_id
-            and delivered_date_id
-            and estimated_time_delivery_id
-        ):
-            order_data.append(
-                (
-                    row["order_id"],
-                    customer_id[0],
-                    row["order_status"],
-                    order_date_id[0],
-                    order_approved_date_id[0],
-                    pickup_date_id[0],
-                    delivered_date_id[0],
-                    estimated_time_delivery_id[0],
-                )
-            )
 
-    insert_data(cur, dim_order_table_insert, order_data)
-    conn.commit()
-    cur.execute("SELECT COUNT(*) FROM dim_order")
-    number_of_inserted_rows = cur.fetchone()[0]
-    logger.info(f"Number of inserted rows: {number_of_inserted_rows}")
-    logger.info("End ETL order")
-
-    # ETL order_item
-    logger.info("Start ETL order_item")
-    order_item_df = pd.read_csv("ecommerce_dataset/order_item_dataset.csv")
-    order_item_df.dropna(
-        subset=[
-            "order_id",
+def load_order_item(cur, run, order_item_df):
+    order_item_df = resolve_keys(
+        cur,
+        run,
+        "fact_order_item",
+        order_item_df,
+        {
+            # Resolved first, order_id is replaced by its surrogate key
+            "order_month": ("order_month", "order_id"),
+            "order_id": ("order", "order_id"),
+            "product_id": ("product", "product_id"),
+            "seller_id": ("seller", "seller_id"),
+            "pickup_limit_date": ("date", "pickup_limit_date"),
+        },
+    )
+    order_item_data_to_insert = order_item_df[
+        [
             "order_item_id",
+            "order_id",
+            "order_month",
             "product_id",
             "seller_id",
             "pickup_limit_date",
+            "price",
+            "shipping_cost",
         ]
+    ]
+
+    return write_frame(
+        cur,
+        run,
+        "fact_order_item",
+        order_item_data_to_insert,
+        ["order_id", "order_item_id"],
+        fact_order_item_table_merge,
     )
-    order_item_df["pickup_limit_date"] = pd.to_datetime(
-        order_item_df["pickup_limit_date"], errors="coerce"
-    )
-    order_item_df["seller_id"] = order_item_df["seller_id"].str.strip()
-    order_item_df["order_id"] = order_item_df["order_id"].str.strip()
-    order_item_df["product_id"] = order_item_df["product_id"].str.strip()
 
-    order_item_data_to_insert = []
-    for index, row in order_item_df.iterrows():
-        # Ensure date values are inserted into dim_date first
-        cur.execute(select_date_by_key, (row["pickup_limit_date"],))
-        pickup_limit_date_id = cur.fetchone()
-        if not pickup_limit_date_id:
-            date_info = extract_info_from_date(row["pickup_limit_date"])
-            insert_data(cur, dim_date_table_insert, [date_info])
-            cur.execute(select_date_by_key, (row["pickup_limit_date"],))
-            pickup_limit_date_id = cur.fetchone()
-
-        cur.execute(select_order_by_id, (row["order_id"],))
-        order_id = cur.fetchone()
-        cur.execute(select_product_by_id, (row["product_id"],))
-        product_id = cur.fetchone()
-        cur.execute(select_seller_by_id, (row["seller_id"],))
-        seller_id = cur.fetchone()
-
-        if order_id and product_id and seller_id and pickup_limit_date_id:
-            order_item_data_to_insert.append(
-                (
-                    row["order_item_id"],
-                    order_id[0],
-                    product_id[0],
-                    seller_id[0],
-                    pickup_limit_date_id[0],
-                    row["price"],
-                    row["shipping_cost"],
-                )
-            )
 
-    insert_data(cur, fact_order_item_table_insert, order_item_data_to_insert)
-    conn.commit()
-    cur.execute("SELECT COUNT(*) FROM fact_order_item")
-    number_of_inserted_rows = cur.fetchone()[0]
-    logger.info(f"Number of inserted rows: {number_of_inserted_rows}")
-    logger.info("End ETL order_item")
-
-    # ETL payment
-    logger.info("Start ETL payment")
-    payment_df = pd.read_csv("ecommerce_dataset/payment_dataset.csv")
-    payment_df.dropna(subset=["order_id"], inplace=True)
-
-    payment_data_to_insert = []
-    for index, row in payment_df.iterrows():
-        cur.execute(select_order_by_id, (row["order_id"],))
-        order_id = cur.fetchone()
-        if order_id:
-            payment_data_to_insert.append(
-                (
-                    order_id[0],
-                    row["payment_sequential"],
-                    row["payment_type"],
-                    row["payment_installments"],
-                    row["payment_value"],
-                )
-            )
+def transform_payment(payment_df):
+    validation.require(payment_df, ["order_id"])
+    return payment_df
 
-    insert_data(cur, fact_payment_table_insert, payment_data_to_insert)
-    conn.commit()
-    cur.execute("SELECT COUNT(*) FROM fact_payment")
-    number_of_inserted_rows = cur.fetchone()[0]
-    logger.info(f"Number of inserted rows: {number_of_inserted_rows}")
-    logger.info("End ETL payment")
-
-    # ETL feedback
-    logger.info("Start ETL feedback")
-    feedback_df = pd.read_csv("ecommerce_dataset/feedback_dataset.csv")
-    feedback_df["feedback_form_sent_date"] = pd.to_datetime(
-        feedback_df["feedback_form_sent_date"]
+
+def load_payment(cur, run, payment_df):
+    payment_df = resolve_keys(
+        cur,
+        run,
+        "fact_payment",
+        payment_df,
+        {
+            "order_month": ("order_month", "order_id"),
+            "order_id": ("order", "order_id"),
+        },
     )
-    feedback_df["feedback_answer_date"] = pd.to_datetime(
-        feedback_df["feedback_answer_date"], errors="coerce"
+    payment_data_to_insert = payment_df[
+        [
+            "order_id",
+            "order_month",
+            "payment_sequential",
+            "payment_type",
+            "payment_installments",
+            "payment_value",
+        ]
+    ].astype({"payment_sequential": "Int64", "payment_installments": "Int64"})
+
+    return write_frame(
+        cur,
+        run,
+        "fact_payment",
+        payment_data_to_insert,
+        ["order_id", "payment_sequential"],
+        fact_payment_table_merge,
     )
+
+
+def transform_feedback(feedback_df):
+    validation.require(feedback_df, ["feedback_id", "order_id"] + FEEDBACK_DATE_COLUMNS)
+    validation.coerce_dates(feedback_df, FEEDBACK_DATE_COLUMNS)
     feedback_df["order_id"] = feedback_df["order_id"].str.strip()
-    feedback_data_to_insert = []
-    for index, row in feedback_df.iterrows():
-        # Ensure date values are inserted into dim_date first
-        cur.execute(select_date_by_key, (row["feedback_form_sent_date"],))
-        feedback_form_sent_date_id = cur.fetchone()
-        if not feedback_form_sent_date_id:
-            date_info = extract_info_from_date(row["feedback_form_sent_date"])
-            insert_data(cur, dim_date_table_insert, [date_info])
-            cur.execute(select_date_by_key, (row["feedback_form_sent_date"],))
-            feedback_form_sent_date_id = cur.fetchone()
-
-        cur.execute(select_date_by_key, (row["feedback_answer_date"],))
-        feedback_answer_date_id = cur.fetchone()
-        if not feedback_answer_date_id:
-            date_info = extract_info_from_date(row["feedback_answer_date"])
-            insert_data(cur, dim_date_table_insert, [date_info])
-            cur.execute(select_date_by_key, (row["feedback_answer_date"],))
-            feedback_answer_date_id = cur.fetchone()
-
-        cur.execute(select_order_by_id, (row["order_id"],))
-        order_id = cur.fetchone()
-
-        if order_id and feedback_form_sent_date_id and feedback_answer_date_id:
-            feedback_data_to_insert.append(
-                (
-                    row["feedback_id"],
-                    order_id[0],
-                    row["feedback_score"],
-                    feedback_form_sent_date_id[0],
-                    feedback_answer_date_id[0],
+    return feedback_df
+
+
+def load_feedback(cur, run, feedback_df):
+    feedback_df = resolve_keys(
+        cur,
+        run,
+        "fact_feedback",
+        feedback_df,
+        {
+            "order_month": ("order_month", "order_id"),
+            "order_id": ("order", "order_id"),
+            "feedback_form_sent_date": ("date", "feedback_form_sent_date"),
+            "feedback_answer_date": ("date", "feedback_answer_date"),
+        },
+    )
+    feedback_data_to_insert = feedback_df[
+        [
+            "feedback_id",
+            "order_id",
+            "order_month",
+            "feedback_score",
+            "feedback_form_sent_date",
+            "feedback_answer_date",
+        ]
+    ].astype({"feedback_score": "Int64"})
+
+    return write_frame(
+        cur,
+        run,
+        "fact_feedback",
+        feedback_data_to_insert,
+        ["feedback_id", "order_id"],
+        fact_feedback_table_merge,
+    )
+
+
+STAGES = {
+    "customer": [Step("user", transform_customer, load_customer, {})],
+    "seller": [Step("seller", transform_seller, load_seller, {})],
+    "product": [Step("products", transform_product, load_product, {})],
+    "date": [
+        Step(
+            "order",
+            transform_order_dates,
+            load_dates,
+            {"usecols": ["order_id"] + ORDER_DATE_COLUMNS},
+        ),
+        Step(
+            "order_item",
+            transform_dates,
+            load_dates,
+            {"usecols": ["pickup_limit_date"]},
+        ),
+        Step(
+            "feedback",
+            transform_dates,
+            load_dates,
+            {"usecols": FEEDBACK_DATE_COLUMNS},
+        ),
+    ],
+    "order": [Step("order", transform_order, load_order, {})],
+    "order_item": [Step("order_item", transform_order_item, load_order_item, {})],
+    "payment": [Step("payment", transform_payment, load_payment, {})],
+    "feedback": [Step("feedback", transform_feedback, load_feedback, {})],
+}
+
+# Stages that have to be loaded before a stage can start, the rest can run
+# at the same time
+STAGE_DEPENDENCIES = {
+    "customer": [],
+    "seller": [],
+    "product": [],
+    "date": [],
+    "order": ["customer", "date"],
+    "order_item": ["order", "product", "seller"],
+    "payment": ["order"],
+    "feedback": ["order"],
+}
+
+# Dimension stages compared with the rows already loaded, and their table
+DIMENSION_STAGES = {
+    "customer": "dim_customer",
+    "seller": "dim_seller",
+    "product": "dim_product",
+    "order": "dim_order",
+}
+
+# Fact stages and the table they load
+FACT_STAGES = {
+    "order_item": "fact_order_item",
+    "payment": "fact_payment",
+    "feedback": "fact_feedback",
+}
+
+
+def step_read_options(step):
+    return {
+        **step.read_options,
+        **schemas.read_options(step.source, step.read_options.get("usecols")),
+    }
+
+
+# Returns the frames of `step` read from byte `offset` on, and the transform
+# still to be applied to them
+def step_frames(run, step, offset=0):
+    read_options = step_read_options(step)
+    chunks = read_source(step.source, run.chunk_size, offset, **read_options)
+    if offset == 0 and run.staging_cache:
+        # The staging cache cleans the chunks itself on a miss and skips
+        # parsing and cleaning on a hit, its time is counted as extract
+        frames = staging.staged_frames(
+            source_path(step.source),
+            chunks,
+            step.transform,
+            run.chunk_size,
+            read_options,
+        )
+        return frames, None
+    return chunks, step.transform
+
+
+# Creates the partitions the rows of `df` go to before the shards load them,
+# a partition created inside the transaction of a shard would block the other
+# shards until it commits. Inferred orders are in the month of MISSING_DATE.
+def create_fact_partitions(conn, run, table, df):
+    if table not in run.partitioned_tables:
+        return
+    months = run.key_cache.resolve("order_month", df["order_id"])
+    if run.infer_members:
+        months = months.fillna(MISSING_DATE.year * 100 + MISSING_DATE.month)
+    cur = conn.cursor()
+    with db.transaction(conn):
+        partitions.create_missing(
+            cur, table, months.dropna().unique(), run.created_partitions
+        )
+    cur.close()
+
+
+# Loads the rows of `table` earlier runs held because a key they reference was
+# not loaded yet, the ones whose keys are still missing are held again
+def load_held_rows(conn, run, table, step):
+    cur = conn.cursor()
+    rows_written = 0
+    run.retrying.add(table)
+    try:
+        with db.transaction(conn):
+            held = retry.take(cur, table, step_read_options(step))
+            for df in held:
+                rows_written += step.load(cur, run, step.transform(df))
+    finally:
+        run.retrying.discard(table)
+        cur.close()
+    if held:
+        rows_held = sum(len(df) for df in held)
+        logger.info(f"{table}: loaded {rows_written} of {rows_held} held rows")
+    return rows_written
+
+
+def run_stage(conn, run, stage):
+    logger.info(f"Start ETL {stage}")
+    stage_metrics = StageMetrics(stage)
+    run.stage_metrics.append(stage_metrics)
+    started = time.perf_counter()
+    table = DIMENSION_STAGES.get(stage, FACT_STAGES.get(stage))
+    cur = conn.cursor()
+    for step in STAGES[stage]:
+        rows_done, completed = run.checkpoints.get((stage, step.source), (0, False))
+        if completed:
+            logger.info(f"Skipping {stage} {step.source}, loaded before resuming")
+            continue
+        # Before the new rows, which are newer than the held ones
+        if run.incremental and table is not None:
+            with stage_metrics.phase("load"):
+                stage_metrics.rows_written += load_held_rows(conn, run, table, step)
+        sharded = stage in FACT_STAGES and run.fact_shards > 1
+        if sharded:
+            rows_done = sharding.rows_done(run, stage, step.source)
+        rows_to_skip = rows_done
+
+        # Each stage keeps its own watermark per source file
+        watermark_source = f"{stage}.{step.source}"
+        path = source_path(step.source)
+        if run.incremental:
+            offset, end = watermark.pending_range(cur, watermark_source, path)
+        else:
+            offset, end = 0, os.path.getsize(path)
+
+        frames, transform = step_frames(run, step, offset)
+        if run.pipelined:
+            # Waiting for the next cleaned chunk is counted as extract
+            frames = pipeline.pipelined(
+                frames, transform, stage_metrics, ETL_PIPELINE_QUEUE_SIZE
+            )
+            transform = None
+
+        # Closing the frames stops the pipeline threads when a load fails
+        with closing(frames):
+            if offset < end:
+                # The shards are forked before the pipeline threads start
+                shards = (
+                    sharding.ShardedLoad(run, stage, step, stage_metrics, reject_rows)
+                    if sharded
+                    else None
                 )
+                try:
+                    for df in stage_metrics.extract(frames):
+                        if transform is not None:
+                            with stage_metrics.phase("transform"):
+                                df = transform(df)
+                        # Checkpoints count cleaned rows, they do not depend on
+                        # how the file was chunked or whether it came from the
+                        # cache
+                        if rows_to_skip:
+                            df, rows_to_skip = checkpoint.skip_rows(df, rows_to_skip)
+                            if df.empty:
+                                continue
+                        with stage_metrics.phase("load"):
+                            if shards is not None:
+                                create_fact_partitions(
+                                    conn, run, FACT_STAGES[stage], df
+                                )
+                                # Each shard saves its own checkpoint
+                                shards.send(df, rows_done)
+                                rows_done += len(df)
+                            else:
+                                with db.transaction(conn):
+                                    stage_metrics.rows_written += step.load(
+                                        cur, run, df
+                                    )
+                                    checkpoint.save(
+                                        cur, stage, step.source, rows_done + len(df)
+                                    )
+                                rows_done += len(df)
+                    if shards is not None:
+                        with stage_metrics.phase("load"):
+                            shards.finish()
+                finally:
+                    if shards is not None:
+                        shards.close()
+        with db.transaction(conn):
+            # Reloading a partition reads the whole file, which does not say
+            # anything about how far the other months were loaded
+            if run.partition is None:
+                watermark.save(cur, watermark_source, path, end)
+            checkpoint.save(cur, stage, step.source, rows_done, completed=True)
+    cur.close()
+    stage_metrics.wall_seconds = time.perf_counter() - started
+    if table in run.rejected:
+        stage_metrics.rows_rejected = run.rejected[table]
+        logger.warning(
+            f"{table}: {stage_metrics.rows_rejected} rows rejected, see "
+            f"{validation.quarantine_path(table)}"
+        )
+    if table in run.dimension_changes:
+        stage_metrics.changes = run.dimension_changes[table]
+        logger.info(
+            f"{table}: "
+            + ", ".join(
+                f"{rows} {change}" for change, rows in stage_metrics.changes.items()
             )
-
-    insert_data(cur, fact_feedback_table_insert, feedback_data_to_insert)
+        )
+    logger.info(f"Number of inserted rows: {stage_metrics.rows_written}")
+    logger.info(f"End ETL {stage}")
+    return stage_metrics.rows_written
+
+
+def main(
+    chunk_size=ETL_CHUNK_SIZE,
+    incremental=False,
+    workers=ETL_WORKERS,
+    staging_cache=ETL_STAGING_CACHE,
+    partition=None,
+    pushdown_mode=False,
+    resume=False,
+    pipelined=ETL_PIPELINE,
+    infer_members=ETL_INFER_MEMBERS,
+    fact_shards=ETL_FACT_SHARDS,
+):
+    dsn = db.dsn(session=db.LOAD_SESSION)
+    conn = db.connect(dsn)
+    cur = conn.cursor()
+    if resume:
+        options = checkpoint.interrupted_run(cur)
+        if options is None:
+            logger.info("The last ETL run finished, there is nothing to resume")
+            conn.close()
+            return
+        logger.info(f"Resuming the interrupted ETL run {options}")
+        incremental = options["incremental"]
+        partition = options["partition"]
+        pushdown_mode = options["pushdown_mode"]
+        infer_members = options.get("infer_members", False)
+        # Each shard resumes from its own checkpoint
+        fact_shards = options.get("fact_shards", 1)
+    # Pushdown copies whole files, it cannot start at their watermarks
+    if pushdown_mode and incremental:
+        raise ValueError("Only full loads run in pushdown mode")
+    if pushdown_mode and partition is not None:
+        raise ValueError("A partition cannot be reloaded in pushdown mode")
+    if pushdown_mode and infer_members:
+        raise ValueError("Members cannot be inferred in pushdown mode")
+    if fact_shards > 1 and pushdown_mode:
+        raise ValueError("The facts cannot be sharded in pushdown mode")
+    # Forking the shard processes while other stages run on threads could copy
+    # locks those threads hold
+    if fact_shards > 1 and workers > 1:
+        raise ValueError("The facts cannot be sharded with more than one worker")
+
+    run = EtlRun(
+        chunk_size,
+        incremental and partition is None,
+        staging_cache,
+        partition,
+        pipelined and not pushdown_mode,
+        infer_members,
+        fact_shards,
+        dsn,
+    )
+    if resume:
+        run.checkpoints = checkpoint.load(cur)
+    else:
+        checkpoint.start(
+            cur,
+            {
+                "incremental": run.incremental,
+                "partition": partition,
+                "pushdown_mode": pushdown_mode,
+                "infer_members": infer_members,
+                "fact_shards": fact_shards,
+            },
+        )
     conn.commit()
-    cur.execute("SELECT COUNT(*) FROM fact_feedback")
-    number_of_inserted_rows = cur.fetchone()[0]
-    logger.info(f"Number of inserted rows: {number_of_inserted_rows}")
-    logger.info("End ETL feedback")
-
+    logger.info("Start ETL process")
+    if run.incremental:
+        logger.info("Loading only rows added since the last watermark")
+    if chunk_size and not pushdown_mode:
+        logger.info(f"Streaming source files in chunks of {chunk_size} rows")
+    if run.pipelined:
+        logger.info("Parsing, cleaning and writing chunks on separate threads")
+    if run.infer_members:
+        logger.info("Loading inferred members for keys that are not loaded yet")
+    if run.fact_shards > 1:
+        logger.info(f"Loading every fact stage on {run.fact_shards} processes")
+
+    run.partitioned_tables = partitions.partitioned_tables(cur)
+    run.smart_date_keys = uses_smart_date_keys(cur)
+    if run.smart_date_keys:
+        logger.info("Computing date keys from the dates instead of looking them up")
+        run.key_cache.computed["date"] = smart_date_key
+    # Pushdown resolves the keys inside the database instead
+    if not pushdown_mode:
+        for dimension in run.key_cache.maps:
+            run.key_cache.load(cur, dimension)
+    cur.close()
+
+    stage_task = run_stage
+    sources = sorted({step.source for steps in STAGES.values() for step in steps})
+    if pushdown_mode:
+        logger.info("Cleaning and loading the source files inside the database")
+        pushdown.load_raw(
+            conn, run, {source: source_path(source) for source in sources}
+        )
+        stage_task = pushdown.run_stage
+
+    stages = STAGES
+    if partition is not None:
+        # Only the facts are reloaded, against the dimensions already loaded
+        if not set(FACT_STAGES.values()) <= run.partitioned_tables:
+            raise ValueError("The fact tables are not partitioned")
+        logger.info(f"Reloading partition {partition}")
+        if not resume:
+            partitions.truncate(conn, FACT_STAGES.values(), partition)
+        stages = list(FACT_STAGES)
+    dependencies = {
+        stage: [
+            waits_for for waits_for in STAGE_DEPENDENCIES[stage] if waits_for in stages
+        ]
+        for stage in stages
+    }
+
+    # A full load rebuilds every table, so indexes and foreign keys are built
+    # once afterwards instead of being maintained row by row
+    if run.incremental or partition:
+        dropped = None
+    else:
+        dropped = indexes.drop(conn)
+        cur = conn.cursor()
+        if resume:
+            # Whatever the interrupted run dropped is already gone
+            stored_indexes, stored_foreign_keys = checkpoint.dropped(cur)
+            dropped = (
+                stored_indexes
+                + [index for index in dropped[0] if index not in stored_indexes],
+                stored_foreign_keys
+                + [key for key in dropped[1] if key not in stored_foreign_keys],
+            )
+        checkpoint.save_dropped(cur, *dropped)
+        conn.commit()
+        cur.close()
+    try:
+        if workers > 1:
+            logger.info(f"Running independent stages on {workers} workers")
+            pool = db.pool(1, workers, dsn)
+            try:
+                scheduler.run_jobs(
+                    pool,
+                    lambda stage_conn, stage: stage_task(stage_conn, run, stage),
+                    dependencies,
+                    workers,
+                )
+            finally:
+                pool.closeall()
+        else:
+            for stage in stages:
+                stage_task(conn, run, stage)
+    finally:
+        if pushdown_mode:
+            conn.rollback()
+            pushdown.drop_raw(conn, sources)
+        if dropped is not None:
+            conn.rollback()
+            indexes.restore(conn, *dropped)
+        write_report(run.started_at, run.stage_metrics, REPORT_DIR)
+
+    # Rows changed in place and replaced inferred orders change totals that
+    # were already summarized, only added rows can be folded in
+    summaries.refresh(
+        conn,
+        run.incremental and not run.resolved_orders and not rows_updated(run),
+    )
+    # Invalidates the business question results cached before this load
+    cur = conn.cursor()
+    cur.execute(etl_data_version_upsert, (uuid.uuid4().hex,))
+    checkpoint.finish(cur)
     conn.commit()
     conn.close()
     logger.info("Finished ETL process successfully")
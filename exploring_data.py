@@ -1,17 +1,216 @@
-import pandas as pd
+# Profiles every CSV file of DATASET_DIR in a single streaming pass, one file
+# per process, and writes data_preprocessing.txt and data_profile.json.
+# Distinct values are estimated with HyperLogLog sketches of a fixed size.
+# Duplicated rows are estimated with a Bloom filter sized for the estimated
+# rows of each file, about 1.8 bytes per row, a small fraction of the file.
+# python exploring_data.py [--chunk-size 100000] [--workers 4]
+import argparse
+import json
 import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import staging
+from settings import DATASET_DIR
+from sketches import BloomFilter, HyperLogLog, comparable, hash_rows
+
+PROFILE_CHUNK_SIZE = 100_000
+# Bytes read from the start of a file to estimate its number of rows
+ROW_ESTIMATE_SAMPLE = 2**20
+# Strings checked before parsing a whole chunk as dates
+DATE_SAMPLE_SIZE = 100
+
+
+def estimate_rows(path):
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        sample = f.read(ROW_ESTIMATE_SAMPLE)
+    lines = max(sample.count(b"\n"), 1)
+    if len(sample) == size:
+        return lines
+    # Some room for rows shorter than the ones sampled
+    return int(size / len(sample) * lines * 1.5)
+
+
+def scalar(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def kind_of(values):
+    kind = pd.api.types.infer_dtype(values, skipna=True)
+    if kind == "floating" and (values % 1 == 0).all():
+        return "integer"
+    if kind == "mixed-integer-float":
+        return "floating"
+    return kind
+
+
+def combine_kinds(kinds, date_values, string_values):
+    kinds = kinds - {"empty"}
+    if not kinds:
+        return "empty"
+    if kinds == {"string"} and date_values == string_values:
+        return "datetime"
+    if kinds <= {"integer", "floating"}:
+        return "floating" if "floating" in kinds else "integer"
+    return kinds.pop() if len(kinds) == 1 else "mixed"
+
+
+class ColumnProfile:
+    def __init__(self):
+        self.nulls = 0
+        self.minimum = None
+        self.maximum = None
+        self.kinds = set()
+        self.pandas_dtypes = set()
+        self.string_values = 0
+        self.date_values = 0
+        self.distinct = HyperLogLog()
+
+    def _bounds(self, values):
+        minimum, maximum = scalar(values.min()), scalar(values.max())
+        if self.minimum is None:
+            return minimum, maximum
+        try:
+            return min(self.minimum, minimum), max(self.maximum, maximum)
+        except TypeError:
+            # Numbers in one chunk and strings in another
+            return (
+                min(str(self.minimum), str(minimum)),
+                max(str(self.maximum), str(maximum)),
+            )
+
+    def update(self, values):
+        self.pandas_dtypes.add(str(values.dtype))
+        present = values.dropna()
+        self.nulls += len(values) - len(present)
+        values = present
+        if values.empty:
+            return
+        kind = kind_of(values)
+        self.kinds.add(kind)
+        if kind == "mixed":
+            values = values.astype(str)
+        if kind == "string":
+            self.string_values += len(values)
+            sample = values.iloc[:DATE_SAMPLE_SIZE]
+            if pd.to_datetime(sample, errors="coerce", format="ISO8601").notna().all():
+                self.date_values += (
+                    pd.to_datetime(values, errors="coerce", format="ISO8601")
+                    .notna()
+                    .sum()
+                )
+        self.minimum, self.maximum = self._bounds(values)
+        self.distinct.add(comparable(values))
+
+    def as_dict(self):
+        return {
+            "dtype": combine_kinds(
+                set(self.kinds), self.date_values, self.string_values
+            ),
+            "pandas_dtypes": sorted(self.pandas_dtypes),
+            "nulls": self.nulls,
+            "min": self.minimum,
+            "max": self.maximum,
+            "approximate_distinct": self.distinct.count(),
+        }
+
+
+def profile_file(path, chunk_size=PROFILE_CHUNK_SIZE):
+    start = time.perf_counter()
+    chunks = pd.read_csv(path, chunksize=chunk_size)
+    columns = {}
+    rows = 0
+    duplicates = 0
+    seen_rows = BloomFilter(estimate_rows(path))
+    for chunk in staging.staged_frames(path, chunks, chunk_size=chunk_size):
+        rows += len(chunk)
+        for name, values in chunk.items():
+            columns.setdefault(name, ColumnProfile()).update(values)
+
+        row_hashes = hash_rows(chunk)
+        repeated = pd.Series(row_hashes).duplicated().to_numpy()
+        duplicates += int(repeated.sum())
+        duplicates += int(seen_rows.add_hashes(row_hashes[~repeated]).sum())
+
+    return {
+        "dataset": os.path.splitext(os.path.basename(path))[0],
+        "path": path,
+        "rows": rows,
+        "columns": len(columns),
+        "nulls": sum(column.nulls for column in columns.values()),
+        "approximate_duplicates": duplicates,
+        # Chance of a row being counted as a duplicate when it is not
+        "duplicate_error_rate": seen_rows.error_rate,
+        "seconds": round(time.perf_counter() - start, 3),
+        "column_profiles": {name: column.as_dict() for name, column in columns.items()},
+    }
+
+
+def profile_dataset(dataset_dir=DATASET_DIR, chunk_size=PROFILE_CHUNK_SIZE, workers=1):
+    paths = sorted(
+        os.path.join(dataset_dir, name)
+        for name in os.listdir(dataset_dir)
+        if name.endswith(".csv")
+    )
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(profile_file, paths, [chunk_size] * len(paths)))
+
+
+def write_text_report(profiles, path):
+    with open(path, "w") as f:
+        for profile in profiles:
+            column_profiles = profile["column_profiles"]
+            f.write(f"Dataset Name: {profile['dataset']}\n")
+            f.write(f"Number of rows: {profile['rows']}\n")
+            f.write(f"Number of columns: {profile['columns']}\n")
+            f.write(f"Columns: {list(column_profiles)}\n")
+            f.write(
+                "Columns data types: "
+                f"{[column['dtype'] for column in column_profiles.values()]}\n"
+            )
+            f.write(f"Number of null values: {profile['nulls']}\n")
+            f.write(
+                f"Number of duplicates (approximate, "
+                f"{profile['duplicate_error_rate']:.1%} false positive rate): "
+                f"{profile['approximate_duplicates']}\n"
+            )
+            f.write("Number of unique values for each column (approximate):\n")
+            for name, column in column_profiles.items():
+                f.write(
+                    f"  {name}: {column['approximate_distinct']} unique, "
+                    f"{column['nulls']} null, "
+                    f"min {column['min']}, max {column['max']}\n"
+                )
+            f.write("\n")
+
+
+def write_json_report(profiles, path):
+    with open(path, "w") as f:
+        json.dump(
+            {"dataset_dir": DATASET_DIR, "files": profiles},
+            f,
+            indent=2,
+            default=str,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunk-size", type=int, default=PROFILE_CHUNK_SIZE)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="profile this many files at the same time, each in its own process",
+    )
+    parser.add_argument("--output", default="data_preprocessing.txt")
+    parser.add_argument("--report", default="data_profile.json")
+    args = parser.parse_args()
 
-with open('data_preprocessing.txt', 'w') as f:
-    for file_path in os.listdir('ecommerce_dataset'):
-
-        if file_path.endswith('.csv'):
-            data_set_name = file_path.split('.')[0]
-            df = pd.read_csv(f'ecommerce_dataset/{file_path}')
-            f.write(f'Dataset Name: {data_set_name}\n')
-            f.write(f'Number of rows: {df.shape[0]}\n')
-            f.write(f'Number of columns: {df.shape[1]}\n')
-            f.write(f'Columns: {df.columns.to_list()}\n')
-            f.write(f'Columns data types: {df.dtypes.to_list()}\n')
-            f.write(f'Number of null values: {df.isnull().sum().sum()}\n')
-            f.write(f'Number of duplicates: {df.duplicated().sum()}\n')
-            f.write(f'Number of unique values for each column: {df.nunique()}\n')
+    profiles = profile_dataset(DATASET_DIR, args.chunk_size, args.workers)
+    write_text_report(profiles, args.output)
+    write_json_report(profiles, args.report)
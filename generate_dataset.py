@@ -0,0 +1,245 @@
+# Writes a synthetic, referentially consistent copy of ecommerce_dataset/
+# with the columns etl.py reads. Scale 1 is roughly the size of the original
+# extract (about 100k orders), orders are written in batches so large scales
+# do not need to fit in memory.
+# python generate_dataset.py --scale 2 --output /tmp/ecommerce_dataset
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+CUSTOMERS_PER_SCALE = 100_000
+SELLERS_PER_SCALE = 3_000
+PRODUCTS_PER_SCALE = 33_000
+ORDERS_PER_SCALE = 100_000
+ORDER_BATCH_SIZE = 100_000
+
+STATES = [
+    "ACEH",
+    "BALI",
+    "BANTEN",
+    "DI YOGYAKARTA",
+    "DKI JAKARTA",
+    "JAWA BARAT",
+    "JAWA TENGAH",
+    "JAWA TIMUR",
+    "KALIMANTAN BARAT",
+    "KALIMANTAN TIMUR",
+    "LAMPUNG",
+    "NUSA TENGGARA BARAT",
+    "RIAU",
+    "SULAWESI SELATAN",
+    "SUMATERA BARAT",
+    "SUMATERA SELATAN",
+    "SUMATERA UTARA",
+]
+CITIES_PER_STATE = 20
+CATEGORIES = [
+    "bed_bath_table",
+    "health_beauty",
+    "sports_leisure",
+    "furniture_decor",
+    "computers_accessories",
+    "housewares",
+    "watches_gifts",
+    "telephony",
+    "garden_tools",
+    "auto",
+    "toys",
+    "cool_stuff",
+]
+ORDER_STATUSES = ["delivered", "shipped", "canceled", "processing", "invoiced"]
+ORDER_STATUS_WEIGHTS = [0.95, 0.02, 0.01, 0.01, 0.01]
+PAYMENT_TYPES = ["credit_card", "boleto", "voucher", "debit_card", "not_defined"]
+PAYMENT_TYPE_WEIGHTS = [0.74, 0.19, 0.05, 0.0199, 0.0001]
+FIRST_ORDER_DATE = pd.Timestamp("2016-09-01")
+ORDER_DATE_RANGE_SECONDS = 2 * 365 * 24 * 3600
+
+
+def ids(prefix, start, count):
+    return [f"{prefix}{i:09d}" for i in range(start, start + count)]
+
+
+def locations(rng, count):
+    states = rng.choice(STATES, count)
+    cities = [
+        f"{state} CITY {i}"
+        for state, i in zip(states, rng.integers(1, CITIES_PER_STATE + 1, count))
+    ]
+    return rng.integers(10_000, 99_999, count), cities, states
+
+
+def with_nulls(rng, values, rate):
+    values = pd.Series(values)
+    return values.mask(rng.random(len(values)) < rate)
+
+
+def customers(rng, count):
+    zip_codes, cities, states = locations(rng, count)
+    return pd.DataFrame(
+        {
+            "user_name": ids("user", 0, count),
+            "customer_zip_code": zip_codes,
+            "customer_city": cities,
+            "customer_state": states,
+        }
+    )
+
+
+def sellers(rng, count):
+    zip_codes, cities, states = locations(rng, count)
+    return pd.DataFrame(
+        {
+            "seller_id": ids("seller", 0, count),
+            "seller_zip_code": zip_codes,
+            "seller_city": cities,
+            "seller_state": states,
+        }
+    )
+
+
+def products(rng, count):
+    return pd.DataFrame(
+        {
+            "product_id": ids("product", 0, count),
+            "product_category": with_nulls(rng, rng.choice(CATEGORIES, count), 0.02),
+            "product_name_lenght": with_nulls(rng, rng.integers(5, 77, count), 0.02),
+            "product_description_lenght": with_nulls(
+                rng, rng.integers(4, 3_993, count), 0.02
+            ),
+            "product_photos_qty": with_nulls(rng, rng.integers(1, 21, count), 0.02),
+            "product_weight_g": rng.integers(50, 30_000, count),
+            "product_length_cm": rng.integers(7, 105, count),
+            "product_height_cm": rng.integers(2, 105, count),
+            "product_width_cm": rng.integers(6, 118, count),
+        }
+    )
+
+
+def order_batch(rng, start, count, customer_count, seller_count, product_count):
+    order_ids = pd.Series(ids("order", start, count))
+    order_date = FIRST_ORDER_DATE + pd.to_timedelta(
+        rng.integers(0, ORDER_DATE_RANGE_SECONDS, count), unit="s"
+    )
+    approved = order_date + pd.to_timedelta(rng.integers(60, 2 * 86_400, count), "s")
+    pickup = approved + pd.to_timedelta(rng.integers(3_600, 5 * 86_400, count), "s")
+    delivered = pickup + pd.to_timedelta(rng.integers(86_400, 20 * 86_400, count), "s")
+    estimated = order_date + pd.to_timedelta(rng.integers(7, 40, count), "D")
+    orders = pd.DataFrame(
+        {
+            "order_id": order_ids,
+            "user_name": [
+                f"user{i:09d}" for i in rng.integers(0, customer_count, count)
+            ],
+            "order_status": rng.choice(ORDER_STATUSES, count, p=ORDER_STATUS_WEIGHTS),
+            "order_date": order_date,
+            "order_approved_date": with_nulls(rng, approved, 0.002),
+            "pickup_date": with_nulls(rng, pickup, 0.02),
+            "delivered_date": with_nulls(rng, delivered, 0.03),
+            "estimated_time_delivery": estimated.floor("D"),
+        }
+    )
+
+    items_per_order = rng.choice([1, 2, 3, 4], count, p=[0.88, 0.08, 0.03, 0.01])
+    item_order = np.repeat(np.arange(count), items_per_order)
+    item_count = len(item_order)
+    order_items = pd.DataFrame(
+        {
+            "order_id": order_ids.values[item_order],
+            "order_item_id": pd.Series(item_order).groupby(item_order).cumcount() + 1,
+            "product_id": [
+                f"product{i:09d}" for i in rng.integers(0, product_count, item_count)
+            ],
+            "seller_id": [
+                f"seller{i:09d}" for i in rng.integers(0, seller_count, item_count)
+            ],
+            "pickup_limit_date": approved[item_order]
+            + pd.to_timedelta(rng.integers(86_400, 7 * 86_400, item_count), "s"),
+            "price": rng.gamma(2.0, 60.0, item_count).round(2) + 1,
+            "shipping_cost": rng.gamma(2.0, 10.0, item_count).round(2),
+        }
+    )
+
+    payments_per_order = rng.choice([1, 2], count, p=[0.97, 0.03])
+    payment_order = np.repeat(np.arange(count), payments_per_order)
+    payment_count = len(payment_order)
+    payments = pd.DataFrame(
+        {
+            "order_id": order_ids.values[payment_order],
+            "payment_sequential": pd.Series(payment_order)
+            .groupby(payment_order)
+            .cumcount()
+            + 1,
+            "payment_type": rng.choice(
+                PAYMENT_TYPES, payment_count, p=PAYMENT_TYPE_WEIGHTS
+            ),
+            "payment_installments": rng.integers(1, 11, payment_count),
+            "payment_value": rng.gamma(2.0, 80.0, payment_count).round(2),
+        }
+    )
+
+    sent = delivered.floor("D") + pd.Timedelta(days=1)
+    feedback = pd.DataFrame(
+        {
+            "feedback_id": ids("feedback", start, count),
+            "order_id": order_ids,
+            "feedback_score": rng.choice(
+                [1, 2, 3, 4, 5], count, p=[0.11, 0.03, 0.08, 0.19, 0.59]
+            ),
+            "feedback_form_sent_date": sent,
+            "feedback_answer_date": with_nulls(
+                rng,
+                sent + pd.to_timedelta(rng.integers(3_600, 10 * 86_400, count), "s"),
+                0.01,
+            ),
+        }
+    )
+    return orders, order_items, payments, feedback
+
+
+def generate(output, scale=1.0, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(output, exist_ok=True)
+    customer_count = max(1, int(CUSTOMERS_PER_SCALE * scale))
+    seller_count = max(1, int(SELLERS_PER_SCALE * scale))
+    product_count = max(1, int(PRODUCTS_PER_SCALE * scale))
+    order_count = max(1, int(ORDERS_PER_SCALE * scale))
+
+    customers(rng, customer_count).to_csv(
+        os.path.join(output, "user_dataset.csv"), index=False
+    )
+    sellers(rng, seller_count).to_csv(
+        os.path.join(output, "seller_dataset.csv"), index=False
+    )
+    products(rng, product_count).to_csv(
+        os.path.join(output, "products_dataset.csv"), index=False
+    )
+
+    names = ["order", "order_item", "payment", "feedback"]
+    for start in range(0, order_count, ORDER_BATCH_SIZE):
+        frames = order_batch(
+            rng,
+            start,
+            min(ORDER_BATCH_SIZE, order_count - start),
+            customer_count,
+            seller_count,
+            product_count,
+        )
+        for name, df in zip(names, frames):
+            df.to_csv(
+                os.path.join(output, f"{name}_dataset.csv"),
+                mode="w" if start == 0 else "a",
+                header=start == 0,
+                index=False,
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--output", default="ecommerce_dataset")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate(args.output, args.scale, args.seed)
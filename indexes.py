@@ -0,0 +1,66 @@
+import logging
+import time
+
+from quires import load_tables, select_foreign_keys, select_secondary_indexes
+
+logger = logging.getLogger(__name__)
+
+
+# Drops the secondary indexes and foreign keys of the loaded tables so a bulk
+# load does not maintain them row by row. Primary keys and unique natural keys
+# are kept, the merges rely on them. Returns what restore() needs to rebuild
+# them.
+def drop(conn):
+    cur = conn.cursor()
+    cur.execute(select_secondary_indexes, (load_tables,))
+    indexes = cur.fetchall()
+    cur.execute(select_foreign_keys, (load_tables,))
+    foreign_keys = cur.fetchall()
+
+    for table, name, _ in foreign_keys:
+        cur.execute(f"ALTER TABLE {table} DROP CONSTRAINT {name}")
+    for name, _ in indexes:
+        cur.execute(f"DROP INDEX {name}")
+    conn.commit()
+    cur.close()
+    logger.info(
+        f"Dropped {len(indexes)} indexes and {len(foreign_keys)} foreign keys "
+        "before loading"
+    )
+    return indexes, foreign_keys
+
+
+def restore(conn, indexes, foreign_keys):
+    cur = conn.cursor()
+    start = time.perf_counter()
+    for name, definition in indexes:
+        index_start = time.perf_counter()
+        # Indexes of partitioned tables are defined ON ONLY the parent, which
+        # would leave the partitions without them
+        cur.execute(definition.replace(" ON ONLY ", " ON ", 1))
+        logger.info(
+            f"Built index {name} in {time.perf_counter() - index_start:.3f} seconds"
+        )
+    for table, name, definition in foreign_keys:
+        constraint_start = time.perf_counter()
+        cur.execute(f"ALTER TABLE {table} ADD CONSTRAINT {name} {definition}")
+        logger.info(
+            f"Validated foreign key {name} in "
+            f"{time.perf_counter() - constraint_start:.3f} seconds"
+        )
+    conn.commit()
+    logger.info(
+        f"Rebuilt {len(indexes)} indexes and {len(foreign_keys)} foreign keys in "
+        f"{time.perf_counter() - start:.3f} seconds"
+    )
+    analyze(conn)
+
+
+def analyze(conn):
+    start = time.perf_counter()
+    cur = conn.cursor()
+    for table in load_tables:
+        cur.execute(f"ANALYZE {table}")
+    conn.commit()
+    cur.close()
+    logger.info(f"Analyzed tables in {time.perf_counter() - start:.3f} seconds")
@@ -0,0 +1,110 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from quires import (
+    select_customer_keys,
+    select_customer_keys_in,
+    select_date_keys,
+    select_date_keys_in,
+    select_order_keys,
+    select_order_keys_in,
+    select_order_month_keys,
+    select_order_month_keys_in,
+    select_product_keys,
+    select_product_keys_in,
+    select_seller_keys,
+    select_seller_keys_in,
+)
+
+# dimension -> (query fetching every key, query fetching a given set of keys)
+KEY_QUERIES = {
+    "customer": (select_customer_keys, select_customer_keys_in),
+    "seller": (select_seller_keys, select_seller_keys_in),
+    "product": (select_product_keys, select_product_keys_in),
+    "date": (select_date_keys, select_date_keys_in),
+    "order": (select_order_keys, select_order_keys_in),
+    "order_month": (select_order_month_keys, select_order_month_keys_in),
+}
+
+
+def _to_db_values(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return [value.to_pydatetime() for value in values]
+    return list(values)
+
+
+# In-memory natural_key -> surrogate id maps for the dimension tables.
+# Maps are replaced rather than changed in place, so stages running in other
+# threads keep resolving against a consistent snapshot. The ids of the
+# dimensions in `computed` are computed from their natural keys instead, their
+# maps only record which keys are loaded.
+class KeyCache:
+    def __init__(self):
+        self.maps = {dimension: {} for dimension in KEY_QUERIES}
+        self.computed = {}
+        self.lock = threading.Lock()
+        self._lookups = {}
+
+    def load(self, cur, dimension):
+        cur.execute(KEY_QUERIES[dimension][0])
+        self.maps[dimension] = dict(cur.fetchall())
+
+    def add(self, cur, dimension, keys):
+        keys = pd.Series(keys).dropna().drop_duplicates()
+        if keys.empty:
+            return
+        cur.execute(KEY_QUERIES[dimension][1], (_to_db_values(keys),))
+        self.update(dimension, dict(cur.fetchall()))
+
+    # Adds keys whose ids are already known without querying them
+    def update(self, dimension, key_map):
+        with self.lock:
+            self.maps[dimension] = {**self.maps[dimension], **key_map}
+
+    def missing(self, dimension, values):
+        values = pd.Series(values).dropna().drop_duplicates()
+        keys, _ = self._lookup(dimension)
+        return values[keys.get_indexer(values) == -1]
+
+    # Mask of the values whose key is loaded
+    def known(self, dimension, values):
+        if dimension in self.computed:
+            return values.notna().to_numpy()
+        keys, _ = self._lookup(dimension)
+        return keys.get_indexer(values) != -1
+
+    # Series.map converts the whole dict to a Series on every call, an Index
+    # built once per version of the map is looked up directly instead
+    def _lookup(self, dimension):
+        key_map = self.maps[dimension]
+        cached = self._lookups.get(dimension)
+        if cached is None or cached[0] is not key_map:
+            cached = (
+                key_map,
+                pd.Index(list(key_map)),
+                # get_indexer returns -1 for unknown keys, which picks the
+                # trailing NaN
+                np.append(
+                    np.fromiter(key_map.values(), dtype="float64", count=len(key_map)),
+                    np.nan,
+                ),
+            )
+            self._lookups[dimension] = cached
+        return cached[1], cached[2]
+
+    def resolve(self, dimension, values):
+        if dimension in self.computed:
+            return self.computed[dimension](values)
+        keys, ids = self._lookup(dimension)
+        return pd.Series(ids[keys.get_indexer(values)], index=values.index)
+
+    # keys maps each output column to a (dimension, source_column) pair,
+    # rows with a natural key that is not in the dimension are dropped
+    def resolve_keys(self, df, keys):
+        df = df.copy()
+        for column, (dimension, source_column) in keys.items():
+            df[column] = self.resolve(dimension, df[source_column])
+        df = df.dropna(subset=list(keys))
+        return df.astype({column: "int64" for column in keys})
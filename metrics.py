@@ -0,0 +1,104 @@
+import csv
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import psutil
+
+from schemas import memory_report
+
+PHASES = ["extract", "transform", "load"]
+# How the rows of a dimension stage compared with the rows already loaded
+DIMENSION_CHANGES = ["inserted", "updated", "unchanged"]
+
+
+# Timings, row counts and memory of one ETL stage. The peak RSS is sampled
+# after every phase of every chunk and covers the whole process, so stages
+# that run in parallel see each other's memory.
+class StageMetrics:
+    def __init__(self, stage):
+        self.stage = stage
+        self.seconds = {phase: 0.0 for phase in PHASES}
+        self.wall_seconds = 0.0
+        self.rows_read = 0
+        self.rows_written = 0
+        # Rows quarantined by validation instead of being loaded
+        self.rows_rejected = 0
+        self.peak_rss = 0
+        # Largest frame extracted, see schemas.memory_report
+        self.peak_frame_bytes = 0
+        # {change: rows} of a dimension stage, see DIMENSION_CHANGES
+        self.changes = None
+        self._process = psutil.Process()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+            self.peak_rss = max(self.peak_rss, self._process.memory_info().rss)
+
+    def extract(self, chunks):
+        chunks = iter(chunks)
+        while True:
+            with self.phase("extract"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                return
+            self.rows_read += len(chunk)
+            self.peak_frame_bytes = max(
+                self.peak_frame_bytes, int(memory_report(chunk).sum())
+            )
+            yield chunk
+
+    def as_dict(self):
+        return {
+            "stage": self.stage,
+            **{f"{phase}_seconds": round(self.seconds[phase], 3) for phase in PHASES},
+            "wall_seconds": round(self.wall_seconds, 3),
+            "rows_read": self.rows_read,
+            # The date stage writes one row per distinct date rather than per
+            # row read, so it can write more rows than it reads
+            "rows_dropped": max(self.rows_read - self.rows_written, 0),
+            "rows_rejected": self.rows_rejected,
+            "rows_written": self.rows_written,
+            **{
+                f"rows_{change}": (self.changes or {}).get(change)
+                for change in DIMENSION_CHANGES
+            },
+            "rows_per_second": (
+                round(self.rows_written / self.wall_seconds, 1)
+                if self.wall_seconds
+                else 0.0
+            ),
+            "peak_rss_mb": round(self.peak_rss / 2**20, 1),
+            "peak_frame_mb": round(self.peak_frame_bytes / 2**20, 1),
+        }
+
+
+# Appends the run to a JSON lines file (one object per run) and a CSV file
+# (one row per stage), both next to pipeline.log
+def write_report(started_at, stage_metrics, report_dir):
+    stages = [metrics.as_dict() for metrics in stage_metrics]
+    if not stages:
+        return
+    run = {
+        "started_at": started_at.isoformat(timespec="seconds"),
+        "finished_at": datetime.now().isoformat(timespec="seconds"),
+        "stages": stages,
+    }
+    with open(os.path.join(report_dir, "pipeline_metrics.jsonl"), "a") as f:
+        f.write(json.dumps(run) + "\n")
+
+    csv_path = os.path.join(report_dir, "pipeline_metrics.csv")
+    write_header = not os.path.exists(csv_path)
+    with open(csv_path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["started_at"] + list(stages[0]))
+        if write_header:
+            writer.writeheader()
+        for stage in stages:
+            writer.writerow({"started_at": run["started_at"], **stage})
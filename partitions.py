@@ -0,0 +1,54 @@
+import logging
+
+from bulk_load import copy_frame
+from quires import select_partitioned_tables
+
+logger = logging.getLogger(__name__)
+
+
+def partitioned_tables(cur):
+    cur.execute(select_partitioned_tables)
+    return {row[0] for row in cur.fetchall()}
+
+
+def partition_name(table, month):
+    return f"{table}_{month}"
+
+
+# Months are YYYYMM integers, a partition holds [month, next month)
+def next_month(month):
+    year, month = divmod(month, 100)
+    return (year + 1) * 100 + 1 if month == 12 else year * 100 + month + 1
+
+
+def create(cur, table, month):
+    cur.execute(
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, month)} "
+        f"PARTITION OF {table} FOR VALUES FROM ({month}) TO ({next_month(month)})"
+    )
+
+
+# `created` holds the partitions this run already made sure exist
+def create_missing(cur, table, months, created):
+    for month in months:
+        month = int(month)
+        if (table, month) not in created:
+            create(cur, table, month)
+            created.add((table, month))
+
+
+# Copies every month of `df` straight into its partition, skipping the
+# routing through the parent table
+def copy_partitioned(cur, table, df):
+    for month, month_df in df.groupby("order_month"):
+        copy_frame(cur, partition_name(table, int(month)), month_df)
+
+
+def truncate(conn, tables, month):
+    cur = conn.cursor()
+    for table in tables:
+        create(cur, table, month)
+        cur.execute(f"TRUNCATE {partition_name(table, month)}")
+        logger.info(f"Truncated {partition_name(table, month)}")
+    conn.commit()
+    cur.close()
@@ -0,0 +1,102 @@
+import logging
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Seconds a blocked thread waits before checking whether it should stop
+POLL_SECONDS = 0.1
+
+_DONE = object()
+
+
+class _Failed:
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(items, item, stop):
+    while not stop.is_set():
+        try:
+            items.put(item, timeout=POLL_SECONDS)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(items, stop):
+    while not stop.is_set():
+        try:
+            return items.get(timeout=POLL_SECONDS)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+def _read(frames, parsed, stop):
+    try:
+        for df in frames:
+            if not _put(parsed, df, stop):
+                break
+        else:
+            _put(parsed, _DONE, stop)
+    except Exception as e:
+        _put(parsed, _Failed(e), stop)
+    finally:
+        close = getattr(frames, "close", None)
+        if close is not None:
+            close()
+
+
+def _transform(transform, stage_metrics, parsed, cleaned, stop):
+    try:
+        while True:
+            df = _get(parsed, stop)
+            if df is _DONE or isinstance(df, _Failed):
+                _put(cleaned, df, stop)
+                return
+            with stage_metrics.phase("transform"):
+                df = transform(df)
+            if not _put(cleaned, df, stop):
+                return
+    except Exception as e:
+        _put(cleaned, _Failed(e), stop)
+
+
+# Yields the transformed `frames` while a reader thread parses the next
+# chunks and a transform thread cleans them, so the caller can write one
+# chunk to the database in the meantime. The bounded queues between the
+# threads hold at most `queue_size` chunks each, a slow writer makes the
+# others wait instead of piling up chunks in memory. An error in either
+# thread is raised to the caller, and the threads stop when the caller does.
+def pipelined(frames, transform, stage_metrics, queue_size=2):
+    parsed = queue.Queue(maxsize=queue_size)
+    cleaned = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    threads = [threading.Thread(target=_read, args=(frames, parsed, stop))]
+    if transform is None:
+        cleaned = parsed
+    else:
+        threads.append(
+            threading.Thread(
+                target=_transform,
+                args=(transform, stage_metrics, parsed, cleaned, stop),
+            )
+        )
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        while True:
+            df = cleaned.get()
+            if df is _DONE:
+                return
+            if isinstance(df, _Failed):
+                raise df.error
+            yield df
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
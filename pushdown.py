@@ -0,0 +1,198 @@
+import csv
+import logging
+import os
+import time
+
+import pandas as pd
+
+import checkpoint
+import partitions
+import retry
+import validation
+import watermark
+from metrics import StageMetrics
+from quires import (
+    dim_customer_table_merge,
+    dim_date_smart_key_merge,
+    dim_date_table_merge,
+    dim_order_table_merge,
+    dim_product_table_merge,
+    dim_seller_table_merge,
+    fact_feedback_table_merge,
+    fact_order_item_table_merge,
+    fact_payment_table_merge,
+    pushdown_dim_customer,
+    pushdown_dim_date,
+    pushdown_dim_order,
+    pushdown_dim_order_rejects,
+    pushdown_dim_product,
+    pushdown_dim_seller,
+    pushdown_fact_feedback,
+    pushdown_fact_feedback_rejects,
+    pushdown_fact_order_item,
+    pushdown_fact_order_item_rejects,
+    pushdown_fact_payment,
+    pushdown_fact_payment_rejects,
+    try_timestamp_function,
+)
+
+logger = logging.getLogger(__name__)
+
+# stage -> (table, query building its staging table, merge query, raw tables
+# the query reads)
+PUSHDOWN_STAGES = {
+    "customer": (
+        "dim_customer",
+        pushdown_dim_customer,
+        dim_customer_table_merge,
+        ["user"],
+    ),
+    "seller": ("dim_seller", pushdown_dim_seller, dim_seller_table_merge, ["seller"]),
+    "product": (
+        "dim_product",
+        pushdown_dim_product,
+        dim_product_table_merge,
+        ["products"],
+    ),
+    "date": (
+        "dim_date",
+        pushdown_dim_date,
+        dim_date_table_merge,
+        ["order", "order_item", "feedback"],
+    ),
+    "order": ("dim_order", pushdown_dim_order, dim_order_table_merge, ["order"]),
+    "order_item": (
+        "fact_order_item",
+        pushdown_fact_order_item,
+        fact_order_item_table_merge,
+        ["order_item"],
+    ),
+    "payment": (
+        "fact_payment",
+        pushdown_fact_payment,
+        fact_payment_table_merge,
+        ["payment"],
+    ),
+    "feedback": (
+        "fact_feedback",
+        pushdown_fact_feedback,
+        fact_feedback_table_merge,
+        ["feedback"],
+    ),
+}
+
+# table -> query selecting the raw rows its stage leaves out, with the reason
+PUSHDOWN_REJECTS = {
+    "dim_order": pushdown_dim_order_rejects,
+    "fact_order_item": pushdown_fact_order_item_rejects,
+    "fact_payment": pushdown_fact_payment_rejects,
+    "fact_feedback": pushdown_fact_feedback_rejects,
+}
+
+
+def raw_table(source):
+    return f"raw_{source}"
+
+
+# Copies every source file as it is into an UNLOGGED table of TEXT columns
+# named after its header, line_number keeps the order of the rows in the file
+def load_raw(conn, run, paths):
+    stage_metrics = StageMetrics("raw")
+    run.stage_metrics.append(stage_metrics)
+    started = time.perf_counter()
+    cur = conn.cursor()
+    cur.execute(try_timestamp_function)
+    for source, path in paths.items():
+        with stage_metrics.phase("extract"), open(path, newline="") as f:
+            header = next(csv.reader(f))
+            f.seek(0)
+            # The watermark of every stage reading the file ends here, rows
+            # appended while it is copied are read again by the next run
+            run.raw_offsets[source] = (path, os.path.getsize(path))
+            columns = ", ".join(f'"{column}"' for column in header)
+            definitions = ", ".join(f'"{column}" TEXT' for column in header)
+            table = raw_table(source)
+            cur.execute(f"DROP TABLE IF EXISTS {table}")
+            cur.execute(
+                f"CREATE UNLOGGED TABLE {table} "
+                f"(line_number BIGSERIAL, {definitions})"
+            )
+            cur.copy_expert(
+                f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER true)",
+                f,
+            )
+            stage_metrics.rows_read += cur.rowcount
+            stage_metrics.rows_written += cur.rowcount
+        logger.info(f"Copied {path} into {table}")
+    conn.commit()
+    cur.close()
+    stage_metrics.wall_seconds = time.perf_counter() - started
+
+
+def drop_raw(conn, sources):
+    cur = conn.cursor()
+    for source in sources:
+        cur.execute(f"DROP TABLE IF EXISTS {raw_table(source)}")
+    conn.commit()
+    cur.close()
+
+
+def quarantine_rejects(cur, run, table):
+    cur.execute(PUSHDOWN_REJECTS[table])
+    rejected = pd.DataFrame(
+        cur.fetchall(), columns=[column.name for column in cur.description]
+    )
+    if not rejected.empty:
+        run.rejected[table] = run.rejected.get(table, 0) + len(rejected)
+        validation.quarantine(table, rejected, run.started_at)
+        retry.hold(cur, table, rejected)
+    return len(rejected)
+
+
+# Cleans, resolves and merges one stage inside the database, then quarantines
+# the rows it left out and moves the watermarks of its files past them like a
+# stage loaded from pandas, so --incremental continues after a pushdown load
+def run_stage(conn, run, stage):
+    if run.checkpoints.get((stage, "pushdown"), (0, False))[1]:
+        logger.info(f"Skipping {stage}, loaded before resuming")
+        return 0
+    logger.info(f"Start pushdown ETL {stage}")
+    table, query, merge_query, sources = PUSHDOWN_STAGES[stage]
+    if table == "dim_date" and run.smart_date_keys:
+        merge_query = dim_date_smart_key_merge
+    staging_table = f"staging_{table}"
+    stage_metrics = StageMetrics(stage)
+    run.stage_metrics.append(stage_metrics)
+    started = time.perf_counter()
+    cur = conn.cursor()
+    with stage_metrics.phase("load"):
+        cur.execute(f"DROP TABLE IF EXISTS {staging_table}")
+        cur.execute(f"CREATE TEMP TABLE {staging_table} AS {query}")
+        stage_metrics.rows_written = cur.rowcount
+        if table in run.partitioned_tables:
+            cur.execute(f"SELECT DISTINCT order_month FROM {staging_table}")
+            partitions.create_missing(
+                cur,
+                table,
+                [row[0] for row in cur.fetchall()],
+                run.created_partitions,
+            )
+        cur.execute(merge_query)
+        cur.execute(f"DROP TABLE {staging_table}")
+        if table in PUSHDOWN_REJECTS:
+            stage_metrics.rows_rejected = quarantine_rejects(cur, run, table)
+        for source in sources:
+            path, end = run.raw_offsets[source]
+            watermark.save(cur, f"{stage}.{source}", path, end)
+        checkpoint.save(cur, stage, "pushdown", stage_metrics.rows_written, True)
+        conn.commit()
+    cur.close()
+    stage_metrics.wall_seconds = time.perf_counter() - started
+    if stage_metrics.rows_rejected:
+        logger.warning(
+            f"{table}: {stage_metrics.rows_rejected} rows rejected, see "
+            f"{validation.quarantine_path(table)}"
+        )
+    logger.info(f"Number of inserted rows: {stage_metrics.rows_written}")
+    logger.info(f"End pushdown ETL {stage}")
+    return stage_metrics.rows_written
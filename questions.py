@@ -0,0 +1,185 @@
+# Runs the business questions in Business_Questions/ and prints their answers.
+# Results are cached per query text and ETL data version, so they are served
+# from QUESTION_CACHE_DIR until the next load.
+# python questions.py [--no-cache] [--target duckdb] [1 3 ...]
+import argparse
+import csv
+import glob
+import hashlib
+import logging
+import os
+import pickle
+import time
+from datetime import datetime
+
+from psycopg2.pool import SimpleConnectionPool
+
+import db
+from quires import select_data_version
+from settings import (
+    ETL_TARGET,
+    QUESTION_CACHE_DIR,
+    QUESTIONS_DIR,
+    REPORT_DIR,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def discover(names=None):
+    paths = sorted(
+        glob.glob(os.path.join(QUESTIONS_DIR, "*.SQL")),
+        key=lambda path: int(os.path.basename(path).split(".")[0]),
+    )
+    questions = {}
+    for path in paths:
+        name = os.path.basename(path).split(".")[0]
+        with open(path) as f:
+            query = f.read().strip()
+        # Questions that have not been written yet are empty files
+        if query and (not names or name in names):
+            questions[name] = query
+    return questions
+
+
+# DuckDB connections run every query in its own transaction, there is no
+# transaction to roll back when `transactional` is false
+def data_version(cur, transactional=True):
+    try:
+        cur.execute(select_data_version)
+    except Exception as e:
+        if transactional:
+            cur.connection.rollback()
+        logger.warning(f"No data version, not caching results: {e}")
+        return None
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def cache_path(query, version):
+    key = hashlib.sha256(query.encode()).hexdigest()[:16]
+    return os.path.join(QUESTION_CACHE_DIR, f"{key}.{version}.pickle")
+
+
+def read_cached(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def write_cached(path, result):
+    os.makedirs(QUESTION_CACHE_DIR, exist_ok=True)
+    for stale in glob.glob(path.rsplit(".", 2)[0] + ".*.pickle"):
+        os.remove(stale)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, "wb") as f:
+        pickle.dump(result, f)
+    os.replace(temp_path, path)
+
+
+def execute(cur, query):
+    cur.execute(query)
+    columns = [column[0] for column in cur.description]
+    return columns, cur.fetchall()
+
+
+# Returns {name: (columns, rows)} and one timing record per question
+def run_questions(conn, questions, use_cache=True, transactional=True):
+    cur = conn.cursor()
+    version = data_version(cur, transactional) if use_cache else None
+    results = {}
+    timings = []
+    for name, query in questions.items():
+        start = time.perf_counter()
+        path = cache_path(query, version) if version is not None else None
+        result = read_cached(path) if path is not None else None
+        cached = result is not None
+        if not cached:
+            result = execute(cur, query)
+            if transactional:
+                conn.rollback()
+            if path is not None:
+                write_cached(path, result)
+        seconds = time.perf_counter() - start
+        logger.info(
+            f"Question {name} answered in {seconds:.3f} seconds"
+            + (" from cache" if cached else "")
+        )
+        results[name] = result
+        timings.append(
+            {
+                "question": name,
+                "cached": cached,
+                "seconds": round(seconds, 4),
+                "rows": len(result[1]),
+            }
+        )
+    cur.close()
+    return results, timings
+
+
+# Appends one row per question next to pipeline.log
+def write_timings(timings, report_dir):
+    if not timings:
+        return
+    path = os.path.join(report_dir, "question_metrics.csv")
+    write_header = not os.path.exists(path)
+    run_at = datetime.now().isoformat(timespec="seconds")
+    with open(path, "a", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["run_at"] + list(timings[0]))
+        if write_header:
+            writer.writeheader()
+        for timing in timings:
+            writer.writerow({"run_at": run_at, **timing})
+
+
+def main(names=None, use_cache=True, target=ETL_TARGET):
+    if target == "duckdb":
+        import duckdb_target
+
+        conn = duckdb_target.connect(read_only=True)
+        try:
+            results, timings = run_questions(
+                conn, discover(names), use_cache, transactional=False
+            )
+        finally:
+            conn.close()
+    else:
+        pool = db.pool(1, 1, pool_class=SimpleConnectionPool)
+        conn = pool.getconn()
+        try:
+            results, timings = run_questions(conn, discover(names), use_cache)
+        finally:
+            pool.putconn(conn)
+            pool.closeall()
+    write_timings(timings, REPORT_DIR)
+
+    for timing in timings:
+        columns, rows = results[timing["question"]]
+        source = "cache" if timing["cached"] else "database"
+        print(f"Question {timing['question']} ({timing['seconds']:.3f}s from {source})")
+        print("  " + " | ".join(columns))
+        for row in rows:
+            print("  " + " | ".join(str(value) for value in row))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("questions", nargs="*", help="question numbers to run")
+    parser.add_argument(
+        "--no-cache",
+        dest="use_cache",
+        action="store_false",
+        help="always query the database",
+    )
+    parser.add_argument(
+        "--target",
+        choices=["postgres", "duckdb"],
+        default=ETL_TARGET,
+        help="query PostgreSQL or the DuckDB file loaded by run.py --target duckdb",
+    )
+    args = parser.parse_args()
+
+    main(args.questions, args.use_cache, args.target)
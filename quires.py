@@ -4,7 +4,9 @@ CREATE TABLE IF NOT EXISTS dim_customer(
     customer_id VARCHAR UNIQUE NOT NULL,
     customer_zip_code VARCHAR,
     customer_city VARCHAR,
-    customer_state VARCHAR
+    customer_state VARCHAR,
+    attribute_hash BIGINT,
+    is_inferred BOOLEAN NOT NULL DEFAULT FALSE
     )
 """
 dim_seller_table = """
@@ -13,7 +15,9 @@ CREATE TABLE IF NOT EXISTS dim_seller(
     seller_id VARCHAR UNIQUE NOT NULL,
     seller_zip_code VARCHAR,
     seller_city VARCHAR,
-    seller_state VARCHAR)
+    seller_state VARCHAR,
+    attribute_hash BIGINT,
+    is_inferred BOOLEAN NOT NULL DEFAULT FALSE)
 """
 dim_product_table = """
 CREATE TABLE IF NOT EXISTS dim_product(
@@ -26,7 +30,9 @@ CREATE TABLE IF NOT EXISTS dim_product(
     product_weight_g DECIMAL(18,6),
     product_length_cm DECIMAL(18,6),
     product_height_cm DECIMAL(18,6),
-    product_width_cm DECIMAL(18,6)
+    product_width_cm DECIMAL(18,6),
+    attribute_hash BIGINT,
+    is_inferred BOOLEAN NOT NULL DEFAULT FALSE
 )
 """
 
@@ -46,6 +52,11 @@ CREATE TABLE IF NOT EXISTS dim_date(
     date_am_or_pm VARCHAR
 )
 """
+# With smart date keys the id of a date is computed from it as the
+# YYYYMMDDHHMMSS integer, so the ETL never has to look it up
+dim_date_smart_key_table = dim_date_table.replace(
+    "id SERIAL PRIMARY KEY", "id BIGINT PRIMARY KEY"
+)
 dim_payment = """
 CREATE TABLE IF NOT EXISTS dim_payment(
     id SERIAL PRIMARY KEY,
@@ -69,14 +80,16 @@ CREATE TABLE IF NOT EXISTS bridge_order_payment(
 dim_order_table = """
 CREATE TABLE IF NOT EXISTS dim_order(
     id SERIAL PRIMARY KEY,
-    order_id VARCHAR,
-    customer_id INT NOT NULL,
+    order_id VARCHAR UNIQUE NOT NULL,
+    customer_id INT,
     order_status VARCHAR NOT NULL,
-    order_date INT NOT NULL,
-    order_approved_date INT NOT NULL,
-    pickup_date INT NOT NULL,
-    delivered_date INT NOT NULL,
-    estimated_time_delivery INT NOT NULL,
+    order_date BIGINT NOT NULL,
+    order_approved_date BIGINT NOT NULL,
+    pickup_date BIGINT NOT NULL,
+    delivered_date BIGINT NOT NULL,
+    estimated_time_delivery BIGINT NOT NULL,
+    attribute_hash BIGINT,
+    is_inferred BOOLEAN NOT NULL DEFAULT FALSE,
     FOREIGN KEY (customer_id) REFERENCES dim_customer(id),
     FOREIGN KEY (order_date) REFERENCES dim_date(id),
     FOREIGN KEY (order_approved_date) REFERENCES dim_date(id),
@@ -89,6 +102,7 @@ fact_payment_table = """
 CREATE TABLE IF NOT EXISTS fact_payment(
     id SERIAL PRIMARY KEY,
     order_id INT,
+    order_month INT NOT NULL,
     payment_sequential INT,
     payment_type VARCHAR,
     payment_installments INT,
@@ -102,9 +116,10 @@ CREATE TABLE IF NOT EXISTS fact_feedback(
     id SERIAL PRIMARY KEY,
     feedback_id VARCHAR NOT NULL,
     order_id INT,
+    order_month INT NOT NULL,
     feedback_score INT,
-    feedback_form_sent_date INT NOT NULL,
-    feedback_answer_date INT NOT NULL,
+    feedback_form_sent_date BIGINT NOT NULL,
+    feedback_answer_date BIGINT NOT NULL,
     FOREIGN KEY (order_id) REFERENCES dim_order(id),
     FOREIGN KEY (feedback_form_sent_date) REFERENCES dim_date(id),
     FOREIGN KEY (feedback_answer_date) REFERENCES dim_date(id)
@@ -116,58 +131,398 @@ CREATE TABLE IF NOT EXISTS fact_order_item(
     id SERIAL PRIMARY KEY,
     order_item_id VARCHAR NOT NULL,
     order_id INT,
+    order_month INT NOT NULL,
+    product_id INT,
+    seller_id INT,
+    pickup_limit_date BIGINT,
+    price DECIMAL(18,6),
+    shipping_cost DECIMAL(18,6),
+    FOREIGN KEY (order_id) REFERENCES dim_order(id),
+    FOREIGN KEY (product_id) REFERENCES dim_product(id),
+    FOREIGN KEY (seller_id) REFERENCES dim_seller(id),
+    FOREIGN KEY (pickup_limit_date) REFERENCES dim_date(id)
+)
+"""
+
+# The same facts partitioned by month of the order date, order_month holds the
+# month as YYYYMM. The partitions are created by the ETL as months appear and
+# a query filtering on order_month only scans the months it asks for.
+fact_payment_partitioned_table = """
+CREATE TABLE IF NOT EXISTS fact_payment(
+    id SERIAL,
+    order_id INT,
+    order_month INT NOT NULL,
+    payment_sequential INT,
+    payment_type VARCHAR,
+    payment_installments INT,
+    payment_value DECIMAL(18,6),
+    PRIMARY KEY (id, order_month),
+    FOREIGN KEY (order_id) REFERENCES dim_order(id)
+) PARTITION BY RANGE (order_month)
+"""
+
+fact_feedback_partitioned_table = """
+CREATE TABLE IF NOT EXISTS fact_feedback(
+    id SERIAL,
+    feedback_id VARCHAR NOT NULL,
+    order_id INT,
+    order_month INT NOT NULL,
+    feedback_score INT,
+    feedback_form_sent_date BIGINT NOT NULL,
+    feedback_answer_date BIGINT NOT NULL,
+    PRIMARY KEY (id, order_month),
+    FOREIGN KEY (order_id) REFERENCES dim_order(id),
+    FOREIGN KEY (feedback_form_sent_date) REFERENCES dim_date(id),
+    FOREIGN KEY (feedback_answer_date) REFERENCES dim_date(id)
+) PARTITION BY RANGE (order_month)
+"""
+
+fact_order_item_partitioned_table = """
+CREATE TABLE IF NOT EXISTS fact_order_item(
+    id SERIAL,
+    order_item_id VARCHAR NOT NULL,
+    order_id INT,
+    order_month INT NOT NULL,
     product_id INT,
     seller_id INT,
-    pickup_limit_date INT,
+    pickup_limit_date BIGINT,
     price DECIMAL(18,6),
     shipping_cost DECIMAL(18,6),
+    PRIMARY KEY (id, order_month),
     FOREIGN KEY (order_id) REFERENCES dim_order(id),
     FOREIGN KEY (product_id) REFERENCES dim_product(id),
     FOREIGN KEY (seller_id) REFERENCES dim_seller(id),
     FOREIGN KEY (pickup_limit_date) REFERENCES dim_date(id)
+) PARTITION BY RANGE (order_month)
+"""
+
+etl_watermark_table = """
+CREATE TABLE IF NOT EXISTS etl_watermark(
+    source VARCHAR PRIMARY KEY,
+    file_offset BIGINT NOT NULL,
+    checksum VARCHAR NOT NULL,
+    loaded_at TIMESTAMP NOT NULL DEFAULT now()
+)
+"""
+
+# Rows rejected because a key they reference was not loaded yet, kept as the
+# CSV of their cleaned columns. The dimension row can arrive in a later delta,
+# so every incremental run loads them again.
+etl_retry_table = """
+CREATE TABLE IF NOT EXISTS etl_retry(
+    id SERIAL PRIMARY KEY,
+    table_name VARCHAR NOT NULL,
+    rows TEXT NOT NULL,
+    held_at TIMESTAMP NOT NULL DEFAULT now()
+)
+"""
+
+# Progress of the current ETL run. A step is a (stage, source file) pair,
+# rows_done counts the cleaned rows already committed so an interrupted step
+# can go on after them.
+etl_checkpoint_table = """
+CREATE TABLE IF NOT EXISTS etl_checkpoint(
+    stage VARCHAR NOT NULL,
+    source VARCHAR NOT NULL,
+    rows_done BIGINT NOT NULL,
+    completed BOOLEAN NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT now(),
+    PRIMARY KEY (stage, source)
+)
+"""
+
+# Options of the current ETL run and the indexes it dropped, finished_at stays
+# empty until the run succeeds
+etl_run_state_table = """
+CREATE TABLE IF NOT EXISTS etl_run_state(
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    options TEXT NOT NULL,
+    dropped_indexes TEXT,
+    started_at TIMESTAMP NOT NULL DEFAULT now(),
+    finished_at TIMESTAMP
+)
+"""
+
+# Replaced with a new random stamp by every ETL run, cached query results
+# from any other stamp are stale. A counter would restart after the tables are
+# dropped and match results cached from the previous database.
+etl_data_version_table = """
+CREATE TABLE IF NOT EXISTS etl_data_version(
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version VARCHAR NOT NULL,
+    loaded_at TIMESTAMP NOT NULL DEFAULT now()
+)
+"""
+
+# Aggregates read by Business_Questions/, refreshed as the last ETL step
+summary_orders_by_season_table = """
+CREATE TABLE IF NOT EXISTS summary_orders_by_season(
+    date_season VARCHAR PRIMARY KEY,
+    number_of_orders BIGINT NOT NULL
+)
+"""
+
+summary_orders_by_hour_table = """
+CREATE TABLE IF NOT EXISTS summary_orders_by_hour(
+    date_hour INTEGER NOT NULL,
+    date_am_or_pm VARCHAR NOT NULL,
+    number_of_orders BIGINT NOT NULL,
+    PRIMARY KEY (date_hour, date_am_or_pm)
+)
+"""
+
+summary_orders_by_customer_state_table = """
+CREATE TABLE IF NOT EXISTS summary_orders_by_customer_state(
+    customer_state VARCHAR PRIMARY KEY,
+    number_of_orders BIGINT NOT NULL
 )
 """
 
-dim_customer_table_insert = """
+summary_payment_type_table = """
+CREATE TABLE IF NOT EXISTS summary_payment_type(
+    payment_type VARCHAR PRIMARY KEY,
+    number_used BIGINT NOT NULL
+)
+"""
+
+summary_approval_delay_table = """
+CREATE TABLE IF NOT EXISTS summary_approval_delay(
+    order_status VARCHAR PRIMARY KEY,
+    approved_orders BIGINT NOT NULL,
+    total_delay_seconds DOUBLE PRECISION NOT NULL,
+    min_delay_seconds DOUBLE PRECISION NOT NULL,
+    max_delay_seconds DOUBLE PRECISION NOT NULL
+)
+"""
+
+# Highest id of every source table already folded into the summaries
+summary_refresh_table = """
+CREATE TABLE IF NOT EXISTS summary_refresh(
+    source VARCHAR PRIMARY KEY,
+    last_id INTEGER NOT NULL,
+    refreshed_at TIMESTAMP NOT NULL DEFAULT now()
+)
+"""
+
+drop_table_queries = [
+    "DROP TABLE IF EXISTS etl_data_version",
+    "DROP TABLE IF EXISTS summary_refresh",
+    "DROP TABLE IF EXISTS summary_approval_delay",
+    "DROP TABLE IF EXISTS summary_payment_type",
+    "DROP TABLE IF EXISTS summary_orders_by_customer_state",
+    "DROP TABLE IF EXISTS summary_orders_by_hour",
+    "DROP TABLE IF EXISTS summary_orders_by_season",
+    "DROP TABLE IF EXISTS etl_run_state",
+    "DROP TABLE IF EXISTS etl_checkpoint",
+    "DROP TABLE IF EXISTS etl_watermark",
+    "DROP TABLE IF EXISTS etl_retry",
+    "DROP TABLE IF EXISTS fact_payment",
+    "DROP TABLE IF EXISTS fact_order_item",
+    "DROP TABLE IF EXISTS fact_feedback",
+    "DROP TABLE IF EXISTS dim_order",
+    "DROP TABLE IF EXISTS dim_date",
+    "DROP TABLE IF EXISTS dim_product",
+    "DROP TABLE IF EXISTS dim_customer",
+    "DROP TABLE IF EXISTS dim_seller",
+]
+create_table_queries = [
+    dim_date_table,
+    dim_customer_table,
+    dim_seller_table,
+    dim_product_table,
+    dim_order_table,
+    fact_payment_table,
+    fact_order_item_table,
+    fact_feedback_table,
+    etl_watermark_table,
+    etl_retry_table,
+    etl_checkpoint_table,
+    etl_run_state_table,
+    summary_orders_by_season_table,
+    summary_orders_by_hour_table,
+    summary_orders_by_customer_state_table,
+    summary_payment_type_table,
+    summary_approval_delay_table,
+    summary_refresh_table,
+    etl_data_version_table,
+]
+partitioned_facts = {
+    fact_payment_table: fact_payment_partitioned_table,
+    fact_order_item_table: fact_order_item_partitioned_table,
+    fact_feedback_table: fact_feedback_partitioned_table,
+}
+create_partitioned_table_queries = [
+    partitioned_facts.get(query, query) for query in create_table_queries
+]
+
+# Columns added to tables of databases created before them
+alter_table_queries = [
+    f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column}"
+    for table in ["dim_customer", "dim_seller", "dim_product", "dim_order"]
+    for column in [
+        "attribute_hash BIGINT",
+        "is_inferred BOOLEAN NOT NULL DEFAULT FALSE",
+    ]
+] + ["ALTER TABLE dim_order ALTER COLUMN customer_id DROP NOT NULL"]
+
+# Secondary indexes, dropped during a full load and rebuilt afterwards.
+# dim_order_order_id_key backs the UNIQUE constraint of databases created
+# before order_id was declared unique, it already exists on newer ones.
+create_index_queries = [
+    "CREATE UNIQUE INDEX IF NOT EXISTS dim_order_order_id_key ON dim_order(order_id)",
+    "CREATE INDEX IF NOT EXISTS dim_order_customer_id_idx ON dim_order(customer_id)",
+    "CREATE INDEX IF NOT EXISTS dim_order_order_date_idx ON dim_order(order_date)",
+    "CREATE INDEX IF NOT EXISTS fact_order_item_order_id_idx "
+    "ON fact_order_item(order_id, order_item_id)",
+    "CREATE INDEX IF NOT EXISTS fact_order_item_product_id_idx "
+    "ON fact_order_item(product_id)",
+    "CREATE INDEX IF NOT EXISTS fact_order_item_seller_id_idx "
+    "ON fact_order_item(seller_id)",
+    "CREATE INDEX IF NOT EXISTS fact_order_item_pickup_limit_date_idx "
+    "ON fact_order_item(pickup_limit_date)",
+    "CREATE INDEX IF NOT EXISTS fact_payment_order_id_idx "
+    "ON fact_payment(order_id, payment_sequential)",
+    "CREATE INDEX IF NOT EXISTS fact_feedback_order_id_idx ON fact_feedback(order_id)",
+    "CREATE INDEX IF NOT EXISTS fact_feedback_form_sent_date_idx "
+    "ON fact_feedback(feedback_form_sent_date)",
+    "CREATE INDEX IF NOT EXISTS fact_feedback_answer_date_idx "
+    "ON fact_feedback(feedback_answer_date)",
+]
+
+load_tables = [
+    "dim_customer",
+    "dim_seller",
+    "dim_product",
+    "dim_date",
+    "dim_order",
+    "fact_order_item",
+    "fact_payment",
+    "fact_feedback",
+]
+
+select_secondary_indexes = """
+SELECT index_class.relname, pg_get_indexdef(pg_index.indexrelid)
+FROM pg_index
+JOIN pg_class index_class ON index_class.oid = pg_index.indexrelid
+JOIN pg_class table_class ON table_class.oid = pg_index.indrelid
+WHERE table_class.relname = ANY(%s)
+AND NOT pg_index.indisprimary
+AND NOT pg_index.indisunique
+"""
+
+select_foreign_keys = """
+SELECT table_class.relname, conname, pg_get_constraintdef(pg_constraint.oid)
+FROM pg_constraint
+JOIN pg_class table_class ON table_class.oid = pg_constraint.conrelid
+WHERE pg_constraint.contype = 'f'
+AND table_class.relname = ANY(%s)
+"""
+
+select_customer_keys = "SELECT customer_id, id FROM dim_customer"
+select_order_keys = "SELECT order_id, id FROM dim_order"
+select_product_keys = "SELECT product_id, id FROM dim_product"
+select_seller_keys = "SELECT seller_id, id FROM dim_seller"
+select_date_keys = "SELECT date_key, id FROM dim_date"
+# order_id -> month of the order date as YYYYMM, the partition key of the facts
+select_order_month_keys = """
+SELECT dim_order.order_id, to_char(dim_date.date_key, 'YYYYMM')::INT
+FROM dim_order
+JOIN dim_date ON dim_date.id = dim_order.order_date
+"""
+select_customer_keys_in = (
+    "SELECT customer_id, id FROM dim_customer WHERE customer_id = ANY(%s)"
+)
+select_order_keys_in = "SELECT order_id, id FROM dim_order WHERE order_id = ANY(%s)"
+select_product_keys_in = (
+    "SELECT product_id, id FROM dim_product WHERE product_id = ANY(%s)"
+)
+select_seller_keys_in = "SELECT seller_id, id FROM dim_seller WHERE seller_id = ANY(%s)"
+select_date_keys_in = "SELECT date_key, id FROM dim_date WHERE date_key = ANY(%s)"
+# natural key -> attribute_hash of the rows already loaded
+select_customer_hashes_in = (
+    "SELECT customer_id, attribute_hash FROM dim_customer "
+    "WHERE customer_id = ANY(%s)"
+)
+select_seller_hashes_in = (
+    "SELECT seller_id, attribute_hash FROM dim_seller WHERE seller_id = ANY(%s)"
+)
+select_product_hashes_in = (
+    "SELECT product_id, attribute_hash FROM dim_product WHERE product_id = ANY(%s)"
+)
+select_order_hashes_in = (
+    "SELECT order_id, attribute_hash FROM dim_order WHERE order_id = ANY(%s)"
+)
+select_order_month_keys_in = (
+    select_order_month_keys + "WHERE dim_order.order_id = ANY(%s)"
+)
+
+dim_customer_table_merge = """
 INSERT INTO dim_customer(
     customer_id,
     customer_zip_code,
     customer_city,
-    customer_state
-) VALUES (%s, %s, %s, %s)
-ON CONFLICT (customer_id) DO UPDATE SET 
-customer_zip_code = EXCLUDED.customer_zip_code, 
-customer_city = EXCLUDED.customer_city, 
-customer_state = EXCLUDED.customer_state
+    customer_state,
+    attribute_hash
+)
+SELECT customer_id, customer_zip_code, customer_city, customer_state, attribute_hash
+FROM staging_dim_customer
+ON CONFLICT (customer_id) DO UPDATE SET
+customer_zip_code = EXCLUDED.customer_zip_code,
+customer_city = EXCLUDED.customer_city,
+customer_state = EXCLUDED.customer_state,
+attribute_hash = EXCLUDED.attribute_hash,
+is_inferred = FALSE
 """
 
-dim_seller_table_insert = """
+dim_seller_table_merge = """
 INSERT INTO dim_seller(
     seller_id,
     seller_zip_code,
     seller_city,
-    seller_state
-) VALUES (%s, %s, %s, %s)
-ON CONFLICT (seller_id) DO UPDATE SET 
-seller_zip_code = EXCLUDED.seller_zip_code, 
-seller_city = EXCLUDED.seller_city, 
-seller_state = EXCLUDED.seller_state
+    seller_state,
+    attribute_hash
+)
+SELECT seller_id, seller_zip_code, seller_city, seller_state, attribute_hash
+FROM staging_dim_seller
+ON CONFLICT (seller_id) DO UPDATE SET
+seller_zip_code = EXCLUDED.seller_zip_code,
+seller_city = EXCLUDED.seller_city,
+seller_state = EXCLUDED.seller_state,
+attribute_hash = EXCLUDED.attribute_hash,
+is_inferred = FALSE
 """
-dim_product_table_insert = """
-INSERT INTO dim_product(
-    product_id,
-    product_category_name,
-    product_name_length,
-    product_description_length,
-    product_photos_qty,
-    product_weight_g,
-    product_length_cm,
-    product_height_cm,
-    product_width_cm
-) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+
+dim_date_table_merge = """
+INSERT INTO dim_date(
+    date_key,
+    date_year,
+    date_quarter,
+    date_season,
+    date_month,
+    date_month_name,
+    date_day,
+    date_day_name,
+    date_hour,
+    date_am_or_pm
+)
+SELECT
+    date_key,
+    date_year,
+    date_quarter,
+    date_season,
+    date_month,
+    date_month_name,
+    date_day,
+    date_day_name,
+    date_hour,
+    date_am_or_pm
+FROM staging_dim_date
+ON CONFLICT (date_key) DO NOTHING
 """
-dim_date_table_insert = """
+
+dim_date_smart_key_merge = """
 INSERT INTO dim_date(
+    id,
     date_key,
     date_year,
     date_quarter,
@@ -178,11 +533,62 @@ INSERT INTO dim_date(
     date_day_name,
     date_hour,
     date_am_or_pm
-) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+)
+SELECT
+    id,
+    date_key,
+    date_year,
+    date_quarter,
+    date_season,
+    date_month,
+    date_month_name,
+    date_day,
+    date_day_name,
+    date_hour,
+    date_am_or_pm
+FROM staging_dim_date
 ON CONFLICT (date_key) DO NOTHING
 """
 
-dim_order_table_insert = """
+dim_product_table_merge = """
+INSERT INTO dim_product(
+    product_id,
+    product_category_name,
+    product_name_length,
+    product_description_length,
+    product_photos_qty,
+    product_weight_g,
+    product_length_cm,
+    product_height_cm,
+    product_width_cm,
+    attribute_hash
+)
+SELECT
+    product_id,
+    product_category_name,
+    product_name_length,
+    product_description_length,
+    product_photos_qty,
+    product_weight_g,
+    product_length_cm,
+    product_height_cm,
+    product_width_cm,
+    attribute_hash
+FROM staging_dim_product
+ON CONFLICT (product_id) DO UPDATE SET
+product_category_name = EXCLUDED.product_category_name,
+product_name_length = EXCLUDED.product_name_length,
+product_description_length = EXCLUDED.product_description_length,
+product_photos_qty = EXCLUDED.product_photos_qty,
+product_weight_g = EXCLUDED.product_weight_g,
+product_length_cm = EXCLUDED.product_length_cm,
+product_height_cm = EXCLUDED.product_height_cm,
+product_width_cm = EXCLUDED.product_width_cm,
+attribute_hash = EXCLUDED.attribute_hash,
+is_inferred = FALSE
+"""
+
+dim_order_table_merge = """
 INSERT INTO dim_order(
     order_id,
     customer_id,
@@ -191,63 +597,1040 @@ INSERT INTO dim_order(
     order_approved_date,
     pickup_date,
     delivered_date,
-    estimated_time_delivery
-) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    estimated_time_delivery,
+    attribute_hash
+)
+SELECT
+    order_id,
+    customer_id,
+    order_status,
+    order_date,
+    order_approved_date,
+    pickup_date,
+    delivered_date,
+    estimated_time_delivery,
+    attribute_hash
+FROM staging_dim_order
+ON CONFLICT (order_id) DO UPDATE SET
+customer_id = EXCLUDED.customer_id,
+order_status = EXCLUDED.order_status,
+order_date = EXCLUDED.order_date,
+order_approved_date = EXCLUDED.order_approved_date,
+pickup_date = EXCLUDED.pickup_date,
+delivered_date = EXCLUDED.delivered_date,
+estimated_time_delivery = EXCLUDED.estimated_time_delivery,
+attribute_hash = EXCLUDED.attribute_hash,
+is_inferred = FALSE
+"""
+
+# Inferred members stand in for natural keys referenced before their
+# dimension row was loaded, their attributes are Unknown until it arrives and
+# the merges above replace them. An inferred order has no customer and the
+# 1900-12-31 placeholder for every date.
+dim_customer_inferred_insert = """
+INSERT INTO dim_customer(customer_id, customer_city, customer_state, is_inferred)
+SELECT customer_id, 'Unknown', 'Unknown', TRUE
+FROM unnest(%(keys)s::VARCHAR[]) customer_id
+ON CONFLICT (customer_id) DO NOTHING
+"""
+
+dim_seller_inferred_insert = """
+INSERT INTO dim_seller(seller_id, seller_city, seller_state, is_inferred)
+SELECT seller_id, 'Unknown', 'Unknown', TRUE
+FROM unnest(%(keys)s::VARCHAR[]) seller_id
+ON CONFLICT (seller_id) DO NOTHING
+"""
+
+dim_product_inferred_insert = """
+INSERT INTO dim_product(product_id, product_category_name, is_inferred)
+SELECT product_id, 'Unknown', TRUE
+FROM unnest(%(keys)s::VARCHAR[]) product_id
+ON CONFLICT (product_id) DO NOTHING
 """
 
-fact_order_item_table_insert = """
+dim_order_inferred_insert = """
+INSERT INTO dim_order(
+    order_id,
+    order_status,
+    order_date,
+    order_approved_date,
+    pickup_date,
+    delivered_date,
+    estimated_time_delivery,
+    is_inferred
+)
+SELECT
+    order_id,
+    'unknown',
+    %(missing_date)s,
+    %(missing_date)s,
+    %(missing_date)s,
+    %(missing_date)s,
+    %(missing_date)s,
+    TRUE
+FROM unnest(%(keys)s::VARCHAR[]) order_id
+ON CONFLICT (order_id) DO NOTHING
+"""
+
+select_inferred_orders_in = (
+    "SELECT id FROM dim_order WHERE is_inferred AND order_id = ANY(%s)"
+)
+
+# Facts of an inferred order carry the month of the placeholder date, they
+# are moved to the month of the order once it is loaded
+realign_order_month_queries = [f"""
+UPDATE {table} SET order_month = to_char(dim_date.date_key, 'YYYYMM')::INT
+FROM dim_order
+JOIN dim_date ON dim_date.id = dim_order.order_date
+WHERE {table}.order_id = dim_order.id
+AND dim_order.id = ANY(%s)
+AND {table}.order_month <> to_char(dim_date.date_key, 'YYYYMM')::INT
+""" for table in ["fact_order_item", "fact_payment", "fact_feedback"]]
+
+# The facts have no unique natural key constraint, so rows that are already
+# loaded are updated first and only the remaining ones inserted
+
+fact_order_item_table_merge = """
+UPDATE fact_order_item SET
+order_month = s.order_month,
+product_id = s.product_id,
+seller_id = s.seller_id,
+pickup_limit_date = s.pickup_limit_date,
+price = s.price,
+shipping_cost = s.shipping_cost
+FROM staging_fact_order_item s
+WHERE fact_order_item.order_id = s.order_id
+AND fact_order_item.order_item_id = s.order_item_id;
+
 INSERT INTO fact_order_item(
     order_item_id,
     order_id,
+    order_month,
     product_id,
     seller_id,
     pickup_limit_date,
     price,
     shipping_cost
-) VALUES (%s, %s, %s, %s, %s, %s, %s)
+)
+SELECT
+    order_item_id,
+    order_id,
+    order_month,
+    product_id,
+    seller_id,
+    pickup_limit_date,
+    price,
+    shipping_cost
+FROM staging_fact_order_item s
+WHERE NOT EXISTS (
+    SELECT 1 FROM fact_order_item f
+    WHERE f.order_id = s.order_id AND f.order_item_id = s.order_item_id
+)
 """
-fact_payment_table_insert = """
+
+fact_payment_table_merge = """
+UPDATE fact_payment SET
+order_month = s.order_month,
+payment_type = s.payment_type,
+payment_installments = s.payment_installments,
+payment_value = s.payment_value
+FROM staging_fact_payment s
+WHERE fact_payment.order_id = s.order_id
+AND fact_payment.payment_sequential = s.payment_sequential;
+
 INSERT INTO fact_payment(
     order_id,
+    order_month,
     payment_sequential,
     payment_type,
     payment_installments,
     payment_value
-) VALUES (%s, %s, %s, %s, %s)
+)
+SELECT
+    order_id,
+    order_month,
+    payment_sequential,
+    payment_type,
+    payment_installments,
+    payment_value
+FROM staging_fact_payment s
+WHERE NOT EXISTS (
+    SELECT 1 FROM fact_payment f
+    WHERE f.order_id = s.order_id AND f.payment_sequential = s.payment_sequential
+)
 """
 
-fact_feedback_table_insert = """
+fact_feedback_table_merge = """
+UPDATE fact_feedback SET
+order_month = s.order_month,
+feedback_score = s.feedback_score,
+feedback_form_sent_date = s.feedback_form_sent_date,
+feedback_answer_date = s.feedback_answer_date
+FROM staging_fact_feedback s
+WHERE fact_feedback.feedback_id = s.feedback_id
+AND fact_feedback.order_id = s.order_id;
+
 INSERT INTO fact_feedback(
     feedback_id,
     order_id,
+    order_month,
+    feedback_score,
+    feedback_form_sent_date,
+    feedback_answer_date
+)
+SELECT
+    feedback_id,
+    order_id,
+    order_month,
     feedback_score,
     feedback_form_sent_date,
     feedback_answer_date
-) VALUES (%s, %s, %s, %s, %s)
+FROM staging_fact_feedback s
+WHERE NOT EXISTS (
+    SELECT 1 FROM fact_feedback f
+    WHERE f.feedback_id = s.feedback_id AND f.order_id = s.order_id
+)
 """
-drop_table_queries = [
-    "DROP TABLE IF EXISTS fact_payment",
-    "DROP TABLE IF EXISTS fact_order_item",
-    "DROP TABLE IF EXISTS fact_feedback",
-    "DROP TABLE IF EXISTS dim_order",
-    "DROP TABLE IF EXISTS dim_date",
-    "DROP TABLE IF EXISTS dim_product",
-    "DROP TABLE IF EXISTS dim_customer",
-    "DROP TABLE IF EXISTS dim_seller",
+
+etl_retry_insert = "INSERT INTO etl_retry(table_name, rows) VALUES (%s, %s)"
+# Removes the held rows of a table and returns them in the order they were held
+etl_retry_take = """
+WITH taken AS (
+    DELETE FROM etl_retry WHERE table_name = %s RETURNING id, rows
+)
+SELECT rows FROM taken ORDER BY id
+"""
+select_watermark = "SELECT file_offset, checksum FROM etl_watermark WHERE source = %s"
+etl_watermark_upsert = """
+INSERT INTO etl_watermark(source, file_offset, checksum) VALUES (%s, %s, %s)
+ON CONFLICT (source) DO UPDATE SET
+file_offset = EXCLUDED.file_offset,
+checksum = EXCLUDED.checksum,
+loaded_at = now()
+"""
+
+summary_tables = [
+    "summary_orders_by_season",
+    "summary_orders_by_hour",
+    "summary_orders_by_customer_state",
+    "summary_payment_type",
+    "summary_approval_delay",
 ]
-create_table_queries = [
-    dim_date_table,
-    dim_customer_table,
-    dim_seller_table,
-    dim_product_table,
-    dim_order_table,
-    fact_payment_table,
-    fact_order_item_table,
-    fact_feedback_table,
+
+select_summary_refresh = "SELECT source, last_id FROM summary_refresh"
+select_summary_sources = """
+SELECT 'dim_order', COALESCE(MAX(id), 0) FROM dim_order
+UNION ALL
+SELECT 'fact_order_item', COALESCE(MAX(id), 0) FROM fact_order_item
+UNION ALL
+SELECT 'fact_payment', COALESCE(MAX(id), 0) FROM fact_payment
+"""
+summary_refresh_upsert = """
+INSERT INTO summary_refresh(source, last_id) VALUES (%s, %s)
+ON CONFLICT (source) DO UPDATE SET
+last_id = EXCLUDED.last_id,
+refreshed_at = now()
+"""
+
+# Order items added since the last refresh that belong to orders already
+# summarized, these would be counted twice by an incremental refresh
+select_items_of_summarized_orders = """
+SELECT EXISTS (
+    SELECT 1 FROM fact_order_item
+    WHERE id > %(fact_order_item)s AND order_id <= %(dim_order)s
+)
+"""
+
+# Every refresh folds the rows added after the ids in summary_refresh into the
+# summaries, a full refresh truncates them and starts from id 0
+summary_orders_by_season_refresh = """
+INSERT INTO summary_orders_by_season(date_season, number_of_orders)
+SELECT date_season, COUNT(DISTINCT fact_order_item.order_id)
+FROM fact_order_item
+JOIN dim_order
+ON fact_order_item.order_id = dim_order.id
+JOIN dim_date
+ON dim_date.id = dim_order.order_date
+WHERE dim_order.id > %(dim_order)s
+GROUP BY date_season
+ON CONFLICT (date_season) DO UPDATE SET
+number_of_orders = summary_orders_by_season.number_of_orders
+    + EXCLUDED.number_of_orders
+"""
+
+summary_orders_by_hour_refresh = """
+INSERT INTO summary_orders_by_hour(date_hour, date_am_or_pm, number_of_orders)
+SELECT date_hour, date_am_or_pm, COUNT(DISTINCT fact_order_item.order_id)
+FROM fact_order_item
+JOIN dim_order
+ON fact_order_item.order_id = dim_order.id
+JOIN dim_date
+ON dim_date.id = dim_order.order_date
+WHERE dim_order.id > %(dim_order)s
+GROUP BY date_hour, date_am_or_pm
+ON CONFLICT (date_hour, date_am_or_pm) DO UPDATE SET
+number_of_orders = summary_orders_by_hour.number_of_orders
+    + EXCLUDED.number_of_orders
+"""
+
+summary_orders_by_customer_state_refresh = """
+INSERT INTO summary_orders_by_customer_state(customer_state, number_of_orders)
+SELECT customer_state, COUNT(DISTINCT fact_order_item.order_id)
+FROM fact_order_item
+JOIN dim_order
+ON fact_order_item.order_id = dim_order.id
+JOIN dim_customer
+ON dim_order.customer_id = dim_customer.id
+WHERE dim_order.id > %(dim_order)s
+GROUP BY customer_state
+ON CONFLICT (customer_state) DO UPDATE SET
+number_of_orders = summary_orders_by_customer_state.number_of_orders
+    + EXCLUDED.number_of_orders
+"""
+
+summary_payment_type_refresh = """
+INSERT INTO summary_payment_type(payment_type, number_used)
+SELECT payment_type, COUNT(*)
+FROM fact_payment
+WHERE id > %(fact_payment)s
+GROUP BY payment_type
+ON CONFLICT (payment_type) DO UPDATE SET
+number_used = summary_payment_type.number_used + EXCLUDED.number_used
+"""
+
+# Orders that were never approved carry the 1900-12-31 placeholder date
+summary_approval_delay_refresh = """
+INSERT INTO summary_approval_delay(
+    order_status,
+    approved_orders,
+    total_delay_seconds,
+    min_delay_seconds,
+    max_delay_seconds
+)
+SELECT
+    order_status,
+    COUNT(*),
+    SUM(delay_seconds),
+    MIN(delay_seconds),
+    MAX(delay_seconds)
+FROM (
+    SELECT
+        dim_order.order_status,
+        EXTRACT(EPOCH FROM approved.date_key - ordered.date_key) delay_seconds
+    FROM dim_order
+    JOIN dim_date ordered
+    ON ordered.id = dim_order.order_date
+    JOIN dim_date approved
+    ON approved.id = dim_order.order_approved_date
+    WHERE dim_order.id > %(dim_order)s
+    AND approved.date_key <> '1900-12-31'
+    AND ordered.date_key <> '1900-12-31'
+) delays
+GROUP BY order_status
+ON CONFLICT (order_status) DO UPDATE SET
+approved_orders = summary_approval_delay.approved_orders
+    + EXCLUDED.approved_orders,
+total_delay_seconds = summary_approval_delay.total_delay_seconds
+    + EXCLUDED.total_delay_seconds,
+min_delay_seconds = LEAST(
+    summary_approval_delay.min_delay_seconds, EXCLUDED.min_delay_seconds
+),
+max_delay_seconds = GREATEST(
+    summary_approval_delay.max_delay_seconds, EXCLUDED.max_delay_seconds
+)
+"""
+
+summary_refresh_queries = [
+    summary_orders_by_season_refresh,
+    summary_orders_by_hour_refresh,
+    summary_orders_by_customer_state_refresh,
+    summary_payment_type_refresh,
+    summary_approval_delay_refresh,
+]
+
+select_checkpoints = "SELECT stage, source, rows_done, completed FROM etl_checkpoint"
+etl_checkpoint_upsert = """
+INSERT INTO etl_checkpoint(stage, source, rows_done, completed)
+VALUES (%s, %s, %s, %s)
+ON CONFLICT (stage, source) DO UPDATE SET
+rows_done = EXCLUDED.rows_done,
+completed = EXCLUDED.completed,
+updated_at = now()
+"""
+delete_checkpoints = "DELETE FROM etl_checkpoint"
+
+select_run_state = "SELECT options, dropped_indexes, finished_at FROM etl_run_state"
+etl_run_state_upsert = """
+INSERT INTO etl_run_state(options) VALUES (%s)
+ON CONFLICT (id) DO UPDATE SET
+options = EXCLUDED.options,
+dropped_indexes = NULL,
+started_at = now(),
+finished_at = NULL
+"""
+update_run_state_dropped_indexes = "UPDATE etl_run_state SET dropped_indexes = %s"
+update_run_state_finished = "UPDATE etl_run_state SET finished_at = now()"
+
+select_data_version = "SELECT version FROM etl_data_version"
+etl_data_version_upsert = """
+INSERT INTO etl_data_version(version) VALUES (%s)
+ON CONFLICT (id) DO UPDATE SET
+version = EXCLUDED.version,
+loaded_at = now()
+"""
+
+# dim_date.id has no default when the database uses smart date keys
+select_date_id_default = """
+SELECT column_default FROM information_schema.columns
+WHERE table_schema = current_schema()
+AND table_name = 'dim_date' AND column_name = 'id'
+"""
+
+select_partitioned_tables = """
+SELECT pg_class.relname
+FROM pg_partitioned_table
+JOIN pg_class ON pg_class.oid = pg_partitioned_table.partrelid
+"""
+
+# Pushdown mode: the source CSVs are copied as text into UNLOGGED raw_<source>
+# tables and cleaned by the queries below, which build the staging_<table>
+# tables the merges read from. They follow the cleaning rules of etl.py.
+try_timestamp_function = """
+CREATE OR REPLACE FUNCTION try_timestamp(value TEXT) RETURNS TIMESTAMP AS $$
+BEGIN
+    RETURN value::TIMESTAMP;
+EXCEPTION WHEN others THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE
+"""
+
+pushdown_dim_customer = """
+SELECT DISTINCT ON (user_name)
+    user_name customer_id,
+    customer_zip_code,
+    customer_city,
+    customer_state,
+    NULL::BIGINT attribute_hash
+FROM raw_user
+WHERE user_name IS NOT NULL
+ORDER BY user_name, line_number DESC
+"""
+
+pushdown_dim_seller = """
+SELECT DISTINCT ON (seller_id)
+    seller_id,
+    seller_zip_code,
+    seller_city,
+    seller_state,
+    NULL::BIGINT attribute_hash
+FROM raw_seller
+WHERE seller_id IS NOT NULL
+ORDER BY seller_id, line_number DESC
+"""
+
+pushdown_dim_product = """
+SELECT DISTINCT ON (product_id)
+    product_id,
+    COALESCE(product_category, 'Unknown') product_category_name,
+    COALESCE(product_name_lenght::NUMERIC, 0) product_name_length,
+    COALESCE(product_description_lenght::NUMERIC, 0) product_description_length,
+    COALESCE(product_photos_qty::NUMERIC, 0) product_photos_qty,
+    COALESCE(product_weight_g::NUMERIC, 0) product_weight_g,
+    COALESCE(product_length_cm::NUMERIC, 0) product_length_cm,
+    COALESCE(product_height_cm::NUMERIC, 0) product_height_cm,
+    COALESCE(product_width_cm::NUMERIC, 0) product_width_cm,
+    NULL::BIGINT attribute_hash
+FROM raw_products
+WHERE product_id IS NOT NULL
+ORDER BY product_id, line_number DESC
+"""
+
+# Missing order dates become 1900-12-31, missing item and feedback dates are
+# left out like the rows that carry them. Seasons follow date_dimension.py,
+# id is the smart date key, which only dim_date_smart_key_merge uses.
+pushdown_dim_date = """
+WITH dates AS (
+    SELECT COALESCE(try_timestamp(value), '1900-12-31') date_key
+    FROM raw_order,
+    unnest(ARRAY[
+        order_date,
+        order_approved_date,
+        pickup_date,
+        delivered_date,
+        estimated_time_delivery
+    ]) value
+    WHERE order_id IS NOT NULL
+    UNION
+    SELECT try_timestamp(pickup_limit_date) FROM raw_order_item
+    UNION
+    SELECT try_timestamp(value)
+    FROM raw_feedback,
+    unnest(ARRAY[feedback_form_sent_date, feedback_answer_date]) value
+)
+SELECT
+    to_char(date_key, 'YYYYMMDDHH24MISS')::BIGINT id,
+    date_key,
+    EXTRACT(YEAR FROM date_key)::INT date_year,
+    EXTRACT(QUARTER FROM date_key)::INT date_quarter,
+    CASE
+        WHEN (date_month = 12 AND date_day >= 21)
+            OR (date_month <= 3 AND date_day < 21) THEN 'Winter'
+        WHEN (date_month = 3 AND date_day >= 21)
+            OR (date_month <= 6 AND date_day < 21) THEN 'Spring'
+        WHEN (date_month = 6 AND date_day >= 21)
+            OR (date_month <= 9 AND date_day < 21) THEN 'Summer'
+        WHEN (date_month = 9 AND date_day >= 21)
+            OR date_month < 12
+            OR (date_month = 12 AND date_day < 21) THEN 'Fall'
+        ELSE ''
+    END date_season,
+    date_month,
+    to_char(date_key, 'FMMonth') date_month_name,
+    date_day,
+    to_char(date_key, 'FMDay') date_day_name,
+    date_hour,
+    CASE WHEN date_hour < 12 THEN 'AM' ELSE 'PM' END date_am_or_pm
+FROM (
+    SELECT
+        date_key,
+        EXTRACT(MONTH FROM date_key)::INT date_month,
+        EXTRACT(DAY FROM date_key)::INT date_day,
+        EXTRACT(HOUR FROM date_key)::INT date_hour
+    FROM dates
+    WHERE date_key IS NOT NULL
+) parts
+"""
+
+# etl.py fills every missing column of an order with the placeholder date,
+# so a missing status is stored as its text. Dimension rows loaded here have
+# no attribute_hash, the next pandas load compares them as changed.
+pushdown_dim_order = """
+SELECT DISTINCT ON (o.order_id)
+    o.order_id,
+    dim_customer.id customer_id,
+    COALESCE(o.order_status, '1900-12-31 00:00:00') order_status,
+    order_date.id order_date,
+    order_approved_date.id order_approved_date,
+    pickup_date.id pickup_date,
+    delivered_date.id delivered_date,
+    estimated_time_delivery.id estimated_time_delivery,
+    NULL::BIGINT attribute_hash
+FROM (
+    SELECT
+        line_number,
+        order_id,
+        btrim(user_name) user_name,
+        order_status,
+        COALESCE(try_timestamp(order_date), '1900-12-31') order_date,
+        COALESCE(try_timestamp(order_approved_date), '1900-12-31')
+            order_approved_date,
+        COALESCE(try_timestamp(pickup_date), '1900-12-31') pickup_date,
+        COALESCE(try_timestamp(delivered_date), '1900-12-31') delivered_date,
+        COALESCE(try_timestamp(estimated_time_delivery), '1900-12-31')
+            estimated_time_delivery
+    FROM raw_order
+    WHERE order_id IS NOT NULL
+) o
+JOIN dim_customer
+ON dim_customer.customer_id = o.user_name
+JOIN dim_date order_date
+ON order_date.date_key = o.order_date
+JOIN dim_date order_approved_date
+ON order_approved_date.date_key = o.order_approved_date
+JOIN dim_date pickup_date
+ON pickup_date.date_key = o.pickup_date
+JOIN dim_date delivered_date
+ON delivered_date.date_key = o.delivered_date
+JOIN dim_date estimated_time_delivery
+ON estimated_time_delivery.date_key = o.estimated_time_delivery
+ORDER BY o.order_id, o.line_number DESC
+"""
+
+pushdown_fact_order_item = """
+SELECT DISTINCT ON (dim_order.id, i.order_item_id)
+    i.order_item_id,
+    dim_order.id order_id,
+    to_char(order_date.date_key, 'YYYYMM')::INT order_month,
+    dim_product.id product_id,
+    dim_seller.id seller_id,
+    pickup_limit_date.id pickup_limit_date,
+    i.price::NUMERIC price,
+    i.shipping_cost::NUMERIC shipping_cost
+FROM (
+    SELECT
+        line_number,
+        btrim(order_id) order_id,
+        order_item_id,
+        btrim(product_id) product_id,
+        btrim(seller_id) seller_id,
+        try_timestamp(pickup_limit_date) pickup_limit_date,
+        price,
+        shipping_cost
+    FROM raw_order_item
+    WHERE order_item_id IS NOT NULL
+) i
+JOIN dim_order
+ON dim_order.order_id = i.order_id
+JOIN dim_date order_date
+ON order_date.id = dim_order.order_date
+JOIN dim_product
+ON dim_product.product_id = i.product_id
+JOIN dim_seller
+ON dim_seller.seller_id = i.seller_id
+JOIN dim_date pickup_limit_date
+ON pickup_limit_date.date_key = i.pickup_limit_date
+ORDER BY dim_order.id, i.order_item_id, i.line_number DESC
+"""
+
+pushdown_fact_payment = """
+SELECT DISTINCT ON (dim_order.id, p.payment_sequential)
+    dim_order.id order_id,
+    to_char(order_date.date_key, 'YYYYMM')::INT order_month,
+    p.payment_sequential,
+    p.payment_type,
+    p.payment_installments,
+    p.payment_value
+FROM (
+    SELECT
+        line_number,
+        order_id,
+        payment_sequential::NUMERIC::INT payment_sequential,
+        payment_type,
+        payment_installments::NUMERIC::INT payment_installments,
+        payment_value::NUMERIC payment_value
+    FROM raw_payment
+    WHERE order_id IS NOT NULL
+) p
+JOIN dim_order
+ON dim_order.order_id = p.order_id
+JOIN dim_date order_date
+ON order_date.id = dim_order.order_date
+ORDER BY dim_order.id, p.payment_sequential, p.line_number DESC
+"""
+
+pushdown_fact_feedback = """
+SELECT DISTINCT ON (f.feedback_id, dim_order.id)
+    f.feedback_id,
+    dim_order.id order_id,
+    to_char(order_date.date_key, 'YYYYMM')::INT order_month,
+    f.feedback_score,
+    feedback_form_sent_date.id feedback_form_sent_date,
+    feedback_answer_date.id feedback_answer_date
+FROM (
+    SELECT
+        line_number,
+        feedback_id,
+        btrim(order_id) order_id,
+        feedback_score::NUMERIC::INT feedback_score,
+        try_timestamp(feedback_form_sent_date) feedback_form_sent_date,
+        try_timestamp(feedback_answer_date) feedback_answer_date
+    FROM raw_feedback
+    WHERE feedback_id IS NOT NULL
+) f
+JOIN dim_order
+ON dim_order.order_id = f.order_id
+JOIN dim_date order_date
+ON order_date.id = dim_order.order_date
+JOIN dim_date feedback_form_sent_date
+ON feedback_form_sent_date.date_key = f.feedback_form_sent_date
+JOIN dim_date feedback_answer_date
+ON feedback_answer_date.date_key = f.feedback_answer_date
+ORDER BY f.feedback_id, dim_order.id, f.line_number DESC
+"""
+
+# Rows of the raw tables the pushdown queries above leave out, with the
+# reason code validation gives them in the other modes, so pushdown
+# quarantines the same rows. The columns are in the order the cleaned frames
+# have them, the quarantine files are shared by every mode.
+pushdown_dim_order_rejects = """
+SELECT
+    order_id,
+    user_name,
+    order_status,
+    order_date,
+    order_approved_date,
+    pickup_date,
+    delivered_date,
+    estimated_time_delivery,
+    r.reject_reason
+FROM raw_order, LATERAL (
+    SELECT CASE
+        WHEN order_id IS NULL THEN 'missing_order_id'
+        WHEN user_name IS NULL THEN 'missing_user_name'
+        WHEN NOT EXISTS (
+            SELECT 1 FROM dim_customer
+            WHERE dim_customer.customer_id = btrim(raw_order.user_name)
+        ) THEN 'unknown_user_name'
+    END reject_reason
+) r
+WHERE r.reject_reason IS NOT NULL
+ORDER BY line_number
+"""
+
+pushdown_fact_order_item_rejects = """
+SELECT
+    order_id,
+    order_item_id,
+    product_id,
+    seller_id,
+    price,
+    shipping_cost,
+    pickup_limit_date,
+    r.reject_reason
+FROM raw_order_item, LATERAL (
+    SELECT CASE
+        WHEN order_id IS NULL THEN 'missing_order_id'
+        WHEN order_item_id IS NULL THEN 'missing_order_item_id'
+        WHEN product_id IS NULL THEN 'missing_product_id'
+        WHEN seller_id IS NULL THEN 'missing_seller_id'
+        WHEN pickup_limit_date IS NULL THEN 'missing_pickup_limit_date'
+        WHEN try_timestamp(pickup_limit_date) IS NULL
+            THEN 'invalid_pickup_limit_date'
+        WHEN NOT EXISTS (
+            SELECT 1 FROM dim_order
+            WHERE dim_order.order_id = btrim(raw_order_item.order_id)
+        ) THEN 'unknown_order_id'
+        WHEN NOT EXISTS (
+            SELECT 1 FROM dim_product
+            WHERE dim_product.product_id = btrim(raw_order_item.product_id)
+        ) THEN 'unknown_product_id'
+        WHEN NOT EXISTS (
+            SELECT 1 FROM dim_seller
+            WHERE dim_seller.seller_id = btrim(raw_order_item.seller_id)
+        ) THEN 'unknown_seller_id'
+        WHEN NOT EXISTS (
+            SELECT 1 FROM dim_date
+            WHERE dim_date.date_key = try_timestamp(raw_order_item.pickup_limit_date)
+        ) THEN 'unknown_pickup_limit_date'
+    END reject_reason
+) r
+WHERE r.reject_reason IS NOT NULL
+ORDER BY line_number
+"""
+
+pushdown_fact_payment_rejects = """
+SELECT
+    order_id,
+    payment_sequential,
+    payment_type,
+    payment_installments,
+    payment_value,
+    r.reject_reason
+FROM raw_payment, LATERAL (
+    SELECT CASE
+        WHEN order_id IS NULL THEN 'missing_order_id'
+        WHEN NOT EXISTS (
+            SELECT 1 FROM dim_order
+            WHERE dim_order.order_id = raw_payment.order_id
+        ) THEN 'unknown_order_id'
+    END reject_reason
+) r
+WHERE r.reject_reason IS NOT NULL
+ORDER BY line_number
+"""
+
+pushdown_fact_feedback_rejects = """
+SELECT
+    feedback_id,
+    order_id,
+    feedback_score,
+    feedback_form_sent_date,
+    feedback_answer_date,
+    r.reject_reason
+FROM raw_feedback, LATERAL (
+    SELECT CASE
+        WHEN feedback_id IS NULL THEN 'missing_feedback_id'
+        WHEN order_id IS NULL THEN 'missing_order_id'
+        WHEN feedback_form_sent_date IS NULL
+            THEN 'missing_feedback_form_sent_date'
+        WHEN feedback_answer_date IS NULL THEN 'missing_feedback_answer_date'
+        WHEN try_timestamp(feedback_form_sent_date) IS NULL
+            THEN 'invalid_feedback_form_sent_date'
+        WHEN try_timestamp(feedback_answer_date) IS NULL
+            THEN 'invalid_feedback_answer_date'
+        WHEN NOT EXISTS (
+            SELECT 1 FROM dim_order
+            WHERE dim_order.order_id = btrim(raw_feedback.order_id)
+        ) THEN 'unknown_order_id'
+        WHEN NOT EXISTS (
+            SELECT 1 FROM dim_date
+            WHERE dim_date.date_key = try_timestamp(
+                raw_feedback.feedback_form_sent_date
+            )
+        ) THEN 'unknown_feedback_form_sent_date'
+        WHEN NOT EXISTS (
+            SELECT 1 FROM dim_date
+            WHERE dim_date.date_key = try_timestamp(
+                raw_feedback.feedback_answer_date
+            )
+        ) THEN 'unknown_feedback_answer_date'
+    END reject_reason
+) r
+WHERE r.reject_reason IS NOT NULL
+ORDER BY line_number
+"""
+
+# DuckDB target: the same star schema and summaries in an embedded file.
+# Ids are numbered by the build queries below instead of SERIAL columns.
+duckdb_create_table_queries = [
+    query.replace("id SERIAL PRIMARY KEY", "id INTEGER PRIMARY KEY")
+    for query in [
+        # The date columns of the other tables are BIGINT, DuckDB wants the
+        # key they reference to have the same type
+        dim_date_smart_key_table,
+        dim_customer_table,
+        dim_seller_table,
+        dim_product_table,
+        dim_order_table,
+        fact_payment_table,
+        fact_order_item_table,
+        fact_feedback_table,
+        summary_orders_by_season_table,
+        summary_orders_by_hour_table,
+        summary_orders_by_customer_state_table,
+        summary_payment_type_table,
+        summary_approval_delay_table,
+        etl_data_version_table,
+    ]
 ]
+duckdb_data_version_insert = "INSERT INTO etl_data_version(version) VALUES (?)"
+
+# The cleaned source frames are ingested into clean_<stage> tables with the
+# line_number of every row, these queries resolve their keys and build the
+# star schema from them. A dimension keeps the last row of every natural key
+# like the merges do, the facts keep every row like a full load. Rows
+# rejected by validation are skipped, but their dates are loaded like the
+# date stage does.
+duckdb_select_dates = """
+WITH orders AS (SELECT * FROM clean_order WHERE order_id IS NOT NULL)
+SELECT order_date date_key FROM orders
+UNION SELECT order_approved_date FROM orders
+UNION SELECT pickup_date FROM orders
+UNION SELECT delivered_date FROM orders
+UNION SELECT estimated_time_delivery FROM orders
+UNION SELECT pickup_limit_date FROM clean_order_item
+UNION SELECT feedback_form_sent_date FROM clean_feedback
+UNION SELECT feedback_answer_date FROM clean_feedback
+"""
+
+duckdb_dim_customer = """
+INSERT INTO dim_customer(
+    id,
+    customer_id,
+    customer_zip_code,
+    customer_city,
+    customer_state
+)
+SELECT
+    row_number() OVER (ORDER BY line_number),
+    customer_id,
+    customer_zip_code,
+    customer_city,
+    customer_state
+FROM (
+    SELECT * FROM clean_customer
+    QUALIFY row_number() OVER (
+        PARTITION BY customer_id ORDER BY line_number DESC
+    ) = 1
+) customers
+"""
+
+duckdb_dim_seller = """
+INSERT INTO dim_seller(
+    id,
+    seller_id,
+    seller_zip_code,
+    seller_city,
+    seller_state
+)
+SELECT
+    row_number() OVER (ORDER BY line_number),
+    seller_id,
+    seller_zip_code,
+    seller_city,
+    seller_state
+FROM (
+    SELECT * FROM clean_seller
+    QUALIFY row_number() OVER (
+        PARTITION BY seller_id ORDER BY line_number DESC
+    ) = 1
+) sellers
+"""
+
+duckdb_dim_product = """
+INSERT INTO dim_product(
+    id,
+    product_id,
+    product_category_name,
+    product_name_length,
+    product_description_length,
+    product_photos_qty,
+    product_weight_g,
+    product_length_cm,
+    product_height_cm,
+    product_width_cm
+)
+SELECT
+    row_number() OVER (ORDER BY line_number),
+    product_id,
+    product_category_name,
+    product_name_length,
+    product_description_length,
+    product_photos_qty,
+    product_weight_g,
+    product_length_cm,
+    product_height_cm,
+    product_width_cm
+FROM (
+    SELECT * FROM clean_product
+    QUALIFY row_number() OVER (
+        PARTITION BY product_id ORDER BY line_number DESC
+    ) = 1
+) products
+"""
+
+duckdb_dim_order = """
+INSERT INTO dim_order(
+    id,
+    order_id,
+    customer_id,
+    order_status,
+    order_date,
+    order_approved_date,
+    pickup_date,
+    delivered_date,
+    estimated_time_delivery
+)
+SELECT
+    row_number() OVER (ORDER BY line_number),
+    order_id,
+    customer_id,
+    order_status,
+    order_date,
+    order_approved_date,
+    pickup_date,
+    delivered_date,
+    estimated_time_delivery
+FROM (
+    SELECT
+        o.line_number,
+        o.order_id,
+        dim_customer.id customer_id,
+        o.order_status,
+        order_date.id order_date,
+        order_approved_date.id order_approved_date,
+        pickup_date.id pickup_date,
+        delivered_date.id delivered_date,
+        estimated_time_delivery.id estimated_time_delivery
+    FROM clean_order o
+    JOIN dim_customer
+    ON dim_customer.customer_id = o.user_name
+    JOIN dim_date order_date
+    ON order_date.date_key = o.order_date
+    JOIN dim_date order_approved_date
+    ON order_approved_date.date_key = o.order_approved_date
+    JOIN dim_date pickup_date
+    ON pickup_date.date_key = o.pickup_date
+    JOIN dim_date delivered_date
+    ON delivered_date.date_key = o.delivered_date
+    JOIN dim_date estimated_time_delivery
+    ON estimated_time_delivery.date_key = o.estimated_time_delivery
+    WHERE NOT o.rejected
+    QUALIFY row_number() OVER (
+        PARTITION BY o.order_id ORDER BY o.line_number DESC
+    ) = 1
+) orders
+"""
 
-select_customer_by_id = "SELECT id FROM dim_customer WHERE customer_id = %s"
-select_order_by_id = "SELECT id FROM dim_order WHERE order_id = %s"
-select_product_by_id = "SELECT id FROM dim_product WHERE product_id = %s"
-select_seller_by_id = "SELECT id FROM dim_seller WHERE seller_id = %s"
-select_date_by_key = "SELECT id FROM dim_date WHERE date_key = %s"
+duckdb_fact_order_item = """
+INSERT INTO fact_order_item(
+    id,
+    order_item_id,
+    order_id,
+    order_month,
+    product_id,
+    seller_id,
+    pickup_limit_date,
+    price,
+    shipping_cost
+)
+SELECT
+    row_number() OVER (ORDER BY i.line_number),
+    i.order_item_id,
+    dim_order.id,
+    year(order_date.date_key) * 100 + month(order_date.date_key),
+    dim_product.id,
+    dim_seller.id,
+    pickup_limit_date.id,
+    i.price,
+    i.shipping_cost
+FROM clean_order_item i
+JOIN dim_order
+ON dim_order.order_id = i.order_id
+JOIN dim_date order_date
+ON order_date.id = dim_order.order_date
+JOIN dim_product
+ON dim_product.product_id = i.product_id
+JOIN dim_seller
+ON dim_seller.seller_id = i.seller_id
+JOIN dim_date pickup_limit_date
+ON pickup_limit_date.date_key = i.pickup_limit_date
+WHERE NOT i.rejected
+"""
+
+duckdb_fact_payment = """
+INSERT INTO fact_payment(
+    id,
+    order_id,
+    order_month,
+    payment_sequential,
+    payment_type,
+    payment_installments,
+    payment_value
+)
+SELECT
+    row_number() OVER (ORDER BY p.line_number),
+    dim_order.id,
+    year(order_date.date_key) * 100 + month(order_date.date_key),
+    p.payment_sequential,
+    p.payment_type,
+    p.payment_installments,
+    p.payment_value
+FROM clean_payment p
+JOIN dim_order
+ON dim_order.order_id = p.order_id
+JOIN dim_date order_date
+ON order_date.id = dim_order.order_date
+WHERE NOT p.rejected
+"""
+
+duckdb_fact_feedback = """
+INSERT INTO fact_feedback(
+    id,
+    feedback_id,
+    order_id,
+    order_month,
+    feedback_score,
+    feedback_form_sent_date,
+    feedback_answer_date
+)
+SELECT
+    row_number() OVER (ORDER BY f.line_number),
+    f.feedback_id,
+    dim_order.id,
+    year(order_date.date_key) * 100 + month(order_date.date_key),
+    f.feedback_score,
+    feedback_form_sent_date.id,
+    feedback_answer_date.id
+FROM clean_feedback f
+JOIN dim_order
+ON dim_order.order_id = f.order_id
+JOIN dim_date order_date
+ON order_date.id = dim_order.order_date
+JOIN dim_date feedback_form_sent_date
+ON feedback_form_sent_date.date_key = f.feedback_form_sent_date
+JOIN dim_date feedback_answer_date
+ON feedback_answer_date.date_key = f.feedback_answer_date
+WHERE NOT f.rejected
+"""
@@ -0,0 +1,37 @@
+import io
+
+import pandas as pd
+
+import validation
+from quires import etl_retry_insert, etl_retry_take
+
+
+# Rejected rows whose only fault is a key that is not loaded yet, the
+# dimension row they reference may arrive with a later file
+def waiting(rejected):
+    return rejected[
+        rejected[validation.REASON].str.startswith("unknown_", na=False).to_numpy()
+    ]
+
+
+# Keeps the waiting rows of `rejected` for the next incremental run, in the
+# transaction that rejects them
+def hold(cur, table, rejected):
+    held = waiting(rejected)
+    if held.empty:
+        return 0
+    cur.execute(
+        etl_retry_insert,
+        (table, held.drop(columns=validation.REASON).to_csv(index=False)),
+    )
+    return len(held)
+
+
+# Removes the rows held for `table` and returns them as frames read with
+# `read_options`, one per batch of rejected rows. They are held again if
+# loading them rejects them again.
+def take(cur, table, read_options):
+    cur.execute(etl_retry_take, (table,))
+    return [
+        pd.read_csv(io.StringIO(rows), **read_options) for (rows,) in cur.fetchall()
+    ]
@@ -1,7 +1,160 @@
+import argparse
+from datetime import datetime
+
 import create_db
 import etl
+from settings import (
+    ETL_CHUNK_SIZE,
+    ETL_FACT_SHARDS,
+    ETL_INFER_MEMBERS,
+    ETL_PIPELINE,
+    ETL_STAGING_CACHE,
+    ETL_TARGET,
+    ETL_WORKERS,
+    FACT_PARTITIONING,
+    SMART_DATE_KEYS,
+)
+
+
+def partition_month(value):
+    month = datetime.strptime(value, "%Y-%m")
+    return month.year * 100 + month.month
 
 
 if __name__ == "__main__":
-    create_db.main()
-    etl.main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=ETL_CHUNK_SIZE,
+        help="stream every source file in chunks of this many rows",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="keep the database and load only rows added since the last run "
+        "instead of dropping and rebuilding everything",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=ETL_WORKERS,
+        help="run independent ETL stages in parallel on this many connections",
+    )
+    parser.add_argument(
+        "--no-staging-cache",
+        dest="staging_cache",
+        action="store_false",
+        default=ETL_STAGING_CACHE,
+        help="always parse and clean the source CSVs instead of reusing "
+        "the cleaned frames cached by earlier runs",
+    )
+    parser.add_argument(
+        "--partitioned",
+        action="store_true",
+        default=FACT_PARTITIONING,
+        help="create the fact tables partitioned by month of the order date",
+    )
+    parser.add_argument(
+        "--smart-date-keys",
+        action="store_true",
+        default=SMART_DATE_KEYS,
+        help="create dim_date keyed by the YYYYMMDDHHMMSS integer of every "
+        "date, so the ETL computes date keys instead of looking them up",
+    )
+    parser.add_argument(
+        "--reload-partition",
+        type=partition_month,
+        metavar="YYYY-MM",
+        help="truncate one month of the partitioned fact tables and load it "
+        "again from the source files, leaving everything else in place",
+    )
+    parser.add_argument(
+        "--pushdown",
+        action="store_true",
+        help="copy the raw source files into the database and clean, resolve "
+        "and load them there with set-based SQL",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue the last ETL run where it stopped, keeping the stages "
+        "and chunks it already committed",
+    )
+    parser.add_argument(
+        "--pipelined",
+        action="store_true",
+        default=ETL_PIPELINE,
+        help="parse the next chunk and clean it on separate threads while "
+        "the current one is written, use together with --chunk-size",
+    )
+    parser.add_argument(
+        "--infer-members",
+        action="store_true",
+        default=ETL_INFER_MEMBERS,
+        help="load facts whose customer, seller, product or order is not "
+        "loaded yet against placeholder members, which the dimension rows "
+        "replace once they arrive",
+    )
+    parser.add_argument(
+        "--fact-shards",
+        type=int,
+        default=ETL_FACT_SHARDS,
+        help="split the fact rows by order across this many processes, each "
+        "loading its share on its own connection",
+    )
+    parser.add_argument(
+        "--target",
+        choices=["postgres", "duckdb"],
+        default=ETL_TARGET,
+        help="load into PostgreSQL, or into an embedded DuckDB file that needs "
+        "no server",
+    )
+    args = parser.parse_args()
+
+    if args.target == "duckdb":
+        # Imported here so loading into PostgreSQL does not need duckdb
+        import duckdb_target
+
+        if (
+            args.incremental
+            or args.workers > 1
+            or args.partitioned
+            or args.smart_date_keys
+            or args.reload_partition is not None
+            or args.pushdown
+            or args.resume
+            or args.infer_members
+            or args.fact_shards > 1
+        ):
+            parser.error(
+                "the duckdb target always rebuilds the whole file, it only "
+                "supports --chunk-size, --no-staging-cache and --pipelined"
+            )
+        duckdb_target.create_tables()
+        duckdb_target.main(
+            chunk_size=args.chunk_size,
+            staging_cache=args.staging_cache,
+            pipelined=args.pipelined,
+        )
+        parser.exit()
+
+    if args.resume:
+        create_db.create_tables()
+    elif args.reload_partition is None:
+        if args.incremental:
+            create_db.create_tables(args.partitioned, args.smart_date_keys)
+        else:
+            create_db.main(args.partitioned, args.smart_date_keys)
+    etl.main(
+        chunk_size=args.chunk_size,
+        incremental=args.incremental,
+        workers=args.workers,
+        staging_cache=args.staging_cache,
+        partition=args.reload_partition,
+        pushdown_mode=args.pushdown,
+        resume=args.resume,
+        pipelined=args.pipelined,
+        infer_members=args.infer_members,
+        fact_shards=args.fact_shards,
+    )
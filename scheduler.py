@@ -0,0 +1,39 @@
+import logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+logger = logging.getLogger(__name__)
+
+
+def run_pooled(pool, task, *args):
+    conn = pool.getconn()
+    try:
+        return task(conn, *args)
+    finally:
+        pool.putconn(conn)
+
+
+# Runs every job once all the jobs it depends on have finished, up to
+# `workers` at a time, each on its own connection from `pool`.
+# `dependencies` maps a job name to the names it waits for and `task` is
+# called as task(conn, name). The first failure is raised once the jobs
+# already running have finished.
+def run_jobs(pool, task, dependencies, workers):
+    pending = dict(dependencies)
+    running = {}
+    done = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            for name, waits_for in list(pending.items()):
+                if set(waits_for) <= done:
+                    logger.info(f"Scheduling {name}")
+                    running[executor.submit(run_pooled, pool, task, name)] = name
+                    del pending[name]
+
+            if not running:
+                raise ValueError(f"Unresolvable dependencies: {pending}")
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                future.result()
+                done.add(name)
@@ -0,0 +1,95 @@
+# Compact dtypes of the source CSV files. Identifiers are Arrow-backed strings,
+# repeated low-cardinality strings categoricals, small counts the narrowest
+# nullable integer that holds them and dates are parsed while reading. Product
+# measures are float32, which holds whole grams and centimetres exactly.
+# Prices stay float64, they are stored as exact decimals.
+ID = "string[pyarrow]"
+CATEGORY = "category"
+DATE = "date"
+
+# source -> {column: dtype}, only these columns are read
+SOURCE_SCHEMAS = {
+    "user": {
+        "user_name": ID,
+        "customer_zip_code": ID,
+        "customer_city": CATEGORY,
+        "customer_state": CATEGORY,
+    },
+    "seller": {
+        "seller_id": ID,
+        "seller_zip_code": ID,
+        "seller_city": CATEGORY,
+        "seller_state": CATEGORY,
+    },
+    "products": {
+        "product_id": ID,
+        "product_category": CATEGORY,
+        "product_name_lenght": "Int16",
+        "product_description_lenght": "Int32",
+        "product_photos_qty": "Int16",
+        "product_weight_g": "float32",
+        "product_length_cm": "float32",
+        "product_height_cm": "float32",
+        "product_width_cm": "float32",
+    },
+    "order": {
+        "order_id": ID,
+        "user_name": ID,
+        "order_status": CATEGORY,
+        "order_date": DATE,
+        "order_approved_date": DATE,
+        "pickup_date": DATE,
+        "delivered_date": DATE,
+        "estimated_time_delivery": DATE,
+    },
+    "order_item": {
+        "order_id": ID,
+        "order_item_id": ID,
+        "product_id": ID,
+        "seller_id": ID,
+        "price": "float64",
+        "shipping_cost": "float64",
+        "pickup_limit_date": DATE,
+    },
+    "payment": {
+        "order_id": ID,
+        "payment_sequential": "Int16",
+        "payment_type": CATEGORY,
+        "payment_installments": "Int16",
+        "payment_value": "float64",
+    },
+    "feedback": {
+        "feedback_id": ID,
+        "order_id": ID,
+        "feedback_score": "Int8",
+        "feedback_form_sent_date": DATE,
+        "feedback_answer_date": DATE,
+    },
+}
+
+
+# pd.read_csv options reading the columns of `source` in `usecols`, all of
+# them by default. A date column with values that are not dates is left as
+# strings, the transforms coerce it.
+def read_options(source, usecols=None):
+    schema = SOURCE_SCHEMAS[source]
+    columns = [column for column in schema if usecols is None or column in usecols]
+    return {
+        "usecols": columns,
+        "dtype": {
+            column: schema[column] for column in columns if schema[column] != DATE
+        },
+        "parse_dates": [column for column in columns if schema[column] == DATE],
+    }
+
+
+# Fills the nulls of a categorical with `value`, which has to be a category
+def fillna_category(values, value):
+    if value not in values.cat.categories:
+        values = values.cat.add_categories([value])
+    return values.fillna(value)
+
+
+# Bytes held by every column of `df`, including the strings they point to
+def memory_report(df):
+    return df.memory_usage(index=False, deep=True)
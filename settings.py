@@ -4,9 +4,10 @@ import os
 from dotenv import load_dotenv
 
 load_dotenv()
+LOG_FILE = "pipeline.log"
 logging.basicConfig(
     level=logging.DEBUG,
-    filename="pipeline.log",
+    filename=LOG_FILE,
     filemode="a",
     format="%(asctime)s - %(levelname)s - %(message)s",
 )
@@ -18,4 +19,45 @@ DB_USER = os.environ.get("DB_USER")
 DB_PASSWORD = os.environ.get("DB_PASSWORD")
 DB_HOST = os.environ.get("DB_HOST")
 DB_PORT = os.environ.get("DB_PORT")
+# Session settings of the ETL connections, see db.LOAD_SESSION. Statements
+# running longer than DB_STATEMENT_TIMEOUT are cancelled, 0 never cancels them.
+DB_SYNCHRONOUS_COMMIT = os.environ.get("DB_SYNCHRONOUS_COMMIT", "off")
+DB_WORK_MEM = os.environ.get("DB_WORK_MEM", "64MB")
+DB_MAINTENANCE_WORK_MEM = os.environ.get("DB_MAINTENANCE_WORK_MEM", "512MB")
+DB_STATEMENT_TIMEOUT = os.environ.get("DB_STATEMENT_TIMEOUT", "1h")
+# Run the statements repeated for every chunk as server-side prepared statements
+DB_PREPARE = os.environ.get("DB_PREPARE", "1") == "1"
 
+DATASET_DIR = os.environ.get("DATASET_DIR", "ecommerce_dataset")
+# Rows per chunk in streaming mode, unset reads every file in one piece
+ETL_CHUNK_SIZE = int(os.environ.get("ETL_CHUNK_SIZE", 0)) or None
+# Stages that do not depend on each other run on this many connections
+ETL_WORKERS = int(os.environ.get("ETL_WORKERS", 1))
+# Per-stage run reports are written next to the log file
+REPORT_DIR = os.path.dirname(os.path.abspath(LOG_FILE))
+# Cleaned source frames are cached here as Arrow files between runs
+STAGING_DIR = os.environ.get("STAGING_DIR", "staging_cache")
+ETL_STAGING_CACHE = os.environ.get("ETL_STAGING_CACHE", "1") == "1"
+# Parse, clean and write the chunks of a stage on separate threads, with at
+# most ETL_PIPELINE_QUEUE_SIZE chunks waiting between two of them
+ETL_PIPELINE = os.environ.get("ETL_PIPELINE", "0") == "1"
+ETL_PIPELINE_QUEUE_SIZE = int(os.environ.get("ETL_PIPELINE_QUEUE_SIZE", 2))
+# Load facts whose customer, seller, product or order is not loaded yet
+# against inferred members instead of dropping them
+ETL_INFER_MEMBERS = os.environ.get("ETL_INFER_MEMBERS", "0") == "1"
+# Fact rows are split by order across this many processes, each loading its
+# share on its own connection
+ETL_FACT_SHARDS = int(os.environ.get("ETL_FACT_SHARDS", 1))
+# Create the fact tables partitioned by month of the order date
+FACT_PARTITIONING = os.environ.get("FACT_PARTITIONING", "0") == "1"
+# Create dim_date keyed by the YYYYMMDDHHMMSS integer of every date, so date
+# keys are computed instead of looked up
+SMART_DATE_KEYS = os.environ.get("SMART_DATE_KEYS", "0") == "1"
+# Rows rejected by validation are appended to one CSV file per table here
+QUARANTINE_DIR = os.environ.get("QUARANTINE_DIR", "quarantine")
+# Business question results are cached here until the next ETL run
+QUESTIONS_DIR = os.environ.get("QUESTIONS_DIR", "Business_Questions")
+QUESTION_CACHE_DIR = os.environ.get("QUESTION_CACHE_DIR", "question_cache")
+# Load into PostgreSQL, or into the embedded DuckDB file at DUCKDB_PATH
+ETL_TARGET = os.environ.get("ETL_TARGET", "postgres")
+DUCKDB_PATH = os.environ.get("DUCKDB_PATH", "ecommerce.duckdb")
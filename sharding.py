@@ -0,0 +1,173 @@
+import logging
+import multiprocessing
+import queue
+import traceback
+
+import numpy as np
+
+import checkpoint
+import db
+from settings import ETL_PIPELINE_QUEUE_SIZE
+from sketches import hash_values
+
+logger = logging.getLogger(__name__)
+
+# Seconds the parent waits on a full queue before checking on the workers
+POLL_SECONDS = 0.1
+
+_DONE = None
+
+
+class _Failed:
+    def __init__(self, shard, error):
+        self.shard = shard
+        self.error = error
+
+
+# Every shard records its own progress, it commits it with its own rows
+def shard_source(source, shard):
+    return f"{source}.shard{shard}"
+
+
+# Rows of `source` every shard committed, the parent resumes from there and
+# each shard skips the rows it already loaded itself
+def rows_done(run, stage, source):
+    return min(
+        run.checkpoints.get((stage, shard_source(source, shard)), (0, False))[0]
+        for shard in range(run.fact_shards)
+    )
+
+
+def _load_shard(run, stage, step, shard, inputs, results):
+    source = shard_source(step.source, shard)
+    done = run.checkpoints.get((stage, source), (0, False))[0]
+    # Rejected rows are sent to the parent, the only one writing the
+    # quarantine files, with the counts of fact rows overwritten
+    run.pending_rejects = []
+    run.fact_updates = {}
+    try:
+        conn = db.connect(run.dsn)
+        cur = conn.cursor()
+        while True:
+            item = inputs.get()
+            if item is _DONE:
+                break
+            df, positions, rows_done = item
+            # A copy, the load flags rejected rows in it
+            df = df[positions >= done].copy()
+            with db.transaction(conn):
+                rows_written = step.load(cur, run, df) if not df.empty else 0
+                checkpoint.save(cur, stage, source, max(rows_done, done))
+            results.put((shard, rows_written, run.pending_rejects, run.fact_updates))
+            run.pending_rejects = []
+            run.fact_updates = {}
+        conn.close()
+        results.put((shard, _DONE, [], {}))
+    except Exception:
+        results.put(_Failed(shard, traceback.format_exc()))
+
+
+# Loads the chunks of a fact step on `run.fact_shards` worker processes. The
+# rows of every chunk are split by a hash of their order_id, so all the rows
+# of an order go to the same worker, which resolves their keys and writes
+# them on its own connection. The workers are forked with the key maps
+# already loaded and only read them. At most ETL_PIPELINE_QUEUE_SIZE chunks
+# wait for each worker, and the first failure of a worker is raised in the
+# parent.
+class ShardedLoad:
+    def __init__(self, run, stage, step, stage_metrics, reject_rows):
+        self.run = run
+        self.stage_metrics = stage_metrics
+        self.reject_rows = reject_rows
+        context = multiprocessing.get_context("fork")
+        self.inputs = [
+            context.Queue(maxsize=ETL_PIPELINE_QUEUE_SIZE)
+            for _ in range(run.fact_shards)
+        ]
+        self.results = context.Queue()
+        self.finished = set()
+        self.processes = [
+            context.Process(
+                target=_load_shard,
+                args=(run, stage, step, shard, inputs, self.results),
+                daemon=True,
+            )
+            for shard, inputs in enumerate(self.inputs)
+        ]
+        for process in self.processes:
+            process.start()
+        logger.info(f"Loading {stage} {step.source} on {run.fact_shards} shards")
+
+    def _handle(self, result):
+        if isinstance(result, _Failed):
+            raise RuntimeError(f"Shard {result.shard} failed:\n{result.error}")
+        shard, rows_written, rejects, fact_updates = result
+        if rows_written is _DONE:
+            self.finished.add(shard)
+            return
+        self.stage_metrics.rows_written += rows_written
+        for table, rejected in rejects:
+            self.reject_rows(self.run, table, rejected)
+        for table, rows in fact_updates.items():
+            self.run.fact_updates[table] = self.run.fact_updates.get(table, 0) + rows
+
+    def _collect(self, timeout=None):
+        try:
+            result = self.results.get(timeout=timeout) if timeout else None
+            while True:
+                if result is not None:
+                    self._handle(result)
+                result = self.results.get_nowait()
+        except queue.Empty:
+            pass
+        for shard, process in enumerate(self.processes):
+            if shard not in self.finished and process.exitcode is not None:
+                # A clean exit is only expected after the last result
+                self._collect_late(shard)
+
+    def _collect_late(self, shard):
+        try:
+            while shard not in self.finished:
+                self._handle(self.results.get(timeout=POLL_SECONDS))
+        except queue.Empty:
+            raise RuntimeError(
+                f"Shard {shard} exited with code {self.processes[shard].exitcode}"
+            )
+
+    def _put(self, shard, item):
+        while True:
+            try:
+                self.inputs[shard].put(item, timeout=POLL_SECONDS)
+                return
+            except queue.Full:
+                self._collect()
+
+    # Sends every worker its rows of `df`, with their positions among the
+    # rows of the source and the number of rows done once `df` is loaded
+    def send(self, df, rows_done):
+        shards = hash_values(df["order_id"]) % np.uint64(len(self.processes))
+        for shard in range(len(self.processes)):
+            mask = shards == shard
+            self._put(
+                shard,
+                (df[mask], rows_done + np.flatnonzero(mask), rows_done + len(df)),
+            )
+        self._collect()
+
+    # Waits for every worker to load its last rows
+    def finish(self):
+        for shard in range(len(self.processes)):
+            self._put(shard, _DONE)
+        while len(self.finished) < len(self.processes):
+            self._collect(timeout=POLL_SECONDS)
+        for process in self.processes:
+            process.join()
+
+    def close(self):
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        for inputs in self.inputs + [self.results]:
+            inputs.cancel_join_thread()
+            inputs.close()
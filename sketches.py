@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+
+
+def hash_values(values):
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+
+# Integers are read as floats in chunks that have nulls, both hash the same
+# once cast to float
+def comparable(values):
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values.astype("float64")
+    return values
+
+
+# One 64-bit hash per row of `df`, the same for the same values whichever
+# chunk or run they were read in
+def hash_rows(df):
+    return hash_values(
+        pd.DataFrame({name: comparable(values) for name, values in df.items()})
+    )
+
+
+# Estimates the number of distinct values of a column in a fixed 2**precision
+# bytes, the standard error is about 1.04 / sqrt(2**precision), 0.8% at the
+# default precision
+class HyperLogLog:
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.registers = np.zeros(2**precision, dtype=np.uint8)
+
+    def add_hashes(self, hashes):
+        if not len(hashes):
+            return
+        remaining_bits = 64 - self.precision
+        buckets = (hashes >> np.uint64(remaining_bits)).astype(np.int64)
+        rest = hashes & np.uint64(2**remaining_bits - 1)
+        # frexp gives the bit length of `rest`, exact since it has less than
+        # 53 bits, the rank is the position of its first set bit
+        _, bit_length = np.frexp(rest.astype(np.float64))
+        ranks = (remaining_bits - bit_length + 1).astype(np.uint8)
+        np.maximum.at(self.registers, buckets, ranks)
+
+    def add(self, values):
+        self.add_hashes(hash_values(values.dropna()))
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(int)))
+        zeros = np.count_nonzero(self.registers == 0)
+        # Linear counting is more accurate for small cardinalities
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)
+        return int(round(estimate))
+
+
+# Remembers which hashes were added in a bit array sized for `capacity`
+# values, a value never added is reported as seen with a probability of about
+# `error_rate` as long as no more than `capacity` values were added. The bits
+# are packed 64 to a word, about 1.8 bytes per value at the default rate.
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        capacity = max(int(capacity), 1)
+        self.size = int(np.ceil(-capacity * np.log(error_rate) / np.log(2) ** 2))
+        self.hash_count = max(1, int(round(self.size / capacity * np.log(2))))
+        self.words = np.zeros((self.size + 63) // 64, dtype=np.uint64)
+        self.error_rate = error_rate
+
+    def _positions(self, hashes):
+        # Double hashing, every position is derived from two halves of the hash
+        first = (hashes & np.uint64(2**32 - 1)).astype(np.uint64)
+        second = (hashes >> np.uint64(32)) | np.uint64(1)
+        return [
+            (first + np.uint64(i) * second) % np.uint64(self.size)
+            for i in range(self.hash_count)
+        ]
+
+    # Adds the hashes and returns a mask of the ones that were probably added
+    # before, repeated hashes are not seen within the same call
+    def add_hashes(self, hashes):
+        words_and_masks = [
+            (
+                (position >> np.uint64(6)).astype(np.int64),
+                np.uint64(1) << (position & np.uint64(63)),
+            )
+            for position in self._positions(hashes)
+        ]
+        seen = np.ones(len(hashes), dtype=bool)
+        for words, masks in words_and_masks:
+            seen &= (self.words[words] & masks) != 0
+        for words, masks in words_and_masks:
+            np.bitwise_or.at(self.words, words, masks)
+        return seen
@@ -0,0 +1,148 @@
+import glob
+import hashlib
+import inspect
+import logging
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+from settings import STAGING_DIR
+
+logger = logging.getLogger(__name__)
+
+_file_checksums = {}
+
+# Part of every staged file name, changed whenever the way frames are
+# stored changes
+STAGING_FORMAT = "arrow-stream"
+
+
+def file_checksum(path):
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if key not in _file_checksums:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(2**20), b""):
+                digest.update(block)
+        _file_checksums[key] = digest.hexdigest()
+    return _file_checksums[key]
+
+
+# The module defining `transform` and the modules of this repository it
+# imports, such as validation and schemas, whose functions the cleaning rules
+# call
+def rule_modules(transform):
+    module = inspect.getmodule(transform)
+    directory = os.path.dirname(os.path.abspath(module.__file__))
+    modules = {module}
+    for value in vars(module).values():
+        imported = value if inspect.ismodule(value) else inspect.getmodule(value)
+        path = getattr(imported, "__file__", None)
+        if path and os.path.dirname(os.path.abspath(path)) == directory:
+            modules.add(imported)
+    return sorted(modules, key=lambda module: module.__name__)
+
+
+# Any change to the cleaning rules or the modules they use, or to the read
+# options, invalidates the staged frames built with them
+def rules_fingerprint(transform, read_options):
+    digest = hashlib.sha256()
+    if transform is not None:
+        for module in rule_modules(transform):
+            digest.update(inspect.getsource(module).encode())
+        digest.update(transform.__name__.encode())
+    digest.update(repr(sorted(read_options.items())).encode())
+    return digest.hexdigest()
+
+
+def staged_path(path, transform=None, read_options=None):
+    name = os.path.splitext(os.path.basename(path))[0]
+    rules = transform.__name__ if transform is not None else "raw"
+    key = hashlib.sha256(
+        (
+            STAGING_FORMAT
+            + file_checksum(path)
+            + rules_fingerprint(transform, read_options or {})
+        ).encode()
+    ).hexdigest()[:16]
+    return os.path.join(STAGING_DIR, f"{name}.{rules}.{key}.arrow")
+
+
+def read_csv_once(path, **read_options):
+    yield pd.read_csv(path, **read_options)
+
+
+# Strings come back Arrow-backed instead of as Python objects
+STRING_TYPES = {
+    pa.string(): pd.StringDtype("pyarrow"),
+    pa.large_string(): pd.StringDtype("pyarrow"),
+}
+
+
+def _to_pandas(data):
+    return data.to_pandas(types_mapper=STRING_TYPES.get)
+
+
+def read_staged(target, chunk_size=None):
+    with pa.memory_map(target) as source:
+        table = pa.ipc.open_stream(source).read_all()
+        if chunk_size is None:
+            yield _to_pandas(table)
+            return
+        for batch in table.to_batches(max_chunksize=chunk_size):
+            yield _to_pandas(batch)
+
+
+def write_staged(target, chunks, transform=None):
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    temp_target = f"{target}.tmp"
+    writer = None
+    schema = None
+    staging = True
+    try:
+        for chunk in chunks:
+            df = transform(chunk) if transform is not None else chunk
+            if staging:
+                try:
+                    # Later chunks are cast to the schema of the first one
+                    table = pa.Table.from_pandas(
+                        df, schema=schema, preserve_index=False
+                    )
+                    if writer is None:
+                        schema = table.schema
+                        # The stream format lets every chunk bring its own
+                        # categories, files allow one dictionary per column
+                        writer = pa.ipc.new_stream(temp_target, schema)
+                    writer.write_table(table)
+                except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+                    logger.warning(f"Not staging {target}: {e}")
+                    staging = False
+            yield df
+
+        if writer is not None:
+            writer.close()
+            writer = None
+            if staging:
+                for stale in glob.glob(target.rsplit(".", 2)[0] + ".*.arrow"):
+                    os.remove(stale)
+                os.replace(temp_target, target)
+    finally:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(temp_target):
+            os.remove(temp_target)
+
+
+# Yields the cleaned frames of the CSV file at `path`. The first time a file
+# is seen `chunks` are parsed, cleaned with `transform` and written to an
+# Arrow IPC stream in STAGING_DIR, later calls memory-map that file instead of
+# parsing the CSV again until the file or the cleaning rules change.
+def staged_frames(path, chunks, transform=None, chunk_size=None, read_options=None):
+    target = staged_path(path, transform, read_options)
+    if os.path.exists(target):
+        logger.info(f"Reading staged {target}")
+        yield from read_staged(target, chunk_size)
+        return
+    yield from write_staged(target, chunks, transform)
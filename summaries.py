@@ -0,0 +1,47 @@
+import logging
+import time
+
+from quires import (
+    select_items_of_summarized_orders,
+    select_summary_refresh,
+    select_summary_sources,
+    summary_refresh_queries,
+    summary_refresh_upsert,
+    summary_tables,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Brings the summary tables up to date with the facts. When only new orders
+# arrived since the last refresh their rows are added to the existing totals,
+# otherwise (first run, full load, or items added to orders that were already
+# summarized) the summaries are rebuilt from scratch.
+def refresh(conn, incremental=False):
+    start = time.perf_counter()
+    cur = conn.cursor()
+    cur.execute(select_summary_refresh)
+    last_ids = dict(cur.fetchall())
+    cur.execute(select_summary_sources)
+    source_ids = dict(cur.fetchall())
+
+    if incremental and set(last_ids) == set(source_ids):
+        cur.execute(select_items_of_summarized_orders, last_ids)
+        incremental = not cur.fetchone()[0]
+    else:
+        incremental = False
+
+    if not incremental:
+        cur.execute(f"TRUNCATE {', '.join(summary_tables)}")
+        last_ids = {source: 0 for source in source_ids}
+    for query in summary_refresh_queries:
+        cur.execute(query, last_ids)
+    for source, last_id in source_ids.items():
+        cur.execute(summary_refresh_upsert, (source, last_id))
+    conn.commit()
+    cur.close()
+
+    mode = "incrementally" if incremental else "from scratch"
+    logger.info(
+        f"Refreshed summaries {mode} in {time.perf_counter() - start:.3f} seconds"
+    )
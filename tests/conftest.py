@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+
+import psycopg2
+import pytest
+
+# The modules of the pipeline live at the root of the repository
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+import db  # noqa: E402
+from quires import create_table_queries  # noqa: E402
+from settings import SYSTEM_DB  # noqa: E402
+
+# Dropped and recreated by the tests that load it, never point it at a real
+# database
+TEST_DB_NAME = os.environ.get("TEST_DB_NAME", "ecommerce_test")
+
+
+# The name of the test database, the test is skipped without a server
+@pytest.fixture
+def test_db():
+    try:
+        psycopg2.connect(db.dsn(SYSTEM_DB)).close()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL is not reachable: {e}")
+    return TEST_DB_NAME
+
+
+# Runs run.py with `etl_args` against the test database, reading `dataset_dir`
+@pytest.fixture
+def run_etl(tmp_path, test_db):
+    def run(dataset_dir, *etl_args, **env):
+        subprocess.run(
+            [sys.executable, os.path.join(REPO_DIR, "run.py"), *etl_args],
+            cwd=tmp_path,
+            env={
+                **os.environ,
+                "DATASET_DIR": str(dataset_dir),
+                "DB_NAME": test_db,
+                **env,
+            },
+            check=True,
+        )
+
+    return run
+
+
+# A connection to the test database, recreated with empty tables
+@pytest.fixture
+def warehouse(test_db):
+    conn = db.connect(db.dsn(SYSTEM_DB))
+    conn.set_session(autocommit=True)
+    cur = conn.cursor()
+    cur.execute(f"DROP DATABASE IF EXISTS {test_db}")
+    cur.execute(f"CREATE DATABASE {test_db} WITH ENCODING 'utf8' TEMPLATE template0")
+    conn.close()
+
+    conn = db.connect(db.dsn(test_db))
+    cur = conn.cursor()
+    for query in create_table_queries:
+        cur.execute(query)
+    conn.commit()
+    cur.close()
+    yield conn
+    conn.close()
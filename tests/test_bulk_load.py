@@ -0,0 +1,196 @@
+import pandas as pd
+import pytest
+
+from bulk_load import copy_frame, diff_upsert_frame, upsert_frame
+from date_dimension import build_date_dimension
+from quires import (
+    dim_customer_table_merge,
+    dim_date_table_merge,
+    dim_seller_table_merge,
+    select_customer_hashes_in,
+)
+
+# table -> (natural key, attribute columns, merge query)
+DIMENSIONS = {
+    "dim_customer": (
+        "customer_id",
+        ["customer_zip_code", "customer_city", "customer_state"],
+        dim_customer_table_merge,
+    ),
+    "dim_seller": (
+        "seller_id",
+        ["seller_zip_code", "seller_city", "seller_state"],
+        dim_seller_table_merge,
+    ),
+}
+
+
+def dimension_frame(table, rows):
+    key, attributes, _ = DIMENSIONS[table]
+    return pd.DataFrame(
+        [
+            (natural_key, zip_code, city, "SP", 0)
+            for natural_key, zip_code, city in rows
+        ],
+        columns=[key] + attributes + ["attribute_hash"],
+    )
+
+
+def select_rows(cur, table, columns):
+    cur.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY 1")
+    return cur.fetchall()
+
+
+@pytest.mark.parametrize("table", DIMENSIONS)
+def test_upsert_keeps_existing_rows_and_updates_conflicts(warehouse, table):
+    key, _, merge_query = DIMENSIONS[table]
+    city = f"{table.split('_')[1]}_city"
+    cur = warehouse.cursor()
+    copy_frame(
+        cur,
+        table,
+        dimension_frame(table, [("a", "01000", "Sao Paulo"), ("b", "02000", "Rio")]),
+    )
+    cur.execute(f"UPDATE {table} SET is_inferred = TRUE WHERE {key} = 'b'")
+    cur.execute(f"SELECT {key}, id FROM {table}")
+    ids = dict(cur.fetchall())
+
+    updated = upsert_frame(
+        cur,
+        table,
+        dimension_frame(
+            table,
+            [
+                ("b", "02001", "Niteroi"),
+                ("c", "03000", "Santos"),
+                # A key repeated in one load keeps its last row
+                ("c", "03001", "Campinas"),
+            ],
+        ),
+        key,
+        merge_query,
+    )
+
+    assert updated == 1
+    assert select_rows(cur, table, [key, city, "is_inferred"]) == [
+        ("a", "Sao Paulo", False),
+        ("b", "Niteroi", False),
+        ("c", "Campinas", False),
+    ]
+    cur.execute(f"SELECT {key}, id FROM {table} WHERE {key} IN ('a', 'b')")
+    assert dict(cur.fetchall()) == ids
+
+
+def test_upsert_keeps_the_dates_already_loaded(warehouse):
+    cur = warehouse.cursor()
+    loaded = pd.Series(pd.to_datetime(["2018-01-01 10:00", "2018-06-21 00:00"]))
+    copy_frame(cur, "dim_date", build_date_dimension(loaded))
+    # Different attributes for a date already loaded are ignored
+    dates_df = build_date_dimension(
+        pd.Series(pd.to_datetime(["2018-06-21 00:00", "2018-12-31 23:00"]))
+    )
+    dates_df["date_season"] = "Changed"
+
+    updated = upsert_frame(cur, "dim_date", dates_df, "date_key", dim_date_table_merge)
+
+    assert updated == 1
+    assert select_rows(cur, "dim_date", ["date_key", "date_season"]) == [
+        (pd.Timestamp("2018-01-01 10:00"), "Winter"),
+        (pd.Timestamp("2018-06-21 00:00"), "Summer"),
+        (pd.Timestamp("2018-12-31 23:00"), "Changed"),
+    ]
+
+
+VALUES = [
+    "tab\there",
+    "new\nline",
+    "carriage\r\nreturn",
+    "back\\slash",
+    'double "quote"',
+    "comma, separated",
+    "",
+    None,
+]
+
+
+@pytest.mark.parametrize("dtype", [object, "string[pyarrow]"])
+def test_copy_keeps_special_characters_and_nulls(warehouse, dtype):
+    cur = warehouse.cursor()
+    customers = pd.DataFrame(
+        {
+            "customer_id": [f"customer{i}" for i in range(len(VALUES))],
+            "customer_zip_code": pd.array(VALUES, dtype=dtype),
+            "customer_city": pd.array(VALUES[::-1], dtype=dtype),
+        }
+    )
+    copy_frame(cur, "dim_customer", customers)
+    assert select_rows(
+        cur, "dim_customer", ["customer_id", "customer_zip_code", "customer_city"]
+    ) == list(zip(customers["customer_id"], VALUES, VALUES[::-1]))
+
+
+def customer_versions(cur):
+    # xmin changes whenever a row is written again
+    cur.execute("SELECT customer_id, customer_city, xmin::TEXT FROM dim_customer")
+    return {row[0]: row[1:] for row in cur.fetchall()}
+
+
+def test_diff_upsert_skips_unchanged_rows_and_updates_changed_ones(warehouse):
+    cur = warehouse.cursor()
+    customers = pd.DataFrame(
+        {
+            "customer_id": ["a", "b", "c"],
+            "customer_zip_code": ["01000", "02000", "03000"],
+            "customer_city": ["Sao Paulo", "Rio", "Santos"],
+            "customer_state": ["SP", "RJ", "SP"],
+        }
+    )
+    changes = diff_upsert_frame(
+        cur,
+        "dim_customer",
+        customers,
+        "customer_id",
+        dim_customer_table_merge,
+        select_customer_hashes_in,
+    )
+    assert changes == (3, 0, 0)
+    warehouse.commit()
+    loaded = customer_versions(cur)
+
+    changes = diff_upsert_frame(
+        cur,
+        "dim_customer",
+        customers,
+        "customer_id",
+        dim_customer_table_merge,
+        select_customer_hashes_in,
+    )
+    assert changes == (0, 0, 3)
+    warehouse.commit()
+    assert customer_versions(cur) == loaded
+
+    # A row loaded without a hash, like an inferred member, counts as changed
+    cur.execute("UPDATE dim_customer SET attribute_hash = NULL WHERE customer_id = 'c'")
+    warehouse.commit()
+    loaded = customer_versions(cur)
+    customers.loc[1, "customer_city"] = "Niteroi"
+    customers.loc[3] = ["d", "04000", "Curitiba", "PR"]
+    changes = diff_upsert_frame(
+        cur,
+        "dim_customer",
+        customers,
+        "customer_id",
+        dim_customer_table_merge,
+        select_customer_hashes_in,
+    )
+    assert changes == (1, 2, 1)
+    warehouse.commit()
+
+    versions = customer_versions(cur)
+    assert versions["a"] == loaded["a"]
+    assert versions["b"][0] == "Niteroi"
+    assert versions["b"][1] != loaded["b"][1]
+    assert versions["c"][1] != loaded["c"][1]
+    assert versions["d"][0] == "Curitiba"
+    cur.execute("SELECT count(*) FROM dim_customer WHERE attribute_hash IS NULL")
+    assert cur.fetchone()[0] == 0
@@ -0,0 +1,28 @@
+import warnings
+
+import pandas as pd
+
+import checkpoint
+import validation
+
+
+def test_skipped_frames_can_be_flagged():
+    df = pd.DataFrame({"order_id": ["order0", None, "order2", None]})
+    rest, rows_to_skip = checkpoint.skip_rows(df, 1)
+    assert rows_to_skip == 0
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        validation.require(rest, ["order_id"])
+    assert rest[validation.REASON].tolist() == [
+        "missing_order_id",
+        pd.NA,
+        "missing_order_id",
+    ]
+    assert validation.REASON not in df.columns
+
+
+def test_skip_rows_past_the_frame():
+    df = pd.DataFrame({"order_id": ["order0", "order1"]})
+    rest, rows_to_skip = checkpoint.skip_rows(df, 5)
+    assert rest.empty
+    assert rows_to_skip == 3
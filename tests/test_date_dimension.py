@@ -0,0 +1,83 @@
+import pandas as pd
+
+from date_dimension import DIM_DATE_COLUMNS, build_date_dimension
+from etl import MISSING_DATE
+
+
+# The per-row date attributes the ETL computed before dim_date was built
+# column-wise, kept as the reference the vectorized build has to match
+def extract_info_from_date(date):
+    year = date.year
+    quarter = (date.month - 1) // 3 + 1
+    season = ""
+    month = date.month
+    month_name = date.month_name()
+    day = date.day
+    day_name = date.day_name()
+    hour = date.hour
+    am_or_pm = "AM" if hour < 12 else "PM"
+    if (month == 12 and day >= 21) or (month <= 3 and day < 21):
+        season = "Winter"
+    elif (month == 3 and day >= 21) or (month <= 6 and day < 21):
+        season = "Spring"
+    elif (month == 6 and day >= 21) or (month <= 9 and day < 21):
+        season = "Summer"
+    elif (month == 9 and day >= 21) or (month < 12 or (month == 12 and day < 21)):
+        season = "Fall"
+    return (
+        date,
+        year,
+        quarter,
+        season,
+        month,
+        month_name,
+        day,
+        day_name,
+        hour,
+        am_or_pm,
+    )
+
+
+def boundary_dates():
+    dates = [MISSING_DATE, pd.Timestamp("1900-12-21"), pd.Timestamp("1900-01-01")]
+    for year in [2016, 2017, 2018, 2020]:
+        for month in range(1, 13):
+            first = pd.Timestamp(year=year, month=month, day=1)
+            dates += [first, first + pd.offsets.MonthEnd(0)]
+            # Seasons change on the 21st
+            dates += [first.replace(day=20), first.replace(day=21)]
+    # Leap days, and the day after them
+    dates += [pd.Timestamp("2016-02-29"), pd.Timestamp("2020-02-29")]
+    dates += [pd.Timestamp("2016-03-01"), pd.Timestamp("2020-03-01")]
+    # Both sides of noon and of midnight
+    hours = [
+        pd.Timedelta(hours=h, minutes=m)
+        for h, m in [(0, 0), (11, 59), (12, 0), (23, 59)]
+    ]
+    return pd.Series([date + hour for date in dates for hour in hours])
+
+
+def test_matches_per_row_extraction():
+    dates = boundary_dates()
+    built = build_date_dimension(dates).sort_values("date_key")
+    expected = pd.DataFrame(
+        [extract_info_from_date(date) for date in dates.drop_duplicates()],
+        columns=DIM_DATE_COLUMNS,
+    ).sort_values("date_key")
+    pd.testing.assert_frame_equal(
+        built.reset_index(drop=True),
+        expected.reset_index(drop=True),
+        check_dtype=False,
+    )
+
+
+def test_fill_date_is_winter():
+    row = build_date_dimension(pd.Series([MISSING_DATE])).iloc[0]
+    assert (row["date_year"], row["date_month"], row["date_day"]) == (1900, 12, 31)
+    assert row["date_season"] == "Winter"
+    assert row["date_am_or_pm"] == "AM"
+
+
+def test_repeated_and_missing_dates_are_dropped():
+    dates = pd.Series([MISSING_DATE, MISSING_DATE, pd.NaT])
+    assert len(build_date_dimension(dates, dates)) == 1
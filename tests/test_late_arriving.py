@@ -0,0 +1,83 @@
+import os
+
+import pandas as pd
+
+import db
+from generate_dataset import generate
+from quires import summary_tables
+
+# Natural keys and values of every loaded row, whatever their surrogate keys
+SNAPSHOT_QUERIES = {
+    "dim_customer": "SELECT customer_id, customer_city FROM dim_customer",
+    "dim_product": "SELECT product_id, product_category_name FROM dim_product",
+    "dim_seller": "SELECT seller_id, seller_city FROM dim_seller",
+    "dim_order": """
+        SELECT o.order_id, c.customer_id, o.order_status, o.is_inferred
+        FROM dim_order o LEFT JOIN dim_customer c ON c.id = o.customer_id
+    """,
+    "fact_order_item": """
+        SELECT o.order_id, i.order_item_id, p.product_id, s.seller_id, i.price
+        FROM fact_order_item i
+        JOIN dim_order o ON o.id = i.order_id
+        JOIN dim_product p ON p.id = i.product_id
+        JOIN dim_seller s ON s.id = i.seller_id
+    """,
+    "fact_payment": """
+        SELECT o.order_id, f.payment_sequential, f.payment_value
+        FROM fact_payment f JOIN dim_order o ON o.id = f.order_id
+    """,
+    "fact_feedback": """
+        SELECT f.feedback_id, o.order_id, f.feedback_score
+        FROM fact_feedback f JOIN dim_order o ON o.id = f.order_id
+    """,
+    **{table: f"SELECT * FROM {table}" for table in summary_tables},
+}
+
+
+def snapshot(test_db):
+    conn = db.connect(db.dsn(test_db))
+    cur = conn.cursor()
+    rows = {}
+    for table, query in SNAPSHOT_QUERIES.items():
+        cur.execute(query)
+        rows[table] = sorted(cur.fetchall(), key=repr)
+    cur.execute("SELECT count(*) FROM etl_retry")
+    held = cur.fetchone()[0]
+    conn.close()
+    return rows, held
+
+
+# Writes the rows of every source file of `source_dir` from `start` to `stop`,
+# as a fraction of the file, to the same file of `dataset_dir`
+def write_delta(source_dir, dataset_dir, start, stop):
+    os.makedirs(dataset_dir, exist_ok=True)
+    for name in os.listdir(source_dir):
+        df = pd.read_csv(os.path.join(source_dir, name), dtype=str)
+        path = os.path.join(dataset_dir, name)
+        df.iloc[int(len(df) * start) : int(len(df) * stop)].to_csv(
+            path, mode="a", header=not os.path.exists(path), index=False
+        )
+
+
+# Facts and orders of the first deltas reference customers, products and
+# sellers of the last one, they are held and loaded once those arrive
+def test_incremental_loads_rows_of_late_arriving_dimensions(tmp_path, run_etl, test_db):
+    source_dir = str(tmp_path / "source")
+    dataset_dir = str(tmp_path / "ecommerce_dataset")
+    generate(source_dir, 0.01, seed=0)
+    run_etl(source_dir, "--no-staging-cache")
+    rebuilt, _ = snapshot(test_db)
+
+    write_delta(source_dir, dataset_dir, 0, 1 / 3)
+    run_etl(dataset_dir, "--no-staging-cache")
+    _, held = snapshot(test_db)
+    assert held
+    write_delta(source_dir, dataset_dir, 1 / 3, 2 / 3)
+    run_etl(dataset_dir, "--no-staging-cache", "--incremental")
+    write_delta(source_dir, dataset_dir, 2 / 3, 1)
+    run_etl(dataset_dir, "--no-staging-cache", "--incremental")
+
+    loaded, held = snapshot(test_db)
+    assert held == 0
+    for table, rows in rebuilt.items():
+        assert loaded[table] == rows, table
@@ -0,0 +1,111 @@
+import threading
+import time
+
+import pytest
+
+from metrics import StageMetrics
+from pipeline import POLL_SECONDS, pipelined
+
+QUEUE_SIZE = 2
+
+
+class Source:
+    def __init__(self, chunks=None, fail_at=None):
+        self.chunks = chunks
+        self.fail_at = fail_at
+        self.read = 0
+        self.closed = False
+
+    def frames(self):
+        try:
+            while self.chunks is None or self.read < self.chunks:
+                if self.read == self.fail_at:
+                    raise ValueError("unreadable chunk")
+                self.read += 1
+                yield self.read
+        finally:
+            self.closed = True
+
+
+def double(chunk):
+    return chunk * 2
+
+
+def fail_on_third(chunk):
+    if chunk == 3:
+        raise KeyError("bad row")
+    return chunk
+
+
+def run(source, transform=double):
+    return pipelined(source.frames(), transform, StageMetrics("test"), QUEUE_SIZE)
+
+
+def settle():
+    time.sleep(10 * POLL_SECONDS)
+
+
+@pytest.fixture(autouse=True)
+def no_threads_left():
+    before = set(threading.enumerate())
+    yield
+    assert set(threading.enumerate()) <= before
+
+
+def test_yields_every_transformed_chunk_in_order():
+    assert list(run(Source(chunks=10))) == [chunk * 2 for chunk in range(1, 11)]
+
+
+@pytest.mark.parametrize(
+    "transform, held",
+    [
+        # The parsed queue and the chunk the reader waits to put
+        (None, QUEUE_SIZE + 1),
+        # Both queues, the chunk the transform thread waits to put and the
+        # chunk the reader waits to put
+        (double, 2 * QUEUE_SIZE + 2),
+    ],
+)
+def test_a_slow_caller_stalls_the_reader(transform, held):
+    source = Source()
+    frames = run(source, transform)
+    next(frames)
+    settle()
+    read = source.read
+    assert read == 1 + held
+    settle()
+    assert source.read == read
+    frames.close()
+    assert source.closed
+
+
+@pytest.mark.parametrize("transform", [None, double])
+def test_a_reader_error_is_raised_in_the_caller(transform):
+    source = Source(fail_at=2)
+    frames = run(source, transform)
+    assert len([next(frames), next(frames)]) == 2
+    with pytest.raises(ValueError, match="unreadable chunk"):
+        next(frames)
+    assert source.closed
+
+
+def test_a_transform_error_is_raised_in_the_caller():
+    source = Source()
+    frames = run(source, fail_on_third)
+    assert [next(frames), next(frames)] == [1, 2]
+    with pytest.raises(KeyError, match="bad row"):
+        next(frames)
+    # The reader was waiting on the full parsed queue, it stops and closes the
+    # source instead of reading on
+    assert source.closed
+    read = source.read
+    settle()
+    assert source.read == read
+
+
+def test_a_caller_error_stops_the_threads():
+    source = Source()
+    with pytest.raises(RuntimeError):
+        for _ in run(source):
+            raise RuntimeError("write failed")
+    assert source.closed
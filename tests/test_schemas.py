@@ -0,0 +1,53 @@
+import os
+
+import pandas as pd
+import pytest
+
+import schemas
+from benchmarks.bench_ingest_memory import source_memory
+from generate_dataset import generate
+
+# Kept as float64, they are stored as exact decimals
+PRICES = ["price", "shipping_cost", "payment_value"]
+
+
+@pytest.fixture(scope="module")
+def dataset_dir(tmp_path_factory):
+    dataset_dir = str(tmp_path_factory.mktemp("ecommerce_dataset"))
+    generate(dataset_dir, 0.02, seed=0)
+    return dataset_dir
+
+
+@pytest.mark.parametrize("source", schemas.SOURCE_SCHEMAS)
+def test_typed_frames_hold_less_memory_than_untyped_ones(dataset_dir, source):
+    report = source_memory(dataset_dir, source)
+    # Identifiers such as zip codes are strings where pandas infers integers,
+    # the frame as a whole is what has to shrink
+    assert report.loc["total", "typed_mb"] < report.loc["total", "untyped_mb"], report
+
+
+@pytest.mark.parametrize("source", schemas.SOURCE_SCHEMAS)
+def test_numbers_are_downcast(dataset_dir, source):
+    report = source_memory(dataset_dir, source)
+    untyped = pd.read_csv(os.path.join(dataset_dir, f"{source}_dataset.csv"))
+    numbers = [
+        column
+        for column, dtype in schemas.SOURCE_SCHEMAS[source].items()
+        if dtype != schemas.ID
+        and column not in PRICES
+        and pd.api.types.is_numeric_dtype(untyped[column])
+    ]
+    assert (report.loc[numbers, "typed_mb"] < report.loc[numbers, "untyped_mb"]).all()
+
+
+@pytest.mark.parametrize("source", schemas.SOURCE_SCHEMAS)
+def test_typed_frames_keep_the_values(dataset_dir, source):
+    path = os.path.join(dataset_dir, f"{source}_dataset.csv")
+    untyped = pd.read_csv(path)
+    typed = pd.read_csv(path, **schemas.read_options(source))
+    for column, dtype in schemas.SOURCE_SCHEMAS[source].items():
+        if dtype == schemas.DATE:
+            expected = pd.to_datetime(untyped[column])
+        else:
+            expected = untyped[column].astype(typed[column].dtype)
+        pd.testing.assert_series_equal(typed[column], expected, check_names=False)
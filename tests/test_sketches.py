@@ -0,0 +1,29 @@
+import numpy as np
+
+from sketches import BloomFilter
+
+CAPACITY = 100_000
+
+
+def random_hashes(seed, size):
+    return np.random.default_rng(seed).integers(0, 2**63, size=size, dtype=np.uint64)
+
+
+def test_bloom_filter_sees_every_added_hash():
+    bloom = BloomFilter(CAPACITY)
+    hashes = random_hashes(0, CAPACITY)
+    for chunk in np.array_split(hashes, 10):
+        bloom.add_hashes(chunk)
+    assert bloom.add_hashes(hashes).all()
+
+
+def test_bloom_filter_false_positive_rate():
+    bloom = BloomFilter(CAPACITY)
+    assert not bloom.add_hashes(random_hashes(0, CAPACITY)).any()
+    false_positives = bloom.add_hashes(random_hashes(1, CAPACITY)).mean()
+    assert false_positives < 2 * bloom.error_rate
+
+
+def test_bloom_filter_packs_its_bits():
+    bloom = BloomFilter(CAPACITY)
+    assert bloom.words.nbytes * 8 - bloom.size < 64
@@ -0,0 +1,20 @@
+import etl
+import schemas
+import staging
+import validation
+
+
+def test_rules_fingerprint_covers_the_modules_the_rules_use():
+    modules = staging.rule_modules(etl.transform_order)
+    assert etl in modules
+    assert validation in modules
+    assert schemas in modules
+
+
+def test_rules_fingerprint_is_stable():
+    assert staging.rules_fingerprint(etl.transform_order, {}) == (
+        staging.rules_fingerprint(etl.transform_order, {})
+    )
+    assert staging.rules_fingerprint(etl.transform_order, {}) != (
+        staging.rules_fingerprint(etl.transform_payment, {})
+    )
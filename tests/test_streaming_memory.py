@@ -0,0 +1,23 @@
+import os
+
+from benchmarks.bench_streaming_memory import peak_rss_mb, write_order_items
+
+ROWS = 100_000
+CHUNK_SIZE = 50_000
+# Streaming in chunks keeps the peak RSS of a 10x larger file within this
+# fraction of the 1x run, reading the file in one piece grows several times.
+TOLERANCE = 0.3
+
+
+def test_chunked_peak_rss_does_not_grow_with_the_file(tmp_path):
+    path = os.path.join(tmp_path, "order_item_dataset.csv")
+    peaks = []
+    for scale in (1, 10):
+        if os.path.exists(path):
+            os.remove(path)
+        write_order_items(path, ROWS * scale)
+        peaks.append(peak_rss_mb(str(tmp_path), CHUNK_SIZE))
+    small, large = peaks
+    assert large <= small * (
+        1 + TOLERANCE
+    ), f"chunked peak RSS grew from {small:.0f} MB at 1x to {large:.0f} MB at 10x"
@@ -0,0 +1,52 @@
+import os
+
+import pandas as pd
+import pytest
+
+import db
+import summaries
+from generate_dataset import generate
+from quires import summary_tables
+
+
+def read_summaries(conn):
+    cur = conn.cursor()
+    rows = {}
+    for table in summary_tables:
+        cur.execute(f"SELECT * FROM {table}")
+        rows[table] = sorted(cur.fetchall())
+    cur.close()
+    return rows
+
+
+# Appends the first row of `source` again with `column` set to `value`, the
+# incremental load merges it over the row already loaded
+def append_changed_row(dataset_dir, source, column, value):
+    path = os.path.join(dataset_dir, f"{source}_dataset.csv")
+    row = pd.read_csv(path, nrows=1)
+    assert row.loc[0, column] != value
+    row[column] = value
+    row.to_csv(path, mode="a", header=False, index=False)
+
+
+@pytest.mark.parametrize(
+    "source, column, value",
+    [("payment", "payment_type", "voucher"), ("order", "order_status", "canceled")],
+)
+def test_incremental_refresh_sees_rows_updated_in_place(
+    tmp_path, run_etl, test_db, source, column, value
+):
+    dataset_dir = str(tmp_path / "ecommerce_dataset")
+    generate(dataset_dir, 0.01, seed=0)
+    run_etl(dataset_dir, "--no-staging-cache")
+    append_changed_row(dataset_dir, source, column, value)
+    run_etl(dataset_dir, "--no-staging-cache", "--incremental")
+
+    conn = db.connect(db.dsn(test_db))
+    try:
+        refreshed = read_summaries(conn)
+        summaries.refresh(conn, incremental=False)
+        rebuilt = read_summaries(conn)
+    finally:
+        conn.close()
+    assert refreshed == rebuilt
@@ -0,0 +1,164 @@
+import io
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import etl
+import validation
+from quires import etl_retry_insert
+
+STARTED_AT = datetime(2024, 5, 1, 12, 30, 15)
+PICKUP = "2018-01-02 10:00:00"
+
+ORDER_ITEM_COLUMNS = [
+    "order_id",
+    "order_item_id",
+    "product_id",
+    "seller_id",
+    "price",
+    "shipping_cost",
+    "pickup_limit_date",
+]
+
+
+# Records the held rows, the only query resolve_keys runs once every key map
+# is loaded
+class RetryCursor:
+    def __init__(self):
+        self.held = []
+
+    def execute(self, query, params):
+        assert query == etl_retry_insert
+        self.held.append(params)
+
+
+@pytest.fixture
+def quarantine_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(validation, "QUARANTINE_DIR", str(tmp_path))
+    return tmp_path
+
+
+def order_items(rows):
+    return pd.DataFrame(rows, columns=ORDER_ITEM_COLUMNS)
+
+
+def test_require_flags_missing_values():
+    df = pd.DataFrame(
+        {"order_id": ["order0", None, None], "user_name": ["u", "u", None]}
+    )
+    validation.require(df, ["order_id", "user_name"])
+    # The first reason found is the one kept
+    assert df[validation.REASON].tolist() == [
+        pd.NA,
+        "missing_order_id",
+        "missing_order_id",
+    ]
+
+
+def test_coerce_dates_flags_values_that_are_not_dates():
+    df = pd.DataFrame({"pickup_limit_date": [PICKUP, "nope", None]})
+    validation.coerce_dates(df, ["pickup_limit_date"])
+    assert df[validation.REASON].tolist() == [pd.NA, "invalid_pickup_limit_date", pd.NA]
+    assert df["pickup_limit_date"].tolist()[:2] == [pd.Timestamp(PICKUP), pd.NaT]
+
+
+def test_split_drops_the_reason_of_the_rows_to_load():
+    df = pd.DataFrame({"order_id": ["order0", None]})
+    validation.require(df, ["order_id"])
+    loaded, rejected = validation.split(df)
+    assert loaded.columns.tolist() == ["order_id"]
+    assert loaded["order_id"].tolist() == ["order0"]
+    assert rejected[validation.REASON].tolist() == ["missing_order_id"]
+
+
+def test_every_reason_code_is_quarantined(quarantine_dir):
+    run = etl.EtlRun()
+    run.started_at = STARTED_AT
+    run.key_cache.update("order", {"order0": 1})
+    run.key_cache.update("order_month", {"order0": 201801})
+    run.key_cache.update("product", {"prod0": 1})
+    run.key_cache.update("seller", {"seller0": 1})
+    run.key_cache.update("date", {pd.Timestamp(PICKUP): 1})
+    df = order_items(
+        [
+            ["order0", "1", "prod0", "seller0", 10.5, 1.5, PICKUP],
+            [None, "1", "prod0", "seller0", 10.5, 1.5, PICKUP],
+            ["order0", None, "prod0", "seller0", 10.5, 1.5, PICKUP],
+            ["order0", "2", None, "seller0", 10.5, 1.5, PICKUP],
+            ["order0", "3", "prod0", None, 10.5, 1.5, PICKUP],
+            ["order0", "4", "prod0", "seller0", 10.5, 1.5, None],
+            ["order0", "5", "prod0", "seller0", 10.5, 1.5, "nope"],
+            ["order9", "1", "prod0", "seller0", 10.5, 1.5, PICKUP],
+            ["order0", "6", "prod9", "seller0", 10.5, 1.5, PICKUP],
+            ["order0", "7", "prod0", "seller9", 10.5, 1.5, PICKUP],
+            # Missing and invalid at once, the first check wins
+            ["order0", "8", "prod0", None, 10.5, 1.5, "nope"],
+        ]
+    )
+    cur = RetryCursor()
+
+    loaded = etl.resolve_keys(
+        cur,
+        run,
+        "fact_order_item",
+        etl.transform_order_item(df),
+        {
+            "order_month": ("order_month", "order_id"),
+            "order_id": ("order", "order_id"),
+            "product_id": ("product", "product_id"),
+            "seller_id": ("seller", "seller_id"),
+            "pickup_limit_date": ("date", "pickup_limit_date"),
+        },
+    )
+
+    assert loaded["order_item_id"].tolist() == ["1"]
+    assert run.rejected == {"fact_order_item": 10}
+    quarantined = pd.read_csv(validation.quarantine_path("fact_order_item"), dtype=str)
+    assert (
+        quarantined.columns.tolist()
+        == [
+            "rejected_at",
+            validation.REASON,
+        ]
+        + ORDER_ITEM_COLUMNS
+    )
+    assert (quarantined["rejected_at"] == "2024-05-01T12:30:15").all()
+    assert quarantined[validation.REASON].tolist() == [
+        "missing_order_id",
+        "missing_order_item_id",
+        "missing_product_id",
+        "missing_seller_id",
+        "missing_pickup_limit_date",
+        "invalid_pickup_limit_date",
+        "unknown_order_id",
+        "unknown_product_id",
+        "unknown_seller_id",
+        "missing_seller_id",
+    ]
+    # Only the rows whose keys may still arrive are held for the next run
+    [(table, held)] = cur.held
+    assert table == "fact_order_item"
+    assert pd.read_csv(io.StringIO(held))["order_id"].tolist() == [
+        "order9",
+        "order0",
+        "order0",
+    ]
+
+
+def test_quarantine_appends_under_one_header(quarantine_dir):
+    df = pd.DataFrame({"order_id": [None, "order1"], "payment_value": [1.5, np.nan]})
+    validation.require(df, ["order_id", "payment_value"])
+    _, rejected = validation.split(df)
+    assert validation.quarantine("fact_payment", rejected, STARTED_AT) == 2
+    assert validation.quarantine("fact_payment", rejected.iloc[:0], STARTED_AT) == 0
+    assert validation.quarantine("fact_payment", rejected.iloc[:1], STARTED_AT) == 1
+
+    with open(validation.quarantine_path("fact_payment")) as f:
+        assert f.read().splitlines() == [
+            "rejected_at,reject_reason,order_id,payment_value",
+            "2024-05-01T12:30:15,missing_order_id,,1.5",
+            "2024-05-01T12:30:15,missing_payment_value,order1,",
+            "2024-05-01T12:30:15,missing_order_id,,1.5",
+        ]
@@ -0,0 +1,79 @@
+import watermark
+from quires import etl_watermark_upsert, select_watermark
+
+HEADER = "order_id,payment_value\n"
+
+
+# Keeps the watermarks in a dict, in place of the etl_watermark table
+class WatermarkCursor:
+    def __init__(self):
+        self.watermarks = {}
+        self.row = None
+
+    def execute(self, query, params):
+        if query == select_watermark:
+            self.row = self.watermarks.get(params[0])
+        else:
+            assert query == etl_watermark_upsert
+            source, offset, checksum = params
+            self.watermarks[source] = (offset, checksum)
+
+    def fetchone(self):
+        return self.row
+
+
+def write(path, text, mode="w"):
+    with open(path, mode) as f:
+        f.write(text)
+    return path.stat().st_size
+
+
+def test_a_file_never_loaded_is_read_whole(tmp_path):
+    path = tmp_path / "payment_dataset.csv"
+    end = write(path, HEADER + "order0,1.5\n")
+    assert watermark.pending_range(WatermarkCursor(), "payment", path) == (0, end)
+
+
+def test_an_unchanged_file_has_nothing_to_read(tmp_path):
+    path = tmp_path / "payment_dataset.csv"
+    end = write(path, HEADER + "order0,1.5\norder1,2.5\n")
+    cur = WatermarkCursor()
+    watermark.save(cur, "payment", path, end)
+    assert watermark.pending_range(cur, "payment", path) == (end, end)
+
+
+def test_an_appended_file_is_read_from_the_watermark(tmp_path):
+    path = tmp_path / "payment_dataset.csv"
+    offset = write(path, HEADER + "order0,1.5\n")
+    cur = WatermarkCursor()
+    watermark.save(cur, "payment", path, offset)
+    end = write(path, "order1,2.5\n", mode="a")
+    assert watermark.pending_range(cur, "payment", path) == (offset, end)
+
+
+def test_a_rewritten_file_is_read_again(tmp_path):
+    path = tmp_path / "payment_dataset.csv"
+    offset = write(path, HEADER + "order0,1.5\n")
+    cur = WatermarkCursor()
+    watermark.save(cur, "payment", path, offset)
+    # Same size before the watermark, but the bytes changed
+    end = write(path, HEADER + "order9,1.5\norder1,2.5\n")
+    assert watermark.pending_range(cur, "payment", path) == (0, end)
+
+
+def test_a_rewritten_header_is_read_again(tmp_path):
+    path = tmp_path / "payment_dataset.csv"
+    offset = write(path, HEADER + "order0,1.5\n")
+    cur = WatermarkCursor()
+    watermark.save(cur, "payment", path, offset)
+    end = write(path, "order_id,payment_total\norder0,1.5\norder1,2.5\n")
+    assert watermark.pending_range(cur, "payment", path) == (0, end)
+
+
+def test_a_shrunk_file_is_read_again(tmp_path):
+    path = tmp_path / "payment_dataset.csv"
+    offset = write(path, HEADER + "order0,1.5\norder1,2.5\n")
+    cur = WatermarkCursor()
+    watermark.save(cur, "payment", path, offset)
+    end = write(path, HEADER + "order0,1.5\n")
+    assert watermark.pending_range(cur, "payment", path) == (0, end)
@@ -0,0 +1,72 @@
+import os
+
+import pandas as pd
+
+from settings import QUARANTINE_DIR
+
+# Rows that cannot be loaded are flagged with a reason code in this column
+# while their frame is cleaned, and written to a quarantine file of their
+# table instead of being loaded
+REASON = "reject_reason"
+
+
+def rejected(df):
+    if REASON not in df.columns:
+        return pd.Series(False, index=df.index)
+    return df[REASON].notna()
+
+
+# Flags the rows of `mask` that were not flagged yet, the first reason found
+# for a row is the one kept
+def flag(df, mask, reason):
+    if REASON not in df.columns:
+        # A string column even when no row is flagged, so every chunk has the
+        # same Arrow type in the staging cache
+        df[REASON] = pd.Series(pd.NA, index=df.index, dtype="string")
+    df[REASON] = df[REASON].mask(df[REASON].isna() & mask, reason)
+
+
+def require(df, columns):
+    for column in columns:
+        flag(df, df[column].isna(), f"missing_{column}")
+
+
+# Parses `columns` as dates, values that are present but not dates are
+# flagged instead of silently becoming NaT
+def coerce_dates(df, columns):
+    for column in columns:
+        dates = pd.to_datetime(df[column], errors="coerce")
+        flag(df, dates.isna() & df[column].notna(), f"invalid_{column}")
+        df[column] = dates
+
+
+# Returns the rows to load, without the reason column, and the flagged rows
+def split(df):
+    mask = rejected(df)
+    return df[~mask].drop(columns=REASON, errors="ignore"), df[mask]
+
+
+def quarantine_path(table):
+    return os.path.join(QUARANTINE_DIR, f"{table}.csv")
+
+
+# Appends the flagged rows to the quarantine file of `table`, with their
+# reason and the start of the run that rejected them
+def quarantine(table, rejected_df, rejected_at):
+    if rejected_df.empty:
+        return 0
+    os.makedirs(QUARANTINE_DIR, exist_ok=True)
+    path = quarantine_path(table)
+    rejected_df = pd.concat(
+        [
+            pd.DataFrame(
+                {"rejected_at": rejected_at.isoformat(timespec="seconds")},
+                index=rejected_df.index,
+            ),
+            rejected_df[[REASON]],
+            rejected_df.drop(columns=REASON),
+        ],
+        axis=1,
+    )
+    rejected_df.to_csv(path, mode="a", header=not os.path.exists(path), index=False)
+    return len(rejected_df)
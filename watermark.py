@@ -0,0 +1,40 @@
+import hashlib
+import logging
+import os
+
+from quires import etl_watermark_upsert, select_watermark
+
+logger = logging.getLogger(__name__)
+
+# Bytes before the watermark that are hashed to detect a rewritten file
+CHECKSUM_WINDOW = 64 * 1024
+
+
+def file_checksum(path, offset):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        digest.update(f.readline())
+        f.seek(max(0, offset - CHECKSUM_WINDOW))
+        digest.update(f.read(offset - f.tell()))
+    return digest.hexdigest()
+
+
+# Returns the byte offset to read `path` from and the offset the read ends at.
+# Files are treated as append-only, a file that shrank or whose bytes before
+# the watermark changed is read again from the start.
+def pending_range(cur, source, path):
+    end = os.path.getsize(path)
+    cur.execute(select_watermark, (source,))
+    row = cur.fetchone()
+    if row is None:
+        return 0, end
+
+    offset, checksum = row
+    if offset > end or file_checksum(path, offset) != checksum:
+        logger.warning(f"{path} changed since the last load, reading it again")
+        return 0, end
+    return offset, end
+
+
+def save(cur, source, path, offset):
+    cur.execute(etl_watermark_upsert, (source, offset, file_checksum(path, offset)))